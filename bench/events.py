@@ -0,0 +1,254 @@
+"""
+Alat untuk event log terstruktur server (EVENT_LOG_ENABLED di server/config.py)
+
+Contoh:
+    python bench/events.py dump logs/events --limit 50
+    python bench/events.py stats logs/events --top 10
+    python bench/events.py replay logs/events --speed 10 --host 127.0.0.1
+    python bench/events.py replay logs/events/events-20260101-120000-42.evl --since "2026-01-01 12:30:00" --speed 0
+
+Subcommand:
+    dump    tampilkan event satu per baris
+    stats   pesan per room per menit + top talkers (streaming, file tidak dimuat utuh)
+    replay  jalankan ulang traffic ke server live dengan jeda antar event yang sama
+            (--speed 1 = real time, 10 = 10x lebih cepat, 0 = secepat mungkin)
+"""
+import argparse
+import collections
+import json
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+
+import event_log  # noqa: E402
+from event_log import EVENT_CONNECT, EVENT_COMMAND, EVENT_DISCONNECT, EVENT_NAMES, CHAT_COMMAND  # noqa: E402
+
+MESSAGE_COMMANDS = (CHAT_COMMAND, "[SEND]", "[FILE]")
+
+
+def parse_time(value):
+    """Timestamp unix atau "YYYY-mm-dd HH:MM:SS" (waktu lokal)"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(time.strptime(value, "%Y-%m-%d %H:%M:%S"))
+
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) + f".{int(timestamp % 1 * 1000):03d}"
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+# ---- dump ----
+
+def dump(args):
+    for i, event in enumerate(event_log.read_events(args.log, parse_time(args.since), parse_time(args.until))):
+        if args.limit and i >= args.limit:
+            break
+        if event.blob_ref is not None:
+            payload = f"<blob {event.blob_ref[1]} byte>"
+        else:
+            payload = event.inline if len(event.inline) <= 120 else event.inline[:120] + "..."
+        print(f"{format_time(event.timestamp)} s{event.session} {EVENT_NAMES.get(event.kind, event.kind):10s} "
+              f"#{event.room} {event.command} {payload}")
+
+
+# ---- stats ----
+
+def stats(args):
+    per_minute = collections.Counter()  # (menit, room) -> jumlah pesan
+    talkers = collections.Counter()     # username -> jumlah pesan
+    commands = collections.Counter()
+    usernames = {}                      # session id -> username
+    events = 0
+    first = last = None
+    for event in event_log.read_events(args.log, parse_time(args.since), parse_time(args.until)):
+        events += 1
+        if first is None:
+            first = event.timestamp
+        last = event.timestamp
+        if event.kind == EVENT_CONNECT:
+            try:
+                usernames[event.session] = json.loads(event.payload()).get("username", "?")
+            except ValueError:
+                pass
+        elif event.kind == EVENT_DISCONNECT:
+            usernames.pop(event.session, None)
+        elif event.kind == EVENT_COMMAND:
+            commands[event.command] += 1
+            if event.command in MESSAGE_COMMANDS:
+                minute = time.strftime("%Y-%m-%d %H:%M", time.localtime(event.timestamp))
+                per_minute[(minute, event.room)] += 1
+                talkers[usernames.get(event.session, f"session-{event.session}")] += 1
+
+    if not events:
+        print("Tidak ada event")
+        return
+    print(f"{events} event, {format_time(first)} - {format_time(last)} ({last - first:.1f}s)")
+    print("\nPesan per room per menit:")
+    for (minute, room), count in sorted(per_minute.items()):
+        print(f"  {minute}  #{room:20s} {count}")
+    print(f"\nTop {args.top} talkers:")
+    for username, count in talkers.most_common(args.top):
+        print(f"  {username:20s} {count}")
+    print("\nCommand:")
+    for command, count in commands.most_common():
+        print(f"  {command:20s} {count}")
+
+
+# ---- replay ----
+
+class ReplayReader(threading.Thread):
+    """Baca (dan buang) output server untuk semua koneksi replay, balas [PING] dengan [PONG]"""
+    def __init__(self):
+        super().__init__(name="replay-reader", daemon=True)
+        self.selector = selectors.DefaultSelector()
+        self.bytes_received = 0
+
+    def add(self, sock):
+        self.selector.register(sock, selectors.EVENT_READ)
+
+    def remove(self, sock):
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def run(self):
+        while True:
+            if not self.selector.get_map():
+                time.sleep(0.05)
+                continue
+            for key, _ in self.selector.select(timeout=0.1):
+                sock = key.fileobj
+                try:
+                    data = sock.recv(65536)
+                except OSError:
+                    data = b""
+                if not data:
+                    self.remove(sock)
+                    sock.close()
+                    continue
+                self.bytes_received += len(data)
+                if b"[PING]\n" in data:
+                    try:
+                        sock.sendall(b"[PONG]\n")
+                    except OSError:
+                        pass
+
+
+def replay(args):
+    reader = ReplayReader()
+    reader.start()
+    connections = {}  # session id rekaman -> socket replay
+    lags = []
+    sent = skipped = failed = 0
+    started = time.monotonic()
+    first = last = None
+
+    for event in event_log.read_events(args.log, parse_time(args.since), parse_time(args.until)):
+        if first is None:
+            first = event.timestamp
+        last = event.timestamp
+        if args.speed > 0:
+            # Jeda antar event mengikuti rekaman (dipercepat sesuai --speed)
+            due = started + (event.timestamp - first) / args.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lags.append(-delay)
+
+        if event.kind == EVENT_CONNECT:
+            try:
+                username = args.user_prefix + json.loads(event.payload()).get("username", "")
+                sock = socket.create_connection((args.host, args.port))
+                # Tanpa kompresi agar output server cukup dibaca sebagai baris
+                hello = {"username": username, "compression": [], "room": event.room}
+                sock.sendall(f"[HELLO]{json.dumps(hello)}\n".encode())
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Connect sesi {event.session} gagal: {e}")
+                failed += 1
+                continue
+            connections[event.session] = sock
+            reader.add(sock)
+        elif event.kind == EVENT_COMMAND:
+            sock = connections.get(event.session)
+            if sock is None:
+                skipped += 1  # Sesi terhubung sebelum rentang rekaman
+                continue
+            try:
+                sock.sendall((event.message + "\n").encode())
+                sent += 1
+            except OSError:
+                failed += 1
+                connections.pop(event.session, None)
+        elif event.kind == EVENT_DISCONNECT:
+            sock = connections.pop(event.session, None)
+            if sock is not None:
+                # FIN setelah semua command terkirim, socket ditutup reader saat server menutup
+                try:
+                    sock.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+
+    elapsed = time.monotonic() - started
+    time.sleep(args.linger)
+    for sock in connections.values():
+        reader.remove(sock)
+        sock.close()
+
+    print(f"Replay selesai: {sent} command dalam {elapsed:.1f}s "
+          f"(rekaman {(last - first) if first is not None else 0:.1f}s, speed {args.speed or 'max'})")
+    print(f"  dilewati={skipped} gagal={failed} diterima={reader.bytes_received} byte")
+    if lags:
+        print(f"  terlambat dari jadwal: {len(lags)} event, p50={percentile(lags, 0.5) * 1000:.1f}ms "
+              f"p99={percentile(lags, 0.99) * 1000:.1f}ms max={max(lags) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_parser(name, help_text):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("log", help="File .evl atau folder event log")
+        sub.add_argument("--since", help="Mulai dari waktu ini (unix atau 'YYYY-mm-dd HH:MM:SS')")
+        sub.add_argument("--until", help="Berhenti setelah waktu ini")
+        return sub
+
+    sub = add_parser("dump", "Tampilkan event")
+    sub.add_argument("--limit", type=int, default=0)
+    sub.set_defaults(run=dump)
+
+    sub = add_parser("stats", "Pesan per room per menit dan top talkers")
+    sub.add_argument("--top", type=int, default=10)
+    sub.set_defaults(run=stats)
+
+    sub = add_parser("replay", "Jalankan ulang traffic ke server")
+    sub.add_argument("--host", default="127.0.0.1")
+    sub.add_argument("--port", type=int, default=12345)
+    sub.add_argument("--speed", type=float, default=1.0, help="1 = real time, 0 = secepat mungkin")
+    sub.add_argument("--user-prefix", default="", help="Prefix username agar tidak bentrok dengan user asli")
+    sub.add_argument("--linger", type=float, default=1.0, help="Detik menunggu output server sebelum menutup koneksi")
+    sub.set_defaults(run=replay)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
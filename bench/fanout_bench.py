@@ -0,0 +1,171 @@
+"""
+Benchmark batching fan-out room (FanoutWindow di server/rooms.py)
+
+Satu room dengan banyak member aktif, tiap member punya Outbox + thread writer
+sungguhan di atas socketpair. Pesan di-post dengan laju tertentu (kedatangan Poisson)
+lalu dibandingkan: tanpa batching (tiap pesan langsung dikirim) vs window adaptif.
+
+Contoh:
+    python bench/fanout_bench.py --members 500 --rate 100
+    python bench/fanout_bench.py --members 200 --rate 1000 --duration 10
+    python bench/fanout_bench.py --members 200 --rate 5 --mode adaptive
+
+Mengukur:
+    - write ke socket per detik (vectored write outbox ~ syscall send) dan pesan per write
+    - latensi post -> diterima client (p50/p95/p99/max) dari --sample member pertama
+    - CPU proses per pesan dan window/batch rata-rata room
+"""
+import argparse
+import os
+import random
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+
+from config import FANOUT_BATCH, OUTBOX_LIMITS  # noqa: E402
+from compression import LineCodec  # noqa: E402
+from outbox import Outbox, OutboxStats  # noqa: E402
+from rooms import Room, RoomHub  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class Receiver(threading.Thread):
+    """Baca sisi client semua member; latensi hanya dihitung untuk member sampel"""
+    def __init__(self, socks, sample):
+        super().__init__(name="bench-receiver", daemon=True)
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {}
+        for i, sock in enumerate(socks):
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ, i < sample)
+            self.buffers[sock] = b""
+        self.lines = 0
+        self.latencies = []
+        self.running = True
+
+    def run(self):
+        while self.running:
+            for key, _ in self.selector.select(timeout=0.1):
+                sock = key.fileobj
+                try:
+                    data = sock.recv(262144)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""
+                if not data:
+                    self.selector.unregister(sock)
+                    continue
+                now = time.perf_counter()
+                if not key.data:
+                    self.lines += data.count(b"\n")
+                    continue
+                lines = (self.buffers[sock] + data).split(b"\n")
+                self.buffers[sock] = lines.pop()
+                for line in lines:
+                    self.lines += 1
+                    # Format: [MSG_ID:n][hh:mm:ss] bench: <perf_counter saat post> ...
+                    sent_at = line.split(b": ", 1)[1].split(b" ", 1)[0]
+                    self.latencies.append(now - float(sent_at))
+
+
+def run(mode, args):
+    fanout = None
+    if mode == "adaptive":
+        fanout = dict(FANOUT_BATCH)
+        if args.max_delay is not None:
+            fanout["max_delay"] = args.max_delay / 1000
+    hub = RoomHub(args.workers, 64, fanout=fanout)
+    stats = OutboxStats()
+    outboxes = {}
+
+    def send(sock, message, frame=None):
+        return outboxes[sock].put(message, frame)
+
+    def send_batch(sock, items):
+        return outboxes[sock].put_many(items)
+
+    hub.start(send, lambda sock, history, since_seq=None: None, lambda text: None, send_batch=send_batch)
+    room = Room("bench", hub)
+    client_socks = []
+    for i in range(args.members):
+        server_sock, client_sock = socket.socketpair()
+        outbox = Outbox(server_sock, LineCodec(), stats, OUTBOX_LIMITS)
+        outbox.start(f"outbox-{i}")
+        outboxes[server_sock] = outbox
+        client_socks.append(client_sock)
+        room.tell(room.activate, server_sock, f"user{i}")
+    receiver = Receiver(client_socks, args.sample)
+    receiver.start()
+    room.ask(lambda: None)
+
+    rng = random.Random(args.seed)
+    padding = "lorem ipsum dolor sit amet " * (args.size // 27 + 1)
+    count = 0
+    cpu_start = time.process_time()
+    started = time.perf_counter()
+    due = started
+    while True:
+        due += rng.expovariate(args.rate)
+        if due - started >= args.duration:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        count += 1
+        message = f"[MSG_ID:{count}][12:00:00] bench: {time.perf_counter():.6f} {padding[:args.size]}"
+        room.tell(room.post, message)
+
+    expected = count * args.members
+    deadline = time.perf_counter() + 30
+    while receiver.lines < expected and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_start
+    receiver.running = False
+
+    writes = sum(outbox.counters.writes for outbox in outboxes.values())
+    latencies_ms = [latency * 1000 for latency in receiver.latencies]
+    print(f"[{mode}] {count} pesan x {args.members} member dalam {elapsed:.1f}s, diterima {receiver.lines}/{expected}")
+    print(f"  write={writes} ({writes / args.duration:,.0f}/s) pesan/write={receiver.lines / writes if writes else 0:.2f} "
+          f"cpu={cpu:.1f}s ({cpu / count * 1000 if count else 0:.2f}ms/pesan)")
+    print(f"  latensi p50={percentile(latencies_ms, 0.5):.2f}ms p95={percentile(latencies_ms, 0.95):.2f}ms "
+          f"p99={percentile(latencies_ms, 0.99):.2f}ms max={max(latencies_ms, default=0):.2f}ms")
+    if room.fanout is not None:
+        print(f"  room: {room.fanout.summary()}")
+
+    for outbox in outboxes.values():
+        outbox.close(flush=False)
+    for sock in list(outboxes) + client_socks:
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=100, help="Pesan per detik ke room")
+    parser.add_argument("--duration", type=float, default=5, help="Detik posting per mode")
+    parser.add_argument("--size", type=int, default=60, help="Panjang teks pesan")
+    parser.add_argument("--sample", type=int, default=20, help="Member yang latensinya diukur")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-delay", type=float, help="Override FANOUT_BATCH max_delay (milidetik)")
+    parser.add_argument("--mode", choices=("both", "off", "adaptive"), default="both")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for mode in (("off", "adaptive") if args.mode == "both" else (args.mode,)):
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
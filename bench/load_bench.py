@@ -0,0 +1,167 @@
+"""
+Load generator memakai client library asyncio (client/protocol.py)
+
+Banyak sesi dalam satu proses (satu event loop, tanpa thread per sesi). Tiap sesi
+login ke salah satu --rooms room, lalu mengirim pesan chat ([SEND] + ack [SENT])
+dengan kedatangan Poisson sebanyak --rate pesan per detik per sesi.
+
+Contoh:
+    python bench/load_bench.py --sessions 1000 --rooms 50 --rate 0.2 --duration 20
+    python bench/load_bench.py --sessions 200 --rooms 1 --rate 1 --host 10.0.0.5
+
+Mengukur:
+    - waktu connect + handshake per sesi (p50/p99)
+    - latensi send -> ack [SENT] (p50/p95/p99)
+    - latensi send -> pesan diterima member room (dari --sample sesi pertama)
+    - pesan chat yang diterima semua sesi per detik, [RATE_LIMITED] dan kegagalan
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client"))
+
+from protocol import AsyncClient  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class Stats:
+    def __init__(self):
+        self.connect = []
+        self.acks = []
+        self.latencies = []
+        self.received = 0
+        self.rate_limited = 0
+        self.failed = 0
+
+
+def room_of(i, args):
+    return "general" if args.rooms <= 1 else f"{args.room_prefix}{i % args.rooms}"
+
+
+async def create_rooms(args):
+    """Buat room uji lewat satu sesi (room yang sudah ada cukup dibalas [ROOM_ERROR])"""
+    if args.rooms <= 1:
+        return
+    client = AsyncClient(f"{args.user_prefix}setup", compression=not args.no_compression)
+    await client.connect(args.host, args.port)
+    for i in range(args.rooms):
+        client.create_room(room_of(i, args))
+        # Kelas "room" dibatasi server: tunggu balasan sebelum room berikutnya
+        while True:
+            event = await client.wait_for("*", lambda e: e.kind in ("room_created", "room_error", "rate_limited"), 10)
+            if event.kind != "rate_limited":
+                break
+            await asyncio.sleep(event.data[1] / 1000)
+            client.create_room(room_of(i, args))
+    await client.close()
+
+
+async def session(i, args, stats, padding, start_at, stop_at):
+    client = AsyncClient(f"{args.user_prefix}{i}", room=room_of(i, args), compression=not args.no_compression)
+    started = time.perf_counter()
+    try:
+        await client.connect(args.host, args.port)
+    except (OSError, asyncio.TimeoutError) as e:
+        stats.failed += 1
+        print(f"[WARN] Sesi {i} gagal connect: {e}")
+        return
+    stats.connect.append(time.perf_counter() - started)
+
+    def on_chat(event):
+        stats.received += 1
+        if event.data is None:
+            return
+        try:
+            # Isi pesan bench: <perf_counter saat kirim> <padding>
+            sent_at = float(event.data.text.split(" ", 1)[0])
+        except ValueError:
+            return
+        stats.latencies.append(time.perf_counter() - sent_at)
+
+    def on_chat_count(event):
+        stats.received += 1
+
+    def on_rate_limited(event):
+        stats.rate_limited += 1
+
+    client.on("chat", on_chat if i < args.sample else on_chat_count)
+    client.on("rate_limited", on_rate_limited)
+
+    rng = random.Random(args.seed + i)
+    await asyncio.sleep(max(0.0, start_at - time.perf_counter()) + rng.uniform(0, 1 / args.rate))
+    while time.perf_counter() < stop_at and not client.closed:
+        sent_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(client.send_chat(f"{sent_at:.6f} {padding}"), args.timeout)
+            stats.acks.append(time.perf_counter() - sent_at)
+        except (asyncio.TimeoutError, ConnectionError):
+            stats.failed += 1
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.sleep(args.linger)
+    await client.close()
+
+
+async def run(args):
+    await create_rooms(args)
+    stats = Stats()
+    padding = ("lorem ipsum dolor sit amet " * (args.size // 27 + 1))[:args.size]
+    # Semua sesi connect dulu (bertahap --connect-rate per detik), baru mulai mengirim
+    connect_time = args.sessions / args.connect_rate
+    start_at = time.perf_counter() + connect_time + 1
+    stop_at = start_at + args.duration
+    tasks = []
+    for i in range(args.sessions):
+        tasks.append(asyncio.ensure_future(session(i, args, stats, padding, start_at, stop_at)))
+        if (i + 1) % 50 == 0:
+            await asyncio.sleep(50 / args.connect_rate)
+    await asyncio.sleep(max(0.0, start_at - time.perf_counter()))
+    received_at_start = stats.received
+    cpu_start = time.process_time()
+    await asyncio.gather(*tasks)
+    cpu = time.process_time() - cpu_start
+    received = stats.received - received_at_start
+
+    ms = lambda values, p: percentile(values, p) * 1000  # noqa: E731
+    print(f"{len(stats.connect)}/{args.sessions} sesi, {args.rooms} room, {len(stats.acks)} pesan di-ack "
+          f"dalam {args.duration:.0f}s ({len(stats.acks) / args.duration:,.0f}/s)")
+    print(f"  connect p50={ms(stats.connect, 0.5):.1f}ms p99={ms(stats.connect, 0.99):.1f}ms")
+    print(f"  ack     p50={ms(stats.acks, 0.5):.1f}ms p95={ms(stats.acks, 0.95):.1f}ms p99={ms(stats.acks, 0.99):.1f}ms")
+    print(f"  terima  p50={ms(stats.latencies, 0.5):.1f}ms p95={ms(stats.latencies, 0.95):.1f}ms "
+          f"p99={ms(stats.latencies, 0.99):.1f}ms (sampel {args.sample} sesi)")
+    print(f"  diterima {received / args.duration:,.0f} pesan/s, rate_limited={stats.rate_limited} gagal={stats.failed} "
+          f"cpu client={cpu:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--rooms", type=int, default=10, help="1 = semua sesi di general")
+    parser.add_argument("--rate", type=float, default=0.2, help="Pesan per detik per sesi")
+    parser.add_argument("--duration", type=float, default=10, help="Detik pengiriman")
+    parser.add_argument("--size", type=int, default=40, help="Panjang padding pesan")
+    parser.add_argument("--sample", type=int, default=20, help="Sesi yang latensi terimanya diukur")
+    parser.add_argument("--connect-rate", type=float, default=200, help="Sesi baru per detik")
+    parser.add_argument("--timeout", type=float, default=10, help="Detik menunggu ack [SENT]")
+    parser.add_argument("--linger", type=float, default=1.0, help="Detik menunggu pesan terakhir sebelum menutup")
+    parser.add_argument("--user-prefix", default="load")
+    parser.add_argument("--room-prefix", default="load")
+    parser.add_argument("--no-compression", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark index full-text room (server/search.py) dengan korpus sintetis
+
+Contoh:
+    python bench/search_bench.py --messages 1000000
+    python bench/search_bench.py --messages 200000 --queries 500 --keep
+
+Mengukur:
+    - throughput indexing (pesan/detik, termasuk flush + merge segmen)
+    - latensi query (p50/p95/p99/max) untuk kata umum, kata jarang dan dua kata
+    - ukuran index di disk dan jumlah term kamus yang di-cache
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+import shutil
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+
+import search  # noqa: E402
+
+
+def make_vocabulary(size, rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def zipf_cum_weights(size, s=1.1):
+    return list(itertools.accumulate(1 / (rank ** s) for rank in range(1, size + 1)))
+
+
+def generate(count, vocabulary, cum_weights, rng):
+    """Pesan chat sintetis dengan distribusi kata Zipf (mirip teks percakapan)"""
+    users = [f"user{i}" for i in range(50)]
+    for seq in range(1, count + 1):
+        if seq % 200 == 0:
+            name = "_".join(rng.choices(vocabulary[:500], k=2))
+            yield seq, f"[FILE_SHARED]bench:{uuid.uuid4()}:{name}.png:{rng.choice(users)}:1234:"
+            continue
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(3, 20))
+        yield seq, f"[MSG_ID:{uuid.uuid4()}][12:00:00] {rng.choice(users)}: {' '.join(words)}"
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--flush-docs", type=int, default=512)
+    parser.add_argument("--max-segment-docs", type=int, default=65536)
+    parser.add_argument("--cache-terms", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dir", help="Folder index (default: folder sementara)")
+    parser.add_argument("--keep", action="store_true", help="Jangan hapus folder index setelah selesai")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    cum_weights = zipf_cum_weights(len(vocabulary))
+    directory = args.dir or tempfile.mkdtemp(prefix="search-bench-")
+    cache = search.TermCache(args.cache_terms)
+    index = search.RoomIndex(directory, cache, args.flush_docs, args.max_segment_docs)
+
+    print(f"Indexing {args.messages} pesan (vocabulary {len(vocabulary)}) ke {directory}")
+    # Hanya waktu add_message/flush yang dihitung, bukan pembuatan korpus
+    elapsed = 0.0
+    for seq, message in generate(args.messages, vocabulary, cum_weights, rng):
+        start = time.perf_counter()
+        index.add_message(seq, message)
+        elapsed += time.perf_counter() - start
+    start = time.perf_counter()
+    index.flush()
+    elapsed += time.perf_counter() - start
+    print(f"  {elapsed:.1f}s ({args.messages / elapsed:,.0f} pesan/detik), "
+          f"{len(index.segments)} segmen, {directory_size(directory) / 1024 / 1024:.1f} MB di disk")
+
+    # Buka ulang seperti room yang baru di-page in (cache dingin)
+    cache = search.TermCache(args.cache_terms)
+    index = search.RoomIndex(directory, cache, args.flush_docs, args.max_segment_docs)
+    start = time.perf_counter()
+    index.search(vocabulary[0], args.limit)
+    print(f"  query pertama (memuat kamus semua segmen): {(time.perf_counter() - start) * 1000:.1f}ms")
+    workloads = {
+        "common": lambda: vocabulary[rng.randint(0, 20)],
+        "rare": lambda: vocabulary[rng.randint(len(vocabulary) // 2, len(vocabulary) - 1)],
+        "two-word": lambda: f"{vocabulary[rng.randint(0, 200)]} {vocabulary[rng.randint(0, 2000)]}",
+    }
+    for name, make_query in workloads.items():
+        timings = []
+        hits = 0
+        for _ in range(args.queries):
+            query = make_query()
+            start = time.perf_counter()
+            results = index.search(query, args.limit)
+            timings.append((time.perf_counter() - start) * 1000)
+            hits += len(results)
+        print(f"  {name:9s} p50={percentile(timings, 0.5):.2f}ms p95={percentile(timings, 0.95):.2f}ms "
+              f"p99={percentile(timings, 0.99):.2f}ms max={max(timings):.2f}ms "
+              f"avg hasil={hits / args.queries:.1f}")
+    print(f"  kamus di cache: {cache.total} term ({cache.loads} segmen dimuat)")
+
+    if not args.keep and not args.dir:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,52 @@
 import socket
 import threading
+import os
+import sqlite3
+import collections
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, Menu
 from datetime import datetime
 import json
 import hashlib
-import winsound
 import uuid
 import time
+import random
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from protocol import FrameReader, FRAME_ERRORS, ChunkAssembler, encode_message, hello_line, negotiated_codec
+from protocol import parse_event, parse_chat, parse_file_shared, item_id_of
+
+try:
+    import winsound
+except ImportError:  # Bukan Windows: tanpa suara notifikasi
+    winsound = None
 
 SERVER_IP = "127.0.0.1"  # Localhost - karena server dan client di komputer yang sama
 PORT = 12345
+COMPRESSION = True  # Tawarkan kompresi deflate ke server saat handshake
+RECONNECT_BASE_DELAY = 1000   # ms, backoff eksponensial saat reconnect gagal
+RECONNECT_MAX_DELAY = 30000   # ms, batas atas backoff
+SEARCH_LIMIT = 20             # Hasil maksimal per /search
+UI_FRAME_MS = 16              # ms antar drain antrean UI (~60 fps)
+UI_FRAME_BUDGET = 0.010       # Detik kerja UI maksimal per frame, sisanya lanjut di frame berikutnya
+SCROLLBACK_LINES = 3000       # Baris maksimal per display room, baris tertua dipotong
+SCROLLBACK_TRIM = 300         # Potong sekaligus setelah melebihi batas sebanyak ini (bukan tiap pesan)
+SCROLLBACK_PAGE = 50          # Pesan lama per [GET_OLDER] saat user scroll ke atas
+OLDER_RETRY = 5               # Detik sebelum [GET_OLDER] yang belum dibalas boleh dikirim ulang
+TYPING_IDLE = 2.0             # Detik tanpa ketikan sebelum [STOP_TYPING]
+READ_RECEIPT_INTERVAL = 0.5   # Detik antar [READ] gabungan untuk room aktif
+READ_BATCH_MAX = 100          # msg_id maksimal per [READ] (sama dengan READ_MAX_IDS server)
+USER_ROW_HEIGHT = 40          # px tinggi tetap satu baris user di sidebar (untuk virtualisasi)
+PREVIEW_MAX_WIDTH = 300       # Lebar maksimal preview gambar di chat (px)
+PREVIEW_WORKERS = 2           # Thread decode/resize gambar (Pillow melepas GIL saat decode dan resize)
+PREVIEW_CACHE_BYTES = 32 * 1024 * 1024  # Batas memori cache preview yang sudah di-decode (LRU)
+MESSAGE_CACHE = True          # Simpan pesan room di disk agar room langsung tampil saat dibuka
+MESSAGE_CACHE_BYTES = 64 * 1024 * 1024  # Batas ukuran cache pesan, room yang lama tidak dibuka dibuang (LRU)
+MESSAGE_CACHE_ROOM_ITEMS = 300  # Pesan/file terakhir per room yang disimpan dan dirender dari cache
+MESSAGE_CACHE_FLUSH = 1.0     # Detik antar commit tulisan cache (digabung dalam satu transaksi)
+SYNC_ROOMS = 20               # Room dari cache yang disinkron lewat [SYNC] saat login (SYNC_MAX_ROOMS server)
+SUBSCRIBE_BATCH = 50          # Room maksimal per [SUBSCRIBE] gabungan (SUBSCRIBE_MAX_ROOMS server)
 
 # ==================== COLOR THEMES ====================
 # Modern Color Palette - Premium Dark Theme
@@ -70,6 +106,19 @@ AVATAR_COLORS = [
     '#3b82f6', '#8b5cf6', '#ec4899', '#f43f5e', '#06b6d4'
 ]
 
+def message_mark(msg_id):
+    """Nama mark Tk di awal blok pesan (tanpa '-' agar bisa diberi modifier seperti '+2l')"""
+    return "msg_" + msg_id.replace("-", "_")
+
+def beep():
+    """Suara notifikasi (hanya di Windows)"""
+    if winsound is None:
+        return
+    try:
+        winsound.MessageBeep(winsound.MB_OK)
+    except:
+        pass
+
 def get_user_color(username):
     """
     Generate consistent color berdasarkan username
@@ -78,6 +127,489 @@ def get_user_color(username):
     hash_val = int(hashlib.md5(username.encode()).hexdigest(), 16)
     return AVATAR_COLORS[hash_val % len(AVATAR_COLORS)]
 
+class Connection:
+    """
+    Koneksi ke server milik satu client
+    Kiriman masuk antrean dan ditulis thread writer (Tk tidak pernah menunggu socket);
+    thread connection membaca pesan dan menyambung ulang otomatis (backoff eksponensial + jitter)
+    Pesan chat disimpan di outbox sampai server membalas [SENT]key:msg_id, lalu dikirim
+    ulang setelah reconnect; server membuang duplikat berdasarkan key
+    Args:
+        address: (host, port) server
+        hello: fn() -> dict field [HELLO] (username, room, last_id), dipanggil tiap connect
+        on_message: fn(Event) untuk tiap pesan server (dipanggil thread connection)
+        on_state: fn(state, delay_ms) dengan state "connected", "disconnected" atau
+            "reconnecting" (delay_ms = jeda sebelum percobaan berikutnya)
+    """
+    def __init__(self, address, hello, on_message, on_state):
+        self.address = address
+        self.hello = hello
+        self.on_message = on_message
+        self.on_state = on_state
+        self.sock = None
+        self.codec = None  # DeflateCodec jika kompresi disepakati server
+        self.reader = FrameReader()
+        self.chunks = ChunkAssembler()  # Potongan pesan besar yang belum lengkap
+        self.queue = collections.deque()  # Teks yang menunggu thread writer
+        self.wakeup = threading.Condition()
+        self.outbox = collections.OrderedDict()  # key -> teks chat yang belum di-ack server
+        self.connected = False
+        self.closed = False
+        self.attempt = 0
+        self.reconnect_delay = None  # Delay (ms) dari hint [RECONNECT] server
+
+    def connect(self):
+        """Connect pertama (blocking, error dilempar ke pemanggil) lalu jalankan thread"""
+        self.open()
+        threading.Thread(target=self.run, name="connection", daemon=True).start()
+        threading.Thread(target=self.write_loop, name="writer", daemon=True).start()
+
+    def send(self, text):
+        """
+        Antrekan satu command ke server (tidak pernah blocking)
+        Returns:
+            False jika sedang terputus (command dibuang, mis. typing/read yang sudah basi)
+        """
+        with self.wakeup:
+            if not self.connected:
+                return False
+            self.queue.append(text)
+            self.wakeup.notify()
+        return True
+
+    def send_chat(self, text):
+        """
+        Kirim pesan chat dengan key idempotency; tetap disimpan di outbox saat terputus
+        Returns:
+            True jika langsung diantrekan, False jika menunggu reconnect
+        """
+        key = uuid.uuid4().hex
+        with self.wakeup:
+            self.outbox[key] = text
+            if self.connected:
+                self.queue.append(f"[SEND]{key}:{text}")
+                self.wakeup.notify()
+            return self.connected
+
+    def close(self):
+        with self.wakeup:
+            self.closed = True
+            self.connected = False
+            self.wakeup.notify()
+        self.shutdown(self.sock)
+
+    def shutdown(self, sock):
+        """Putus socket agar thread connection keluar dari recv"""
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def open(self):
+        """Buka socket + handshake, lalu kirim ulang outbox paling depan"""
+        sock = socket.create_connection(self.address, timeout=5)
+        try:
+            first = self.handshake(sock)
+        except Exception:
+            sock.close()
+            raise
+        with self.wakeup:
+            self.sock = sock
+            self.connected = True
+            # Command yang belum terkirim dari koneksi lama sudah basi, chat diambil dari outbox
+            self.queue.clear()
+            self.queue.extend(f"[SEND]{key}:{text}" for key, text in self.outbox.items())
+            self.wakeup.notify()
+        if first is not None:
+            self.dispatch(first)
+
+    def handshake(self, sock):
+        """
+        Kirim [HELLO] dan tunggu [HELLO_OK] untuk negosiasi kompresi
+        Byte yang ikut terbaca setelah [HELLO_OK] disimpan di reader
+        Returns:
+            Pesan pertama jika server lama tanpa handshake, selain itu None
+        """
+        sock.sendall(hello_line(self.hello(), COMPRESSION))
+
+        self.reader = FrameReader()
+        self.codec = None
+        self.chunks = ChunkAssembler()
+        reply = None
+        while reply is None:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError("Server menutup koneksi saat handshake")
+            self.reader.feed(data)
+            reply = self.reader.next_message()
+        sock.settimeout(None)
+
+        if reply.startswith("[HELLO_OK]"):
+            self.codec = negotiated_codec(reply)
+            self.reader.codec = self.codec
+            return None
+        # Server lama tanpa handshake: pesan pertama langsung diproses
+        return reply
+
+    def run(self):
+        """Thread connection: baca sampai putus, lalu reconnect sampai berhasil"""
+        while True:
+            self.read_loop()
+            with self.wakeup:
+                self.connected = False
+                self.queue.clear()
+                sock, self.sock = self.sock, None
+                if self.closed:
+                    return
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+            # Server restart terencana: reconnect sesuai hint (sudah diberi jitter server)
+            delay = self.reconnect_delay
+            self.reconnect_delay = None
+            if delay is None:
+                self.on_state("disconnected", 0)
+                delay = self.backoff()
+            while True:
+                self.on_state("reconnecting", delay)
+                time.sleep(delay / 1000)
+                if self.closed:
+                    return
+                try:
+                    self.open()
+                    break
+                except (OSError, ValueError):
+                    self.attempt += 1
+                    delay = self.backoff()
+            self.attempt = 0
+            self.on_state("connected", 0)
+
+    def backoff(self):
+        """Delay (ms) reconnect berikutnya: eksponensial dengan jitter agar client tidak serentak"""
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** self.attempt)
+        return int(delay * random.uniform(0.5, 1.0))
+
+    def read_loop(self):
+        """Baca sampai koneksi putus; hanya error socket/stream yang dianggap putus"""
+        sock = self.sock
+        reader = self.reader
+        while True:
+            # Proses dulu sisa buffer dari handshake
+            try:
+                msg = reader.next_message()
+            except FRAME_ERRORS:
+                return  # Stream rusak, sambung ulang
+            if msg is None:
+                try:
+                    data = sock.recv(4096)
+                except OSError:
+                    return
+                if not data:
+                    return
+                reader.feed(data)
+            elif msg:
+                # Bug di parsing/handler tidak boleh terlihat seperti koneksi putus
+                try:
+                    self.dispatch(msg)
+                except Exception as e:
+                    print(f"Dispatch error: {e!r} ({msg[:80]!r})")
+
+    def write_loop(self):
+        """Thread writer: kirim semua yang antre sekaligus (satu sendall per batch)"""
+        while True:
+            with self.wakeup:
+                while not (self.connected and self.queue) and not self.closed:
+                    self.wakeup.wait()
+                if self.closed:
+                    return
+                items = list(self.queue)
+                self.queue.clear()
+                sock = self.sock
+                codec = self.codec
+            data = b"".join(encode_message(codec, text) for text in items)
+            try:
+                sock.sendall(data)
+            except OSError:
+                self.shutdown(sock)
+
+    def dispatch(self, msg):
+        """Tangani pesan level koneksi, sisanya diteruskan ke on_message sebagai Event"""
+        event = parse_event(msg)
+        # Heartbeat dari server
+        if event.kind == "ping":
+            self.send("[PONG]")
+
+        # Server restart: koneksi akan ditutup, reconnect setelah delay
+        elif event.kind == "reconnect":
+            self.reconnect_delay = event.data if event.data is not None else RECONNECT_BASE_DELAY
+
+        # Pesan besar yang dipecah server (diproses setelah semua potongan diterima)
+        elif event.kind == "chunk":
+            full = self.chunks.add(*event.data)
+            if full is not None:
+                self.dispatch(full)
+
+        else:
+            # Pesan chat sudah diterima server, keluarkan dari outbox
+            if event.kind == "sent":
+                with self.wakeup:
+                    self.outbox.pop(event.data[0], None)
+            self.on_message(event)
+
+
+def decode_preview(preview_b64, max_width):
+    """
+    Decode dan resize preview gambar (dijalankan di thread pool, bukan main loop Tk)
+    Returns:
+        PIL Image RGB/RGBA siap dijadikan PhotoImage
+    """
+    from PIL import Image
+    import base64
+    import io
+    
+    image = Image.open(io.BytesIO(base64.b64decode(preview_b64)))
+    # JPEG bisa di-decode langsung di skala lebih kecil
+    image.draft("RGB", (max_width, max_width))
+    if image.width > max_width:
+        ratio = max_width / float(image.width)
+        new_height = max(1, int(float(image.height) * ratio))
+        image = image.resize((max_width, new_height), getattr(Image, "Resampling", Image).LANCZOS)
+    image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    image.load()
+    return image
+
+class PreviewCache:
+    """
+    Cache LRU preview gambar yang sudah di-decode, key (file_id, lebar)
+    Dibatasi total byte pixel; dipakai bersama main loop dan thread decode
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.images = collections.OrderedDict()
+        self.total = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+            return image
+    
+    def put(self, key, image):
+        size = image.width * image.height * len(image.getbands())
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.images.pop(key, None)
+            if old is not None:
+                self.total -= old.width * old.height * len(old.getbands())
+            self.images[key] = image
+            self.total += size
+            while self.total > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.total -= evicted.width * evicted.height * len(evicted.getbands())
+
+def cache_path(username):
+    """Path file cache pesan user ini (per server) di folder data aplikasi"""
+    base = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_DATA_HOME")
+            or os.path.join(os.path.expanduser("~"), ".local", "share"))
+    key = hashlib.sha1(f"{SERVER_IP}:{PORT}:{username}".encode()).hexdigest()[:16]
+    return os.path.join(base, "PyRTC", f"cache-{key}.sqlite3")
+
+class MessageCache:
+    """
+    Cache pesan room di disk (SQLite) agar room langsung tampil saat dibuka
+    Disimpan baris asli dari server: chat ([MSG_ID:id]...) dan [FILE_SHARED] (termasuk
+    thumbnail), plus reaction per pesan. Tulisan dikumpulkan lalu di-commit per flush()
+    Args:
+        path: File SQLite
+        max_bytes: Batas total ukuran pesan, room yang paling lama tidak dipakai dibuang duluan
+        room_limit: Item terakhir per room yang disimpan
+    """
+    def __init__(self, path, max_bytes, room_limit):
+        self.max_bytes = max_bytes
+        self.room_limit = room_limit
+        self.pending = []  # (room, item_id, raw) atau (room, item_id, None, reactions)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                            "room TEXT NOT NULL, item_id TEXT NOT NULL, raw TEXT NOT NULL, UNIQUE (room, item_id))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS reactions (room TEXT NOT NULL, item_id TEXT NOT NULL, "
+                            "data TEXT NOT NULL, PRIMARY KEY (room, item_id))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS rooms (name TEXT PRIMARY KEY, used REAL NOT NULL, "
+                            "bytes INTEGER NOT NULL)")
+    
+    def load(self, room):
+        """
+        Isi cache satu room (room ditandai baru dipakai untuk LRU)
+        Returns:
+            (list (item_id, raw) urut lama ke baru, {item_id: reactions})
+        """
+        self.flush()
+        with self.db:
+            self.db.execute("UPDATE rooms SET used = ? WHERE name = ?", (time.time(), room))
+        rows = self.db.execute("SELECT item_id, raw FROM items WHERE room = ? ORDER BY id DESC LIMIT ?",
+                               (room, self.room_limit)).fetchall()
+        rows.reverse()
+        reactions = {item_id: json.loads(data) for item_id, data in
+                     self.db.execute("SELECT item_id, data FROM reactions WHERE room = ?", (room,))}
+        return rows, reactions
+    
+    def recent_rooms(self, limit):
+        """Room yang paling baru dipakai beserta item terakhirnya: [(room, item_id)]"""
+        self.flush()
+        return self.db.execute("SELECT name, (SELECT item_id FROM items WHERE room = name ORDER BY id DESC LIMIT 1) "
+                               "FROM rooms ORDER BY used DESC LIMIT ?", (limit,)).fetchall()
+    
+    def add(self, room, item_id, raw):
+        self.pending.append((room, item_id, raw))
+    
+    def set_reactions(self, room, item_id, reactions):
+        self.pending.append((room, item_id, None, reactions))
+    
+    def drop_room(self, room):
+        """Hapus semua isi cache room (room dihapus di server)"""
+        self.flush()
+        with self.db:
+            self.delete_room(room)
+    
+    def flush(self):
+        """Commit semua tulisan yang antre dalam satu transaksi, lalu potong sesuai batas"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        now = time.time()
+        added = {}  # room -> byte pesan baru
+        with self.db:
+            for entry in pending:
+                room, item_id = entry[0], entry[1]
+                if entry[2] is None:
+                    if entry[3]:
+                        self.db.execute("INSERT OR REPLACE INTO reactions VALUES (?, ?, ?)",
+                                        (room, item_id, json.dumps(entry[3], ensure_ascii=False)))
+                    else:
+                        self.db.execute("DELETE FROM reactions WHERE room = ? AND item_id = ?", (room, item_id))
+                    continue
+                cursor = self.db.execute("INSERT OR IGNORE INTO items (room, item_id, raw) VALUES (?, ?, ?)",
+                                         (room, item_id, entry[2]))
+                if cursor.rowcount:
+                    added[room] = added.get(room, 0) + len(entry[2])
+            for room, size in added.items():
+                self.db.execute("INSERT OR IGNORE INTO rooms VALUES (?, ?, 0)", (room, now))
+                self.db.execute("UPDATE rooms SET bytes = bytes + ?, used = ? WHERE name = ?", (size, now, room))
+                self.trim_room(room)
+            if added:
+                self.evict()
+    
+    def trim_room(self, room):
+        """Buang item tertua room di luar room_limit"""
+        cutoff = self.db.execute("SELECT id FROM items WHERE room = ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+                                 (room, self.room_limit)).fetchone()
+        if cutoff is None:
+            return
+        freed = self.db.execute("SELECT COALESCE(SUM(LENGTH(raw)), 0) FROM items WHERE room = ? AND id <= ?",
+                                (room, cutoff[0])).fetchone()[0]
+        self.db.execute("DELETE FROM items WHERE room = ? AND id <= ?", (room, cutoff[0]))
+        self.db.execute("DELETE FROM reactions WHERE room = ? AND item_id NOT IN "
+                        "(SELECT item_id FROM items WHERE room = ?)", (room, room))
+        self.db.execute("UPDATE rooms SET bytes = bytes - ? WHERE name = ?", (freed, room))
+    
+    def evict(self):
+        """Buang room yang paling lama tidak dipakai sampai total di bawah max_bytes"""
+        rooms = self.db.execute("SELECT name, bytes FROM rooms ORDER BY used").fetchall()
+        total = sum(size for _, size in rooms)
+        # Room yang paling baru dipakai tidak pernah dibuang
+        for name, size in rooms[:-1]:
+            if total <= self.max_bytes:
+                break
+            self.delete_room(name)
+            total -= size
+    
+    def delete_room(self, room):
+        for table, column in (("items", "room"), ("reactions", "room"), ("rooms", "name")):
+            self.db.execute(f"DELETE FROM {table} WHERE {column} = ?", (room,))
+    
+    def close(self):
+        self.flush()
+        self.db.close()
+
+class Scheduler:
+    """
+    Satu timer heap untuk seluruh client (typing debounce, read receipt)
+    Dijalankan main loop Tk tiap frame lewat drain_ui_queue, jadi tidak ada thread
+    per timer dan callback boleh menyentuh widget
+    """
+    def __init__(self):
+        self.heap = []  # [waktu jatuh tempo, urutan, fn, args]
+        self.counter = itertools.count()
+    
+    def call_later(self, delay, fn, *args):
+        """Returns: handle untuk cancel()"""
+        entry = [time.monotonic() + delay, next(self.counter), fn, args]
+        heapq.heappush(self.heap, entry)
+        return entry
+    
+    def cancel(self, entry):
+        entry[2] = None  # Dibuang saat sampai di puncak heap
+    
+    def run_due(self):
+        heap = self.heap
+        now = time.monotonic()
+        while heap and heap[0][0] <= now:
+            _, _, fn, args = heapq.heappop(heap)
+            if fn is None:
+                continue
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Scheduler error: {e}")
+
+class Scrollback:
+    """
+    State scrollback satu display room
+    Pesan dan embed (gambar/tombol) dicatat urut tampil agar yang ikut
+    terpotong saat trim bisa dilepas dari memori
+    """
+    def __init__(self, room):
+        self.room = room
+        self.message_ids = []  # msg_id urut dari atas ke bawah (index interval, lihat message_at)
+        self.embeds = collections.deque()       # [nama mark, widget, PhotoImage] urut dari atas, mark None = sudah dipotong
+        self.oldest_id = None    # Pesan tertua yang tampil, untuk [GET_OLDER]
+        self.has_older = False   # Ada pesan lebih lama di server (pernah dipotong)
+        self.older_sent_at = 0.0  # Waktu [GET_OLDER] terakhir yang belum dibalas
+        self.file_ids = set()    # file_id yang sudah tampil (cache dan history bisa tumpang tindih)
+
+class RoomItem:
+    """Widget satu room di sidebar, dipakai ulang selama room masih ada di [ROOM_LIST]"""
+    def __init__(self, frame, button, delete_button):
+        self.frame = frame
+        self.button = button
+        self.delete_button = delete_button  # None untuk general
+        self.style = None  # Tampilan terakhir yang diterapkan, config hanya jika berubah
+        self.packed = False
+
+class UserRow:
+    """
+    Satu baris widget user di sidebar
+    Hanya baris yang terlihat yang dibuat; saat scroll baris diisi ulang dengan user lain
+    """
+    def __init__(self, frame, dot, name_container, name, status):
+        self.frame = frame
+        self.dot = dot
+        self.name_container = name_container
+        self.name = name
+        self.status = status
+        self.key = None  # (user, room, tema) yang sedang ditampilkan
+        self.packed = False
+
 class ChatApp:
     def __init__(self, root):
         self.root = root
@@ -88,13 +620,15 @@ class ChatApp:
         
         # State variables
         self.username = ""
-        self.client = None
+        self.client = None  # Connection setelah login
+        self.rate_limited_until = {}  # {kelas_command: waktu} dari [RATE_LIMITED] server
         self.online_users = []
         self.current_theme = "dark"  # Default tema
         self.COLORS = COLORS_DARK.copy()  # Color scheme aktif
         
         # Typing indicator state
-        self.typing_timer = None  # Timer untuk auto-stop typing
+        self.typing_timer = None  # Handle scheduler untuk auto-stop typing
+        self.typing_deadline = 0.0  # Waktu (monotonic) [STOP_TYPING] jika tidak ada ketikan lagi
         self.is_typing = False  # Status typing user sendiri
         self.typing_users_list = []  # List user yang sedang mengetik
         
@@ -106,17 +640,54 @@ class ChatApp:
         # Format: {message_id: {'status': 'sent'/'delivered'/'read', 'widget': label_widget}}
         self.message_status = {}
         
+        # Read receipt yang belum dikirim: {room: [msg_id]} (dikirim saat pesan terlihat)
+        self.pending_reads = {}
+        self.read_timer = None
+        
         # Message ID mapping
-        # Format: {message_id: text_widget_index} untuk tracking position
-        self.message_positions = {}
+        # Format: {message_id: display room}; posisi pesan = mark message_mark(id) di display itu
+        # (mark ikut bergeser saat baris reaction/status/pesan lama disisipkan atau dipotong)
+        self.message_displays = {}
         
         # FITUR BARU: Discord-style Rooms state
         self.current_room = "general"
         self.available_rooms = ["general"]
         self.room_displays = {}  # {room_name: scrolledtext_widget}
-        
-        # Track images to prevent garbage collection
-        self.images = []
+        self.unread_counts = {}  # {room_name: (unread, mentions)} untuk badge sidebar
+        self.subscribed_rooms = {"general"}  # Room yang sudah di-subscribe ke server
+        self.subscribing = set()  # Room yang [SUBSCRIBE]-nya bisa saja ditolak rate limit (dikirim ulang)
+        
+        # Sidebar: pool widget per room dan baris user yang terlihat (hanya perubahan yang di-config)
+        self.room_items = {}  # room -> RoomItem
+        self.room_order = []  # Urutan room yang sedang di-pack
+        self.user_rows = []  # Pool UserRow, sebanyak baris yang muat di sidebar
+        self.user_rows_data = []  # [(user, room)] urut tampil
+        self.user_offset = 0  # Index user di baris pertama yang terlihat
+        
+        # Scrollback per display room (juga menyimpan reference gambar agar tidak di-GC)
+        self.scrollbacks = {}  # display -> Scrollback
+        self.next_embed_id = 0
+        # Download file asli yang menunggu [FILE_DATA]: {file_id: save_path}
+        self.pending_downloads = {}
+        # Preview gambar: decode di thread pool, hasil di-cache per (file_id, lebar)
+        self.preview_cache = PreviewCache(PREVIEW_CACHE_BYTES)
+        self.preview_pool = None  # ThreadPoolExecutor, dibuat saat preview pertama
+        self.preview_waiters = {}  # (file_id, lebar) -> [(display, embed)] menunggu decode selesai
+        # Cache pesan di disk (dibuka saat login, per user): room dirender dari cache dan server
+        # hanya diminta pesan sesudah item terakhir di cache
+        self.message_cache = None
+        self.cache_timer = None
+        # Room tanpa display yang cache-nya sudah terbaru dari [SYNC]: saat dibuka cukup
+        # [SWITCH_ROOM]room:delta, tanpa [GET_HISTORY]
+        self.synced_rooms = set()
+        
+        # Antrean UI: thread network hanya menambah (fn, args), widget Tk hanya
+        # disentuh main loop lewat drain_ui_queue
+        self.ui_queue = collections.deque()
+        self.ui_draining = False
+        self.insert_batch = None  # [display, args insert, marks posisi pesan, jumlah newline]
+        self.text_ops = (self.parse_chat_message, self.add_message)  # Boleh digabung dalam satu edit
+        self.scheduler = Scheduler()  # Timer client, dijalankan tiap frame UI
         
         # Apply theme to root
         self.root.configure(bg=self.COLORS['bg_primary'])
@@ -131,6 +702,8 @@ class ChatApp:
         
         self.create_login_screen()
         self.create_chat_screen()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(UI_FRAME_MS, self.drain_ui_queue)
     
     def center_window(self, w, h):
         """Center window pada layar"""
@@ -185,45 +758,108 @@ class ChatApp:
     # FITUR BARU: Discord-style Rooms Methods
     
     def update_room_list(self, rooms):
-        """Update sidebar dengan daftar rooms"""
+        """
+        Update sidebar dengan daftar rooms
+        Widget room dipakai ulang: hanya room baru yang dibuat, room hilang di-destroy,
+        dan tampilan (aktif, badge unread) di-config jika berubah
+        """
         self.available_rooms = rooms
         
-        # Clear existing buttons
-        for widget in self.room_list_frame.winfo_children():
-            widget.destroy()
-            
-        # Add buttons for each room
+        # Buang counter dan widget room yang sudah dihapus
+        room_set = set(rooms)
+        for room in list(self.unread_counts):
+            if room not in room_set:
+                del self.unread_counts[room]
+        for room in list(self.room_items):
+            if room not in room_set:
+                self.room_items.pop(room).frame.destroy()
+                if self.message_cache is not None:
+                    self.message_cache.drop_room(room)
+        
+        # Room baru biasanya di akhir; jika urutan room lama berubah, pack ulang semua
+        kept = [room for room in self.room_order if room in self.room_items]
+        if list(rooms[:len(kept)]) != kept:
+            for item in self.room_items.values():
+                item.frame.pack_forget()
+                item.packed = False
+        self.room_order = list(rooms)
+        
         for room in rooms:
             is_active = (room == self.current_room)
             bg = self.COLORS['bg_hover'] if is_active else self.COLORS['bg_secondary']
             fg = self.COLORS['accent_blue'] if is_active else self.COLORS['text_primary']
             
-            # Container for room item (to include delete button)
-            room_item = tk.Frame(self.room_list_frame, bg=bg)
-            room_item.pack(fill=tk.X, pady=1)
+            # Badge unread / mention untuk room background
+            unread, mentions = self.unread_counts.get(room, (0, 0))
+            label = f"# {room}"
+            if unread and not is_active:
+                label += f"  ({unread})"
+                if mentions:
+                    label += f" @{mentions}"
+                    fg = self.COLORS['accent_pink']
+            font = self.font_small if not (is_active or unread) else ("Segoe UI", 10, "bold")
             
-            btn = tk.Button(room_item, text=f"# {room}",
-                           font=self.font_small if not is_active else ("Segoe UI", 10, "bold"),
-                           bg=bg, fg=fg, activebackground=self.COLORS['bg_hover'],
-                           activeforeground=fg, relief="flat", cursor="hand2",
-                           anchor="w", padx=10, pady=5,
-                           command=lambda r=room: self.switch_room(r))
-            btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
-            
-            # Delete button for custom rooms
-            if room != "general":
-                del_btn = tk.Button(room_item, text="✕", font=("Segoe UI", 8),
-                                   bg=bg, fg=self.COLORS['text_muted'],
-                                   activebackground=self.COLORS['accent_red'],
-                                   activeforeground="#ffffff", relief="flat", cursor="hand2",
-                                   command=lambda r=room: self.delete_room(r))
-                del_btn.pack(side=tk.RIGHT, padx=5)
+            item = self.room_items.get(room)
+            if item is None:
+                item = self.create_room_item(room)
+                self.room_items[room] = item
+            style = (label, font, bg, fg, self.COLORS['bg_hover'], self.COLORS['text_muted'])
+            if item.style != style:
+                item.style = style
+                item.frame.config(bg=bg)
+                item.button.config(text=label, font=font, bg=bg, fg=fg,
+                                   activebackground=self.COLORS['bg_hover'], activeforeground=fg)
+                if item.delete_button is not None:
+                    item.delete_button.config(bg=bg, fg=self.COLORS['text_muted'])
+            if not item.packed:
+                item.frame.pack(fill=tk.X, pady=1)
+                item.packed = True
+
+    def create_room_item(self, room):
+        """Buat widget satu room (tampilan diisi update_room_list)"""
+        # Container for room item (to include delete button)
+        room_item = tk.Frame(self.room_list_frame)
+        
+        btn = tk.Button(room_item, relief="flat", cursor="hand2",
+                       anchor="w", padx=10, pady=5,
+                       command=lambda r=room: self.switch_room(r))
+        btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # Delete button for custom rooms
+        del_btn = None
+        if room != "general":
+            del_btn = tk.Button(room_item, text="✕", font=("Segoe UI", 8),
+                               activebackground=self.COLORS['accent_red'],
+                               activeforeground="#ffffff", relief="flat", cursor="hand2",
+                               command=lambda r=room: self.delete_room(r))
+            del_btn.pack(side=tk.RIGHT, padx=5)
+        return RoomItem(room_item, btn, del_btn)
+
+    def subscribe_new_rooms(self, rooms):
+        """
+        Subscribe room yang baru muncul sebagai background (mode mentions)
+        agar badge mention tetap live tanpa menerima pesan penuh
+        """
+        new_rooms = [room for room in rooms if room not in self.subscribed_rooms]
+        self.subscribed_rooms.update(new_rooms)
+        self.subscribing.update(new_rooms)
+        for start in range(0, len(new_rooms), SUBSCRIBE_BATCH):
+            try:
+                self.send_command(f"[SUBSCRIBE]{','.join(new_rooms[start:start + SUBSCRIBE_BATCH])}:mentions")
+            except:
+                pass
+
+    def retry_subscriptions(self):
+        """Subscribe ulang room yang command-nya mungkin ditolak [RATE_LIMITED]subscribe"""
+        self.subscribed_rooms -= self.subscribing
+        self.subscribing.clear()
+        self.subscribe_new_rooms(self.available_rooms)
 
     def delete_room(self, room_name):
         """Kirim request hapus room ke server"""
         if messagebox.askyesno("Delete Room", f"Apakah Anda yakin ingin menghapus room '#{room_name}'?"):
             if self.client:
-                self.client.send(f"[DELETE_ROOM]{room_name}\n".encode())
+                self.send_command(f"[DELETE_ROOM]{room_name}")
 
     def switch_room(self, room_name):
         """Ganti room aktif"""
@@ -232,11 +868,18 @@ class ChatApp:
             
         self.current_room = room_name
         self.room_label.config(text=f"# {room_name}")
+        self.unread_counts.pop(room_name, None)
+        self.subscribed_rooms.add(room_name)
+        self.subscribing.discard(room_name)  # Sudah jadi room aktif, jangan di-subscribe ulang
         
         # Kirim sinyal switch ke server
+        # Jika display room sudah ada, server cukup mengirim pesan yang terlewat (delta)
         if self.client:
             try:
-                self.client.send(f"[SWITCH_ROOM]{room_name}\n".encode())
+                if room_name in self.room_displays or room_name in self.synced_rooms:
+                    self.send_command(f"[SWITCH_ROOM]{room_name}:delta")
+                else:
+                    self.send_command(f"[SWITCH_ROOM]{room_name}")
             except:
                 pass
                 
@@ -251,6 +894,8 @@ class ChatApp:
         
         # Update room list icons
         self.update_room_list(self.available_rooms)
+        # Pesan room ini yang belum di-read receipt sekarang bisa terlihat
+        self.schedule_read_receipts()
 
     def get_or_create_room_display(self, room_name):
         """Ambil widget chat display untuk room tertentu, buat jika belum ada"""
@@ -278,20 +923,179 @@ class ChatApp:
             # Matikan edit
             display.configure(state='disabled')
             
+            # Scroll ke paling atas memuat pesan lama yang sudah dipotong
+            display.configure(yscrollcommand=lambda first, last, d=display: self.on_display_scroll(d, first, last))
+            
             self.room_displays[room_name] = display
+            self.scrollbacks[display] = Scrollback(room_name)
             
             # Beri pesan welcome
             self.add_message(f"--- Welcome to #{room_name} ---", "system_info", room=room_name)
             
-            # FITUR BARU: Request history dari server jika display baru dibuat
+            # Isi dari cache lalu minta pesan yang lebih baru ke server
             if self.client:
-                try:
-                    self.client.send(f"[GET_HISTORY]{room_name}\n".encode())
-                except:
-                    pass
+                self.load_room(room_name)
             
         return self.room_displays[room_name]
 
+    def load_room(self, room_name):
+        """
+        Render isi cache room lalu minta history ke server
+        Format: [GET_HISTORY]room:last_id (server hanya mengirim item sesudah last_id;
+        tanpa last_id, atau jika last_id sudah keluar dari history server, seluruh history)
+        Room yang sudah tersinkron lewat [SYNC] tidak perlu request lagi ([SWITCH_ROOM]room:delta)
+        """
+        last_id = self.render_from_cache(room_name)
+        if room_name in self.synced_rooms:
+            return
+        try:
+            if last_id:
+                self.send_command(f"[GET_HISTORY]{room_name}:{last_id}")
+            else:
+                self.send_command(f"[GET_HISTORY]{room_name}")
+        except:
+            pass
+
+    def start_sync(self):
+        """
+        Satu [SYNC] saat login: room aktif dirender dari cache, lalu server mengirim delta
+        room aktif dan room lain yang ada di cache dalam satu round trip (room aktif dulu)
+        Format: [SYNC]{"rooms": [{"room", "since"}]}
+        """
+        rooms = [(self.current_room, self.render_from_cache(self.current_room))]
+        if self.message_cache is not None:
+            try:
+                for room, last_id in self.message_cache.recent_rooms(SYNC_ROOMS):
+                    if room != self.current_room and len(rooms) < SYNC_ROOMS:
+                        rooms.append((room, last_id))
+            except sqlite3.Error as e:
+                print(f"Cache error: {e}")
+        # Server men-subscribe semua room ini sebagai background
+        self.subscribed_rooms.update(room for room, _ in rooms)
+        try:
+            self.send_command("[SYNC]" + json.dumps({"rooms": [{"room": room, "since": last_id}
+                                                               for room, last_id in rooms]}))
+        except:
+            pass
+
+    def apply_sync(self, data):
+        """
+        Delta satu room dari [SYNC_ROOM]: room yang sudah punya display langsung dirender,
+        room lain cukup ditulis ke cache dan dirender dari cache saat dibuka
+        Args:
+            data: Dictionary {"room", "messages": [baris asli server], "reactions": {msg_id: {emoji: [user]}}}
+        """
+        room = data.get("room")
+        messages = data.get("messages", [])
+        reactions = data.get("reactions", {})
+        display = self.room_displays.get(room)
+        if display is not None:
+            self.render_items(room, messages)
+            for msg_id, emojis in reactions.items():
+                if self.message_displays.get(msg_id) is display:
+                    self.message_reactions[msg_id] = emojis
+                    self.refresh_message_reactions(msg_id)
+                    self.cache_reactions(msg_id)
+        elif self.message_cache is not None:
+            for raw in messages:
+                item_id = item_id_of(raw)
+                if item_id:
+                    self.message_cache.add(room, item_id, raw)
+            for msg_id, emojis in reactions.items():
+                self.message_cache.set_reactions(room, msg_id, emojis)
+            self.synced_rooms.add(room)
+            self.schedule_cache_flush()
+
+    def render_from_cache(self, room_name):
+        """
+        Render isi cache room ke display-nya
+        Returns:
+            Item terakhir di cache (since untuk server), None jika cache kosong
+        """
+        if self.message_cache is None:
+            return None
+        try:
+            items, reactions = self.message_cache.load(room_name)
+        except sqlite3.Error as e:
+            print(f"Cache error: {e}")
+            return None
+        if items:
+            self.render_cached(self.room_displays[room_name], room_name, items, reactions)
+            return items[-1][0]
+        return None
+
+    def render_items(self, room_name, items, cached=False):
+        """
+        Tampilkan baris asli server (chat atau [FILE_SHARED]) berurutan di display room
+        Args:
+            cached: Item dari cache (tanpa read receipt, suara, atau ditulis ulang ke cache)
+        """
+        draining, self.ui_draining = self.ui_draining, True
+        try:
+            for raw in items:
+                if raw.startswith("[FILE_SHARED]"):
+                    try:
+                        shared = parse_file_shared(raw[13:])
+                    except ValueError:
+                        continue
+                    self.flush_inserts()
+                    self.display_file(*shared, cached=cached)
+                else:
+                    self.parse_chat_message(raw, room_name, cached=cached)
+            self.flush_inserts()
+        finally:
+            self.ui_draining = draining
+
+    def render_cached(self, display, room_name, items, reactions):
+        """Tampilkan item cache beserta reaction-nya"""
+        self.render_items(room_name, [raw for _, raw in items], cached=True)
+        
+        for item_id, data in reactions.items():
+            if self.message_displays.get(item_id) is display:
+                self.message_reactions[item_id] = data
+                self.refresh_message_reactions(item_id)
+        
+        # Cache penuh: pesan yang lebih lama masih bisa diminta lewat [GET_OLDER]
+        state = self.scrollbacks[display]
+        if len(items) >= MESSAGE_CACHE_ROOM_ITEMS and state.oldest_id is None:
+            state.oldest_id = items[0][0]
+            state.has_older = True
+
+    def cache_item(self, room, item_id, raw):
+        """Simpan satu item dari server ke cache (commit digabung tiap MESSAGE_CACHE_FLUSH)"""
+        if self.message_cache is None:
+            return
+        self.message_cache.add(room, item_id, raw)
+        self.schedule_cache_flush()
+
+    def cache_reactions(self, message_id):
+        """Simpan reaction pesan yang sedang tampil ke cache"""
+        if self.message_cache is None or message_id not in self.message_displays:
+            return
+        room = self.scrollbacks[self.message_displays[message_id]].room
+        self.message_cache.set_reactions(room, message_id, self.message_reactions.get(message_id, {}))
+        self.schedule_cache_flush()
+
+    def schedule_cache_flush(self):
+        if self.cache_timer is None:
+            self.cache_timer = self.scheduler.call_later(MESSAGE_CACHE_FLUSH, self.flush_message_cache)
+
+    def flush_message_cache(self):
+        self.cache_timer = None
+        try:
+            self.message_cache.flush()
+        except sqlite3.Error as e:
+            print(f"Cache error: {e}")
+
+    def on_close(self):
+        """Window ditutup: simpan tulisan cache yang belum di-commit"""
+        if self.message_cache is not None:
+            try:
+                self.message_cache.close()
+            except sqlite3.Error:
+                pass
+        self.root.destroy()
+
     def create_room_dialog(self):
         """Tampilkan dialog untuk membuat room baru"""
         dialog = tk.Toplevel(self.root)
@@ -322,7 +1126,7 @@ class ChatApp:
                     messagebox.showerror("Error", "Nama room tidak boleh ada spasi")
                     return
                 if self.client:
-                    self.client.send(f"[CREATE_ROOM]{name}\n".encode())
+                    self.send_command(f"[CREATE_ROOM]{name}")
                 dialog.destroy()
             
         btn = tk.Button(dialog, text="Create Room", font=self.font_small,
@@ -398,6 +1202,10 @@ class ChatApp:
         
         if not filepath:
             return
+        
+        if self.is_rate_limited("file"):
+            messagebox.showerror("Error", "Terlalu banyak upload, coba lagi sebentar lagi.")
+            return
             
         # Limit ukuran 5MB
         file_size = os.path.getsize(filepath)
@@ -414,71 +1222,123 @@ class ChatApp:
             # Format: [FILE]room:filename:size:base64
             msg = f"[FILE]{self.current_room}:{filename}:{file_size}:{b64_data}"
             if self.client:
-                self.client.send((msg + "\n").encode())
+                # Upload tidak disimpan di outbox seperti chat: saat terputus langsung gagal
+                if not self.send_command(msg):
+                    messagebox.showerror("Error", f"Gagal mengirim {filename}: koneksi terputus, coba lagi setelah tersambung.")
+                    return
                 self.add_message(f"📤 Uploading {filename}...", "system_info")
         except Exception as e:
             messagebox.showerror("Error", f"Gagal mengirim file: {e}")
 
-    def display_file(self, room, file_id, filename, sender, size, b64_data):
-        """Tampilkan file dalam chat"""
-        import base64
+    def display_file(self, room, file_id, filename, sender, size, preview_b64, cached=False):
+        """
+        Tampilkan file dalam chat
+        preview_b64 berisi thumbnail dari server (kosong untuk file non-gambar),
+        file asli baru diunduh saat user menekan tombol download
+        Args:
+            cached: Item dari cache pesan (tidak ditulis ulang ke cache)
+        """
+        state = self.scrollbacks[self.get_or_create_room_display(room)]
+        if file_id in state.file_ids:
+            return
+        state.file_ids.add(file_id)
+        if not cached:
+            self.cache_item(room, file_id, f"[FILE_SHARED]{room}:{file_id}:{filename}:{sender}:{size}:{preview_b64}")
         
-        # Decode data
-        try:
-            file_bytes = base64.b64decode(b64_data)
-            
-            # Jika gambar, tampilkan preview
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                self.display_image(filename, sender, file_bytes)
-            else:
-                self.display_file_attachment(filename, sender, size, b64_data)
-        except Exception as e:
-            print(f"Error decoding file: {e}")
+        # Jika gambar, tampilkan preview
+        if preview_b64 and filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
+            self.display_image(filename, sender, preview_b64, room=room, file_id=file_id)
+        else:
+            self.display_file_attachment(filename, sender, size, file_id, room=room)
 
-    def display_image(self, filename, sender, image_bytes, room=None):
-        """Tampilkan preview gambar inline"""
-        from PIL import Image, ImageTk
-        import io
-        
+    def display_image(self, filename, sender, preview_b64, room=None, file_id=None):
+        """
+        Tampilkan preview gambar inline
+        Header dan tombol langsung di-insert; gambar diambil dari cache atau di-decode
+        di thread pool lalu disisipkan di posisi mark-nya (place_preview)
+        """
         target_room = room if room else self.current_room
         display = self.get_or_create_room_display(target_room)
+        key = (file_id, PREVIEW_MAX_WIDTH)
+        image = self.preview_cache.get(key) if file_id else None
         
-        try:
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Resize agar tidak terlalu besar
-            max_width = 300
-            if image.width > max_width:
-                ratio = max_width / float(image.width)
-                new_height = int(float(image.height) * ratio)
-                image = image.resize((max_width, new_height), Image.Resampling.LANCZOS)
-                
-            photo = ImageTk.PhotoImage(image)
-            self.images.append(photo)  # Simpan reference
-            
-            display.configure(state='normal')
-            
-            # Message header
-            color = get_user_color(sender)
-            display.insert(tk.END, f"\n● {sender} shared an image:\n", ("image_header",))
-            display.tag_add(f"color_{sender}", "end-2c linestart", "end-2c lineend")
-            display.tag_configure(f"color_{sender}", foreground=color)
-            
-            # Insert image
-            display.image_create(tk.END, image=photo)
+        at_bottom = self.is_at_bottom(display)
+        display.configure(state='normal')
+        
+        # Message header
+        color = get_user_color(sender)
+        display.insert(tk.END, f"\n● {sender} shared an image:\n", ("image_header",))
+        display.tag_add(f"color_{sender}", "end-2c linestart", "end-2c lineend")
+        display.tag_configure(f"color_{sender}", foreground=color)
+        
+        # Posisi gambar (reference PhotoImage disimpan di scrollback sampai barisnya dipotong)
+        embed = self.track_embed(display)
+        display.insert(tk.END, "\n")
+        
+        # Preview hanya thumbnail, gambar asli diunduh on demand
+        if file_id:
+            btn = tk.Button(display, text="⬇️ Original",
+                           bg=self.COLORS['bg_hover'], fg=self.COLORS['text_primary'],
+                           font=self.font_tiny, relief="flat", cursor="hand2",
+                           command=lambda: self.download_file(filename, file_id))
+            self.track_embed(display, widget=btn)
+            display.window_create(tk.END, window=btn)
             display.insert(tk.END, "\n")
-            
+        
+        display.configure(state='disabled')
+        if image is not None:
+            self.place_preview(display, embed, image)
+        elif key in self.preview_waiters:
+            # Gambar yang sama sedang di-decode (mis. tampil di dua room)
+            self.preview_waiters[key].append((display, embed))
+        else:
+            if self.preview_pool is None:
+                self.preview_pool = ThreadPoolExecutor(PREVIEW_WORKERS, thread_name_prefix="preview")
+            self.preview_waiters[key] = [(display, embed)]
+            future = self.preview_pool.submit(decode_preview, preview_b64, PREVIEW_MAX_WIDTH)
+            future.add_done_callback(lambda future: self.post_ui(self.on_preview_decoded, key, filename, sender, future))
+        if at_bottom:
             display.see(tk.END)
-            display.configure(state='disabled')
-        except Exception as e:
-            self.add_message(f"Error loading image from {sender}: {filename}", "system_error", room=target_room)
+            self.trim_scrollback(display)
+
+    def on_preview_decoded(self, key, filename, sender, future):
+        """Hasil decode dari thread pool (dipanggil main loop lewat antrean UI)"""
+        waiters = self.preview_waiters.pop(key, [])
+        try:
+            image = future.result()
+        except Exception:
+            for display, embed in waiters:
+                if embed[0] is not None:
+                    self.add_message(f"Error loading image from {sender}: {filename}", "system_error",
+                                     room=self.scrollbacks[display].room)
+            return
+        if key[0]:
+            self.preview_cache.put(key, image)
+        for display, embed in waiters:
+            self.place_preview(display, embed, image)
 
-    def display_file_attachment(self, filename, sender, size, b64_data, room=None):
+    def place_preview(self, display, embed, image):
+        """Sisipkan preview yang sudah siap di mark embed (dilewati jika barisnya sudah dipotong)"""
+        from PIL import ImageTk
+        
+        if embed[0] is None:
+            return
+        at_bottom = self.is_at_bottom(display)
+        photo = ImageTk.PhotoImage(image)
+        embed[2] = photo
+        display.configure(state='normal')
+        display.image_create(embed[0], image=photo)
+        display.configure(state='disabled')
+        if at_bottom:
+            display.see(tk.END)
+
+    def display_file_attachment(self, filename, sender, size, file_id, room=None):
         """Tampilkan file attachment dengan tombol download"""
         target_room = room if room else self.current_room
         display = self.get_or_create_room_display(target_room)
         size_kb = int(size) / 1024
         
+        at_bottom = self.is_at_bottom(display)
         display.configure(state='normal')
         
         # File info
@@ -490,19 +1350,21 @@ class ChatApp:
         btn = tk.Button(btn_frame, text=f"⬇️ Download {filename}", 
                        bg=self.COLORS['accent_blue'], fg="#ffffff",
                        font=self.font_tiny, relief="flat", cursor="hand2",
-                       command=lambda: self.download_file(filename, b64_data))
+                       command=lambda: self.download_file(filename, file_id))
         btn.pack()
         
+        self.track_embed(display, widget=btn_frame)
         display.window_create(tk.END, window=btn_frame)
         display.insert(tk.END, "\n")
         
-        display.see(tk.END)
         display.configure(state='disabled')
+        if at_bottom:
+            display.see(tk.END)
+            self.trim_scrollback(display)
 
-    def download_file(self, filename, b64_data):
-        """Simpan file ke komputer user"""
+    def download_file(self, filename, file_id):
+        """Pilih lokasi simpan lalu minta file asli ke server ([GET_FILE])"""
         from tkinter import filedialog
-        import base64
         
         save_path = filedialog.asksaveasfilename(
             initialfile=filename,
@@ -511,13 +1373,33 @@ class ChatApp:
         )
         
         if save_path:
+            if self.is_rate_limited("history"):
+                messagebox.showerror("Error", "Terlalu banyak permintaan, coba lagi sebentar lagi.")
+                return
+            self.pending_downloads[file_id] = save_path
             try:
-                file_bytes = base64.b64decode(b64_data)
-                with open(save_path, "wb") as f:
-                    f.write(file_bytes)
-                messagebox.showinfo("Success", f"File saved to {save_path}")
+                self.send_command(f"[GET_FILE]{file_id}")
             except Exception as e:
-                messagebox.showerror("Error", f"Gagal menyimpan file: {e}")
+                del self.pending_downloads[file_id]
+                messagebox.showerror("Error", f"Gagal meminta file: {e}")
+
+    def save_downloaded_file(self, file_id, b64_data):
+        """Simpan file asli dari [FILE_DATA] ke lokasi yang dipilih user"""
+        import base64
+        
+        save_path = self.pending_downloads.pop(file_id, None)
+        if not save_path:
+            return
+        if not b64_data:
+            messagebox.showerror("Error", "File tidak ditemukan di server")
+            return
+        try:
+            file_bytes = base64.b64decode(b64_data)
+            with open(save_path, "wb") as f:
+                f.write(file_bytes)
+            messagebox.showinfo("Success", f"File saved to {save_path}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Gagal menyimpan file: {e}")
     
     def update_login_theme(self):
         """Update tema untuk login screen"""
@@ -544,6 +1426,7 @@ class ChatApp:
             self.user_count_label.config(bg=self.COLORS['bg_secondary'], fg=self.COLORS['text_muted'])
             self.sidebar_sep2.config(bg=self.COLORS['border'])
             self.user_list_frame.config(bg=self.COLORS['bg_secondary'])
+            self.user_rows_frame.config(bg=self.COLORS['bg_secondary'])
             
             # Refresh user list to update frames/labels inside it
             if hasattr(self, 'last_users_data'):
@@ -737,9 +1620,14 @@ class ChatApp:
         self.sidebar_sep2 = tk.Frame(self.sidebar, bg=self.COLORS['border'], height=1)
         self.sidebar_sep2.pack(fill=tk.X)
         
-        # User list container
+        # User list container (baris user divirtualisasi, lihat render_user_rows)
         self.user_list_frame = tk.Frame(self.sidebar, bg=self.COLORS['bg_secondary'])
         self.user_list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.user_scrollbar = tk.Scrollbar(self.user_list_frame, orient=tk.VERTICAL, command=self.on_user_scroll)
+        self.user_rows_frame = tk.Frame(self.user_list_frame, bg=self.COLORS['bg_secondary'])
+        self.user_rows_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.user_rows_frame.bind("<Configure>", self.on_user_list_resize)
+        self.bind_user_wheel(self.user_rows_frame)
         
         # ===== CHAT AREA =====
         self.chat_area = tk.Frame(self.main_container, bg=self.COLORS['bg_primary'])
@@ -871,35 +1759,40 @@ class ChatApp:
             return
         
         # Jika belum typing, kirim [TYPING] ke server
-        if not self.is_typing and self.client:
+        if not self.is_typing and self.client and not self.is_rate_limited("typing"):
             self.is_typing = True
             try:
-                self.client.send("[TYPING]\n".encode())
+                self.send_command("[TYPING]")
             except:
                 pass
     
     def on_key_release(self, event):
         """
         Handler ketika user release key
-        Set timer untuk auto-stop typing setelah 2 detik idle
+        Geser batas idle typing; timer hanya dibuat jika belum ada (bukan per ketikan)
         """
-        # Cancel timer sebelumnya jika ada
-        if self.typing_timer:
-            self.typing_timer.cancel()
-        
-        # Set timer baru untuk stop typing
-        self.typing_timer = threading.Timer(2.0, self.stop_typing)
-        self.typing_timer.start()
+        self.typing_deadline = time.monotonic() + TYPING_IDLE
+        if self.typing_timer is None:
+            self.typing_timer = self.scheduler.call_later(TYPING_IDLE, self.check_typing_idle)
+    
+    def check_typing_idle(self):
+        """Timer typing jatuh tempo: stop typing jika memang sudah idle, jika tidak tunggu sisanya"""
+        remaining = self.typing_deadline - time.monotonic()
+        if remaining > 0:
+            self.typing_timer = self.scheduler.call_later(remaining, self.check_typing_idle)
+            return
+        self.typing_timer = None
+        self.stop_typing()
     
     def stop_typing(self):
         """
         Kirim stop typing indicator ke server
-        Dipanggil setelah 2 detik tidak ada input
+        Dipanggil setelah TYPING_IDLE detik tidak ada input
         """
         if self.is_typing and self.client:
             self.is_typing = False
             try:
-                self.client.send("[STOP_TYPING]\n".encode())
+                self.send_command("[STOP_TYPING]")
             except:
                 pass
     
@@ -929,8 +1822,8 @@ class ChatApp:
         Tampilkan reaction menu pada right-click
         Simpan posisi klik untuk tracking message
         """
-        # Simpan index posisi klik
-        self.last_click_index = self.chat_display.index(f"@{event.x},{event.y}")
+        # Simpan display dan index posisi klik
+        self.last_click = (event.widget, event.widget.index(f"@{event.x},{event.y}"))
         
         # Tampilkan menu di posisi mouse
         try:
@@ -944,27 +1837,18 @@ class ChatApp:
         Args:
             emoji: Emoji yang dipilih untuk reaction
         """
-        if not hasattr(self, 'last_click_index'):
+        if not hasattr(self, 'last_click'):
             return
         
-        # Cari message ID terdekat dari posisi klik
-        # Scan backwards untuk find message dengan [MSG_ID:...]
-        click_line = int(self.last_click_index.split('.')[0])
-        
-        # Cari message ID di sekitar click position
-        found_msg_id = None
-        for msg_id, pos in self.message_positions.items():
-            msg_line = int(pos.split('.')[0])
-            # Check jika click dalam range message (±5 lines)
-            if abs(click_line - msg_line) <= 5:
-                found_msg_id = msg_id
-                break
+        # Pesan yang memuat posisi klik (binary search mark pesan di display itu)
+        display, index = self.last_click
+        found_msg_id = self.message_at(display, index)
         
         if found_msg_id and self.client:
             # Kirim reaction ke server
             # Format: [REACTION]message_id:emoji
             try:
-                self.client.send(f"[REACTION]{found_msg_id}:{emoji}\n".encode())
+                self.send_command(f"[REACTION]{found_msg_id}:{emoji}")
             except:
                 pass
     
@@ -992,8 +1876,9 @@ class ChatApp:
             self.message_reactions[message_id][emoji].append(username)
         
         # Update display jika message masih ada
-        if message_id in self.message_positions:
+        if message_id in self.message_displays:
             self.refresh_message_reactions(message_id)
+            self.cache_reactions(message_id)
     
     def refresh_message_reactions(self, message_id):
         """
@@ -1001,20 +1886,19 @@ class ChatApp:
         Args:
             message_id: ID pesan yang akan di-refresh
         """
-        if message_id not in self.message_positions:
+        display = self.message_displays.get(message_id)
+        if display is None:
             return
         
         # Cari tag untuk reaction line
         reaction_tag = f"reaction_{message_id}"
+        at_bottom = self.is_at_bottom(display)
+        display.configure(state='normal')
         
         # Hapus reaction line lama jika ada
-        self.chat_display.configure(state='normal')
-        
-        # Cari semua text dengan tag ini dan hapus
-        ranges = self.chat_display.tag_ranges(reaction_tag)
+        ranges = display.tag_ranges(reaction_tag)
         if ranges:
-            for i in range(0, len(ranges), 2):
-                self.chat_display.delete(ranges[i], ranges[i+1])
+            display.delete(ranges[0], ranges[-1])
         
         # Tambahkan reaction line baru jika ada reactions
         if message_id in self.message_reactions and self.message_reactions[message_id]:
@@ -1024,15 +1908,13 @@ class ChatApp:
                 count = len(users)
                 reaction_str += f"{emoji} {count}  "
             
-            # Insert di posisi message
-            pos = self.message_positions[message_id]
-            line_num = int(pos.split('.')[0])
-            insert_pos = f"{line_num + 2}.0"  # 2 lines after message
-            
-            self.chat_display.insert(insert_pos, reaction_str + "\n", (reaction_tag, 'reaction'))
+            # Baris tepat setelah isi pesan (blok pesan: baris kosong, header, isi)
+            insert_pos = f"{message_mark(message_id)} +3l linestart"
+            display.insert(insert_pos, reaction_str + "\n", (reaction_tag, 'reaction'))
         
-        self.chat_display.configure(state='disabled')
-        self.chat_display.see(tk.END)
+        display.configure(state='disabled')
+        if at_bottom:
+            display.see(tk.END)
     
     # ==================== MESSAGE STATUS ====================
     def update_message_status(self, message_id, status):
@@ -1056,7 +1938,8 @@ class ChatApp:
         Args:
             message_id: ID pesan yang akan di-refresh
         """
-        if message_id not in self.message_positions:
+        display = self.message_displays.get(message_id)
+        if display is None:
             return
         
         status = self.message_status.get(message_id, {}).get('status', 'sent')
@@ -1080,36 +1963,70 @@ class ChatApp:
         # Update atau create status tag
         status_tag = f"status_{message_id}"
         
-        self.chat_display.configure(state='normal')
+        display.configure(state='normal')
         
         # Hapus status lama
-        ranges = self.chat_display.tag_ranges(status_tag)
+        ranges = display.tag_ranges(status_tag)
         if ranges:
-            for i in range(0, len(ranges), 2):
-                self.chat_display.delete(ranges[i], ranges[i+1])
+            display.delete(ranges[0], ranges[-1])
         
-        # Tambahkan status baru di akhir message line
-        pos = self.message_positions[message_id]
-        line_num = int(pos.split('.')[0])
-        end_pos = f"{line_num + 1}.end"  # End of message text line
+        # Tambahkan status baru di akhir baris isi pesan
+        end_pos = f"{message_mark(message_id)} +2l lineend"
         
         # Configure color tag
-        self.chat_display.tag_configure(status_tag, foreground=color, font=("Segoe UI", 8))
-        self.chat_display.insert(end_pos, f" {icon}", (status_tag, 'status'))
+        display.tag_configure(status_tag, foreground=color, font=("Segoe UI", 8))
+        display.insert(end_pos, f" {icon}", (status_tag, 'status'))
         
-        self.chat_display.configure(state='disabled')
+        display.configure(state='disabled')
     
-    def send_read_receipt(self, message_id):
+    def queue_read_receipt(self, room, message_id):
         """
-        Kirim read receipt ke server untuk message
-        Args:
-            message_id: ID pesan yang sudah dibaca
+        Catat pesan orang lain yang perlu read receipt
+        Dikirim gabungan oleh flush_read_receipts setelah pesan terlihat di room aktif
         """
-        if self.client:
-            try:
-                self.client.send(f"[READ]{message_id}\n".encode())
-            except:
-                pass
+        self.pending_reads.setdefault(room, []).append(message_id)
+        if room == self.current_room:
+            self.schedule_read_receipts()
+    
+    def schedule_read_receipts(self):
+        """Jadwalkan flush_read_receipts (paling banyak satu per READ_RECEIPT_INTERVAL)"""
+        if self.read_timer is None and self.pending_reads.get(self.current_room):
+            self.read_timer = self.scheduler.call_later(READ_RECEIPT_INTERVAL, self.flush_read_receipts)
+    
+    def flush_read_receipts(self):
+        """
+        Kirim satu [READ]room:id1,id2,... untuk pesan room aktif yang sedang terlihat
+        Pesan yang belum terlihat (di luar viewport) tetap menunggu scroll berikutnya
+        """
+        self.read_timer = None
+        room = self.current_room
+        message_ids = self.pending_reads.get(room)
+        display = self.room_displays.get(room)
+        if not message_ids or display is None or not self.client:
+            return
+        if self.is_rate_limited("read"):
+            self.schedule_read_receipts()
+            return
+        
+        visible = []
+        waiting = []
+        for message_id in message_ids:
+            if self.message_displays.get(message_id) is not display:
+                continue  # Sudah terpotong dari scrollback
+            # bbox None = baris isi pesan tidak ada di viewport
+            if display.bbox(f"{message_mark(message_id)} +2l") is None:
+                waiting.append(message_id)
+            else:
+                visible.append(message_id)
+        if waiting:
+            self.pending_reads[room] = waiting
+        else:
+            del self.pending_reads[room]
+        try:
+            for i in range(0, len(visible), READ_BATCH_MAX):
+                self.send_command(f"[READ]{room}:{','.join(visible[i:i + READ_BATCH_MAX])}")
+        except:
+            pass
     
     # ==================== USER LIST ====================
     def update_user_list(self, users_data):
@@ -1128,41 +2045,104 @@ class ChatApp:
             self.online_users = list(users_data.keys())
             users_status = users_data
             
-        # Clear existing user labels
-        for widget in self.user_list_frame.winfo_children():
-            widget.destroy()
-            
         # Update user count
         self.user_count_label.config(text=f"{len(self.online_users)} users online")
         
-        # Add labels for each user
         # Sort users agar diri sendiri di paling atas
         sorted_users = sorted(self.online_users, key=lambda x: (x != self.username, x.lower()))
-        
-        for user in sorted_users:
-            room = users_status.get(user, "general")
-            user_color = get_user_color(user)
-            
-            user_frame = tk.Frame(self.user_list_frame, bg=self.COLORS['bg_secondary'], pady=5)
-            user_frame.pack(fill=tk.X)
-            
-            # Avatar circle simulation
-            dot = tk.Label(user_frame, text="●", font=("Segoe UI", 14),
-                          bg=self.COLORS['bg_secondary'], fg=user_color)
-            dot.pack(side=tk.LEFT)
-            
-            # Name and status container
-            name_cnt = tk.Frame(user_frame, bg=self.COLORS['bg_secondary'])
-            name_cnt.pack(side=tk.LEFT, padx=8)
-            
-            display_name = f"{user} (You)" if user == self.username else user
-            tk.Label(name_cnt, text=display_name, font=self.font_small,
-                    bg=self.COLORS['bg_secondary'], fg=self.COLORS['text_primary']).pack(anchor="w")
-            
-            # Room status text
-            room_status = f"in # {room}"
-            tk.Label(name_cnt, text=room_status, font=("Segoe UI", 8),
-                    bg=self.COLORS['bg_secondary'], fg=self.COLORS['text_muted']).pack(anchor="w")           
+        self.user_rows_data = [(user, users_status.get(user, "general")) for user in sorted_users]
+        self.render_user_rows()
+    
+    def visible_user_rows(self):
+        """Jumlah baris user yang muat di sidebar"""
+        return max(1, self.user_rows_frame.winfo_height() // USER_ROW_HEIGHT)
+    
+    def render_user_rows(self):
+        """
+        Tampilkan user_rows_data mulai user_offset di pool baris yang terlihat
+        Baris hanya di-config jika user/room/tema yang ditampilkan berubah
+        """
+        data = self.user_rows_data
+        visible = self.visible_user_rows()
+        self.user_offset = max(0, min(self.user_offset, len(data) - visible))
+        while len(self.user_rows) < min(visible, len(data)):
+            self.user_rows.append(self.create_user_row())
+        
+        bg = self.COLORS['bg_secondary']
+        for i, row in enumerate(self.user_rows):
+            index = self.user_offset + i
+            if i >= visible or index >= len(data):
+                if row.packed:
+                    row.frame.pack_forget()
+                    row.packed = False
+                continue
+            user, room = data[index]
+            key = (user, room, self.current_theme)
+            if row.key != key:
+                row.key = key
+                display_name = f"{user} (You)" if user == self.username else user
+                for widget in (row.frame, row.name_container):
+                    widget.config(bg=bg)
+                row.dot.config(bg=bg, fg=get_user_color(user))
+                row.name.config(text=display_name, bg=bg, fg=self.COLORS['text_primary'])
+                # Room status text
+                row.status.config(text=f"in # {room}", bg=bg, fg=self.COLORS['text_muted'])
+            if not row.packed:
+                row.frame.pack(fill=tk.X)
+                row.packed = True
+        
+        # Scrollbar hanya jika user tidak muat semua
+        if len(data) > visible:
+            self.user_scrollbar.set(self.user_offset / len(data), (self.user_offset + visible) / len(data))
+            if not self.user_scrollbar.winfo_ismapped():
+                self.user_scrollbar.pack(side=tk.RIGHT, fill=tk.Y, before=self.user_rows_frame)
+        elif self.user_scrollbar.winfo_ismapped():
+            self.user_scrollbar.pack_forget()
+    
+    def create_user_row(self):
+        """Buat satu baris user kosong (tinggi tetap USER_ROW_HEIGHT)"""
+        user_frame = tk.Frame(self.user_rows_frame, height=USER_ROW_HEIGHT)
+        user_frame.pack_propagate(False)
+        
+        # Avatar circle simulation
+        dot = tk.Label(user_frame, text="●", font=("Segoe UI", 14))
+        dot.pack(side=tk.LEFT)
+        
+        # Name and status container
+        name_cnt = tk.Frame(user_frame)
+        name_cnt.pack(side=tk.LEFT, padx=8)
+        name = tk.Label(name_cnt, font=self.font_small)
+        name.pack(anchor="w")
+        status = tk.Label(name_cnt, font=("Segoe UI", 8))
+        status.pack(anchor="w")
+        
+        for widget in (user_frame, dot, name_cnt, name, status):
+            self.bind_user_wheel(widget)
+        return UserRow(user_frame, dot, name_cnt, name, status)
+    
+    def bind_user_wheel(self, widget):
+        widget.bind("<MouseWheel>", self.on_user_wheel)
+        widget.bind("<Button-4>", self.on_user_wheel)
+        widget.bind("<Button-5>", self.on_user_wheel)
+    
+    def on_user_wheel(self, event):
+        """Scroll daftar user dengan mouse wheel (Windows: delta, X11: Button-4/5)"""
+        step = -3 if (event.num == 4 or event.delta > 0) else 3
+        self.user_offset += step
+        self.render_user_rows()
+    
+    def on_user_scroll(self, *args):
+        """Command scrollbar daftar user: ("moveto", fraksi) atau ("scroll", n, "units"/"pages")"""
+        if args[0] == "moveto":
+            self.user_offset = int(round(float(args[1]) * len(self.user_rows_data)))
+        elif args[0] == "scroll":
+            step = self.visible_user_rows() if args[2] == "pages" else 1
+            self.user_offset += int(args[1]) * step
+        self.render_user_rows()
+    
+    def on_user_list_resize(self, event):
+        """Tinggi sidebar berubah: jumlah baris terlihat ikut berubah"""
+        self.render_user_rows()
     
     # ==================== CONNECTION ====================
     def connect_server(self):
@@ -1172,10 +2152,17 @@ class ChatApp:
             messagebox.showwarning("Peringatan", "Username tidak boleh kosong!")
             return
         
+        if MESSAGE_CACHE and self.message_cache is None:
+            try:
+                self.message_cache = MessageCache(cache_path(self.username), MESSAGE_CACHE_BYTES,
+                                                  MESSAGE_CACHE_ROOM_ITEMS)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Cache pesan nonaktif: {e}")
+        
         try:
-            self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client.connect((SERVER_IP, PORT))
-            self.client.send((self.username + "\n").encode())
+            self.client = Connection((SERVER_IP, PORT), self.hello_fields, self.process_message,
+                                     self.on_connection_state)
+            self.client.connect()
             
             # Switch ke chat
             self.login_frame.pack_forget()
@@ -1184,247 +2171,488 @@ class ChatApp:
             self.user_label.config(text=f"👤 Logged in as: {self.username}")
             
             self.add_message(f"🎉 Selamat datang di PyRTC, {self.username}!", "system_info")
-            
-            # Start receiver thread
-            threading.Thread(target=self.receive_messages, daemon=True).start()
             self.msg_entry.focus_set()
             
-            # FITUR BARU: Request history untuk default room (general)
-            try:
-                self.client.send("[GET_HISTORY]general\n".encode())
-            except:
-                pass
+            # Display general sudah dibuat sebelum login: isi dari cache, lalu satu [SYNC]
+            # untuk pesan yang lebih baru di semua room yang di-cache
+            self.start_sync()
             
         except Exception as e:
+            self.client = None
             messagebox.showerror("Error", f"Gagal terhubung: {e}")
     
-    def receive_messages(self):
+    def hello_fields(self):
         """
-        Thread untuk receive messages dari server
-        Handle berbagai jenis message protocol
+        Field [HELLO] untuk Connection (dipanggil thread connection tiap connect)
+        last_id: pesan terakhir di display room aktif, server hanya mengirim pesan sesudahnya
         """
-        buffer = ""
-        while True:
-            try:
-                data = self.client.recv(4096).decode()
-                if not data:
-                    break
-                
-                buffer += data
-                while "\n" in buffer:
-                    msg, buffer = buffer.split("\n", 1)
-                    if msg:
-                        self.process_message(msg)
-            except:
+        hello = {"username": self.username, "room": self.current_room}
+        display = self.room_displays.get(self.current_room)
+        state = self.scrollbacks.get(display) if display is not None else None
+        if state is not None and state.message_ids:
+            hello["last_id"] = state.message_ids[-1]
+        return hello
+    
+    def on_connection_state(self, state, delay_ms):
+        """Callback Connection (thread connection), tampilan diupdate lewat antrean UI"""
+        self.post_ui(self.show_connection_state, state, delay_ms)
+    
+    def show_connection_state(self, state, delay_ms):
+        """Status koneksi di header dan pesan sistem di room aktif"""
+        if state == "connected":
+            # Server sudah mengaktifkan room ini dan mengirim pesan yang terlewat saja
+            self.subscribed_rooms = {self.current_room}  # Subscription lama hilang bersama koneksi
+            self.subscribing.clear()
+            self.synced_rooms.clear()
+            self.status_dot.config(fg=self.COLORS['accent_green'])
+            self.status_text.config(text="Connected", fg=self.COLORS['accent_green'])
+            self.add_message("✅ Tersambung kembali ke server", "system_join")
+        elif state == "disconnected":
+            self.add_message("⚠️ Koneksi ke server terputus", "system_leave")
+            self.status_dot.config(fg=self.COLORS['accent_red'])
+            self.status_text.config(text="Disconnected", fg=self.COLORS['accent_red'])
+        else:
+            self.add_message(f"🔄 Menyambung ulang dalam {delay_ms / 1000:.1f} detik...", "system_info")
+            self.status_dot.config(fg=self.COLORS['accent_yellow'])
+            self.status_text.config(text="Reconnecting...", fg=self.COLORS['accent_yellow'])
+    
+    def is_rate_limited(self, command_class):
+        """True jika server masih membatasi kelas command ini"""
+        return time.time() < self.rate_limited_until.get(command_class, 0)
+    
+    def send_command(self, text):
+        """
+        Antrekan satu pesan/command ke server (dikirim thread writer Connection)
+        Args:
+            text: Pesan tanpa newline
+        Returns:
+            False jika koneksi sedang terputus dan command dibuang
+        """
+        return self.client.send(text)
+    
+    def post_ui(self, fn, *args):
+        """
+        Jadwalkan update UI dari thread mana pun (dijalankan main loop lewat drain_ui_queue)
+        Args:
+            fn: Method yang menyentuh widget Tk
+            args: Argumen fn (diambil saat ini, bukan saat dijalankan)
+        """
+        self.ui_queue.append((fn, args))
+    
+    def drain_ui_queue(self):
+        """
+        Jalankan update UI yang antre, sekali per frame (UI_FRAME_MS) dengan budget waktu
+        agar replay history / room ramai tidak membekukan window
+        Insert teks berurutan ke room yang sama digabung jadi satu edit (flush_inserts)
+        """
+        queue = self.ui_queue
+        deadline = time.perf_counter() + UI_FRAME_BUDGET
+        self.ui_draining = True
+        try:
+            while queue and time.perf_counter() < deadline:
+                fn, args = queue.popleft()
+                if fn not in self.text_ops:
+                    # Update lain (status, reaction, gambar) melihat semua teks sebelumnya
+                    self.flush_inserts()
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"UI update error: {e}")
+        finally:
+            self.ui_draining = False
+            self.flush_inserts()
+            self.scheduler.run_due()
+            self.root.after(UI_FRAME_MS, self.drain_ui_queue)
+    
+    def insert_text(self, display, segments, marks=()):
+        """
+        Tambahkan teks ke akhir display room
+        Selama drain_ui_queue, insert ke display yang sama dikumpulkan dulu
+        Args:
+            display: Widget display room
+            segments: List (teks, tag)
+            marks: List (msg_id, jumlah newline di segments sebelum awal blok pesan)
+        """
+        batch = self.insert_batch
+        if batch is not None and batch[0] is not display:
+            self.flush_inserts()
+            batch = None
+        if batch is None:
+            batch = self.insert_batch = [display, [], [], 0]
+        for msg_id, newlines in marks:
+            batch[2].append((msg_id, batch[3] + newlines))
+        for text, tag in segments:
+            batch[1].extend((text, tag))
+            batch[3] += text.count("\n")
+        if not self.ui_draining:
+            self.flush_inserts()
+    
+    def flush_inserts(self):
+        """Tulis insert yang terkumpul dalam satu edit widget, scroll sekali jika user di bawah"""
+        batch, self.insert_batch = self.insert_batch, None
+        if batch is None:
+            return
+        display, args, marks, _ = batch
+        at_bottom = self.is_at_bottom(display)
+        start = display.index("end-1c")
+        display.configure(state='normal')
+        display.insert(tk.END, *args)
+        display.configure(state='disabled')
+        self.set_message_marks(display, start, marks, self.scrollbacks[display].message_ids.extend)
+        if at_bottom:
+            display.see(tk.END)
+            # Hanya dipotong saat user di bawah (tidak sedang membaca pesan lama)
+            self.trim_scrollback(display)
+    
+    def set_message_marks(self, display, start, marks, add_ids):
+        """
+        Pasang mark awal blok pesan untuk teks yang baru di-insert di start
+        Args:
+            start: Index awal insert (sebelum insert)
+            marks: List (msg_id, jumlah newline sebelum awal blok pesan)
+            add_ids: fn(list msg_id) untuk mencatat urutan di Scrollback
+        """
+        line, column = start.split(".")
+        for msg_id, newlines in marks:
+            index = start if newlines == 0 else f"{int(line) + newlines}.0"
+            mark = message_mark(msg_id)
+            display.mark_set(mark, index)
+            # Gravity right: baris reaction yang disisipkan tepat di awal blok pesan
+            # berikutnya tetap masuk interval pesan sebelumnya
+            display.mark_gravity(mark, "right")
+            self.message_displays[msg_id] = display
+        add_ids([msg_id for msg_id, _ in marks])
+    
+    def message_at(self, display, index):
+        """
+        msg_id pesan yang memuat index (interval: awal blok pesan sampai awal pesan berikutnya)
+        Binary search atas mark pesan yang urut tampil, O(log n) panggilan Tk
+        """
+        state = self.scrollbacks.get(display)
+        if state is None:
+            return None
+        message_ids = state.message_ids
+        low, high = 0, len(message_ids)
+        while low < high:
+            middle = (low + high) // 2
+            if display.compare(message_mark(message_ids[middle]), "<=", index):
+                low = middle + 1
+            else:
+                high = middle
+        return message_ids[low - 1] if low else None
+    
+    def is_at_bottom(self, display):
+        """True jika user tidak sedang scroll ke atas (autoscroll boleh dilakukan)"""
+        return display.yview()[1] >= 0.999
+    
+    # ==================== SCROLLBACK ====================
+    def track_embed(self, display, widget=None, photo=None):
+        """
+        Catat gambar/widget yang akan di-embed di akhir display
+        Mark (gravity left) ikut bergeser bersama teks, jadi saat trim ketahuan
+        embed mana yang ada di baris yang dipotong
+        Returns:
+            Entri embed [mark, widget, photo] (photo bisa diisi belakangan)
+        """
+        mark = f"embed_{self.next_embed_id}"
+        self.next_embed_id += 1
+        display.mark_set(mark, "end-1c")
+        display.mark_gravity(mark, "left")
+        embed = [mark, widget, photo]
+        self.scrollbacks[display].embeds.append(embed)
+        return embed
+    
+    def trim_scrollback(self, display):
+        """
+        Potong baris tertua jika display melebihi SCROLLBACK_LINES + SCROLLBACK_TRIM
+        Pesan yang ikut terpotong dilepas dari state (posisi, status, reaction, tag),
+        widget embed di-destroy dan PhotoImage-nya dilepas
+        """
+        lines = int(display.index("end-1c").split(".")[0])
+        if lines <= SCROLLBACK_LINES + SCROLLBACK_TRIM:
+            return
+        state = self.scrollbacks[display]
+        cut = lines - SCROLLBACK_LINES  # Baris 1..cut dibuang
+        
+        # Pesan yang sebagian terpotong dibuang seluruhnya (isi + baris reaction)
+        message_ids = state.message_ids
+        dropped = 0
+        while dropped < len(message_ids):
+            msg_id = message_ids[dropped]
+            mark = message_mark(msg_id)
+            if int(display.index(mark).split(".")[0]) > cut:
                 break
+            last_line = int(display.index(f"{mark} +2l").split(".")[0])
+            if display.tag_ranges(f"reaction_{msg_id}"):
+                last_line += 1
+            cut = max(cut, last_line)
+            dropped += 1
+        for msg_id in message_ids[:dropped]:
+            self.forget_message(display, msg_id)
+        del message_ids[:dropped]
+        
+        while state.embeds and int(display.index(state.embeds[0][0]).split(".")[0]) <= cut:
+            embed = state.embeds.popleft()
+            mark, widget, photo = embed
+            display.mark_unset(mark)
+            embed[0] = None  # Preview yang masih di-decode tidak jadi disisipkan
+            if widget is not None:
+                widget.destroy()
+            # photo: reference terakhir hilang di sini, image Tk dihapus oleh PhotoImage.__del__
+        
+        display.configure(state='normal')
+        display.delete("1.0", f"{cut + 1}.0")
+        display.configure(state='disabled')
+        
+        if message_ids:
+            state.oldest_id = message_ids[0]
+            state.has_older = True
+    
+    def forget_message(self, display, msg_id):
+        """Lepas semua state satu pesan yang sudah tidak tampil"""
+        self.message_displays.pop(msg_id, None)
+        self.message_status.pop(msg_id, None)
+        self.message_reactions.pop(msg_id, None)
+        try:
+            display.mark_unset(message_mark(msg_id))
+            display.tag_delete(f"status_{msg_id}", f"reaction_{msg_id}")
+        except tk.TclError:
+            pass
+    
+    def on_display_scroll(self, display, first, last):
+        """yscrollcommand display room: update scrollbar, minta pesan lama saat sampai paling atas"""
+        display.vbar.set(first, last)
+        state = self.scrollbacks.get(display)
+        if state is not None and state.room == self.current_room:
+            self.schedule_read_receipts()
+        if (state is None or not state.has_older or float(first) > 0
+                or time.time() - state.older_sent_at < OLDER_RETRY):
+            return
+        if not self.client or self.is_rate_limited("history"):
+            return
+        try:
+            self.send_command(f"[GET_OLDER]{state.room}:{state.oldest_id}:{SCROLLBACK_PAGE}")
+            state.older_sent_at = time.time()
+        except:
+            pass
+    
+    def prepend_older(self, data):
+        """
+        Sisipkan pesan lama (balasan [GET_OLDER]) di atas display room
+        Args:
+            data: Dictionary [OLDER] {"room", "before", "messages", "more"}
+        """
+        display = self.room_displays.get(data.get("room"))
+        if display is None:
+            return
+        state = self.scrollbacks[display]
+        state.older_sent_at = 0.0
+        messages = data.get("messages", [])
+        if data.get("before") != state.oldest_id:
+            return  # Balasan untuk permintaan lama (display sudah dipotong lagi)
+        state.has_older = bool(data.get("more")) and bool(messages)
+        if not messages:
+            return
         
-        # Connection lost
-        self.add_message("⚠️ Koneksi ke server terputus", "system_leave")
-        self.status_dot.config(fg=self.COLORS['accent_red'])
-        self.status_text.config(text="Disconnected", fg=self.COLORS['accent_red'])
+        args = []
+        marks = []
+        newlines = 0
+        for item in messages:
+            if item.get("type") == "file":
+                segments = [(f"\n📎 {item.get('sender', '')} shared a file: {item.get('text', '')}\n", "file_header")]
+            else:
+                segments = self.message_segments(item.get("sender", "Unknown"), item.get("time", ""), item.get("text", ""))
+                marks.append((item["id"], newlines))
+            for text, tag in segments:
+                args.extend((text, tag))
+                newlines += text.count("\n")
+        
+        display.configure(state='normal')
+        display.insert("1.0", *args)
+        display.configure(state='disabled')
+        
+        # Mark pesan yang sudah tampil ikut bergeser turun bersama teksnya
+        def add_ids(ids):
+            state.message_ids[:0] = ids
+        self.set_message_marks(display, "1.0", marks, add_ids)
+        state.oldest_id = messages[0].get("id")
+        # View tetap di baris yang tadi paling atas
+        display.yview(f"{newlines + 1}.0")
     
-    def process_message(self, msg):
+    def process_message(self, event):
         """
         Process incoming message berdasarkan protocol
         Args:
-            msg: Raw message dari server
+            event: Event hasil protocol.parse_event (kind, data, raw)
         """
+        # Heartbeat, [RECONNECT] dan [CHUNK] sudah ditangani Connection
+        kind, data = event.kind, event.data
+        # 0.7 RATE LIMIT: server menolak command, tunggu retry_after sebelum mengirim lagi
+        if kind == "rate_limited":
+            command_class, retry_ms = data
+            retry = retry_ms / 1000
+            self.rate_limited_until[command_class] = time.time() + retry
+            if command_class == "subscribe":
+                # Subscription background tidak boleh hilang: kirim ulang setelah retry_after
+                self.post_ui(self.root.after, retry_ms, self.retry_subscriptions)
+            # Typing, read receipt dan subscription cukup ditahan diam-diam
+            elif command_class not in ("typing", "read"):
+                self.post_ui(self.add_message,
+                             f"⏳ Terlalu cepat, tunggu {retry:.1f} detik sebelum mengirim lagi", "system_error")
+
         # 1. USER LIST UPDATE
-        if msg.startswith("[USERS]"):
-            try:
-                # Format baru: dictionary {username: room}
-                users_data = json.loads(msg[7:])
-                self.root.after(0, lambda: self.update_user_list(users_data))
-            except:
-                pass
-            return
+        # Format baru: dictionary {username: room}
+        elif kind == "users":
+            self.post_ui(self.update_user_list, data)
         
         # 2. TYPING INDICATOR
-        elif msg.startswith("[TYPING]"):
-            username = msg[8:]
-            if username != self.username and username not in self.typing_users_list:
-                self.typing_users_list.append(username)
-                self.root.after(0, lambda: self.update_typing_indicator(self.typing_users_list))
-            return
+        elif kind == "typing":
+            if data != self.username and data not in self.typing_users_list:
+                self.typing_users_list.append(data)
+                self.post_ui(self.update_typing_indicator, self.typing_users_list)
         
-        elif msg.startswith("[STOP_TYPING]"):
-            username = msg[13:]
-            if username in self.typing_users_list:
-                self.typing_users_list.remove(username)
-                self.root.after(0, lambda: self.update_typing_indicator(self.typing_users_list))
-            return
+        elif kind == "stop_typing":
+            if data in self.typing_users_list:
+                self.typing_users_list.remove(data)
+                self.post_ui(self.update_typing_indicator, self.typing_users_list)
         
         # 3. MESSAGE REACTION
-        elif msg.startswith("[REACTION]"):
-            try:
-                data = msg[10:]
-                parts = data.split(":", 2)
-                if len(parts) == 3:
-                    msg_id, emoji, username = parts
-                    self.root.after(0, lambda: self.update_reaction_display(msg_id, emoji, username))
-            except:
-                pass
-            return
+        # Format: [REACTION]message_id:emoji:username
+        elif kind == "reaction":
+            self.post_ui(self.update_reaction_display, *data)
         
         # 4. MESSAGE STATUS
-        elif msg.startswith("[DELIVERED]"):
-            msg_id = msg[11:]
-            self.root.after(0, lambda: self.update_message_status(msg_id, 'delivered'))
-            return
+        elif kind == "delivered":
+            self.post_ui(self.update_message_status, data, 'delivered')
         
-        elif msg.startswith("[READ]"):
-            try:
-                parts = msg[6:].split(":", 1)
-                if len(parts) == 2:
-                    msg_id, reader = parts
-                    # Hanya update jika bukan diri sendiri yang read
-                    if reader != self.username:
-                        self.root.after(0, lambda: self.update_message_status(msg_id, 'read'))
-            except:
-                pass
-            return
+        # Format: [READ]id1,id2,...:reader
+        elif kind == "read":
+            msg_ids, reader = data
+            # Hanya update jika bukan diri sendiri yang read
+            if reader != self.username:
+                for msg_id in msg_ids:
+                    self.post_ui(self.update_message_status, msg_id, 'read')
         
         # 5. SYSTEM INFO
-        elif msg.startswith("[INFO]"):
+        elif kind == "info":
             # Play notification sound untuk join/leave
-            if not msg.startswith("[USERS]"):
-                try:
-                    winsound.MessageBeep(winsound.MB_OK)
-                except:
-                    pass
-            
+            beep()
+            msg = event.raw
             if "bergabung" in msg:
-                self.add_message(f"👋 {msg}", "system_join")
+                self.post_ui(self.add_message, f"👋 {msg}", "system_join")
             elif "keluar" in msg:
-                self.add_message(f"👋 {msg}", "system_leave")
+                self.post_ui(self.add_message, f"👋 {msg}", "system_leave")
             else:
-                self.add_message(f"ℹ️ {msg}", "system_info")
-            return
+                self.post_ui(self.add_message, f"ℹ️ {msg}", "system_info")
         
         # 6. ROOM PROTOCOLS
-        elif msg.startswith("[ROOM_LIST]"):
-            try:
-                rooms = json.loads(msg[11:])
-                self.root.after(0, lambda: self.update_room_list(rooms))
-            except:
-                pass
-            return
+        elif kind == "room_list":
+            self.subscribe_new_rooms(data)
+            self.post_ui(self.update_room_list, data)
+        
+        # Format: [UNREAD]room:unread:mentions (counter room background)
+        elif kind == "unread":
+            room, unread, mentions = data
+            if room != self.current_room:
+                self.unread_counts[room] = (unread, mentions)
+                self.post_ui(self.update_room_list, self.available_rooms)
             
-        elif msg.startswith("[ROOM_CREATED]"):
-            room_name = msg[14:]
-            self.root.after(0, lambda: self.switch_room(room_name))
-            return
+        elif kind in ("room_created", "room_joined"):
+            self.post_ui(self.switch_room, data)
             
-        elif msg.startswith("[ROOM_JOINED]"):
-            room_name = msg[13:]
-            self.root.after(0, lambda: self.switch_room(room_name))
-            return
+        elif kind == "room_error":
+            self.post_ui(messagebox.showerror, "Room Error", data)
             
-        elif msg.startswith("[ROOM_ERROR]"):
-            error_msg = msg[12:]
-            self.root.after(0, lambda: messagebox.showerror("Room Error", error_msg))
-            return
+        # Command ditolak server, mis. [ERROR]file terlalu besar
+        elif kind == "error":
+            self.post_ui(self.add_message, f"❌ {data}", "system_error")
+            
+        # 6.5 HASIL PENCARIAN
+        # Format: [SEARCH_RESULTS]{"room", "query", "results": [{id, seq, sender, time, type, snippet}], "took_ms"}
+        elif kind == "search_results":
+            self.post_ui(self.show_search_results, data)
+            
+        # 6.6 PESAN LAMA UNTUK SCROLLBACK
+        # Format: [OLDER]{"room", "before", "messages": [{seq, id, sender, time, type, text}], "more"}
+        elif kind == "older":
+            self.post_ui(self.prepend_older, data)
+            
+        # 6.7 SYNC LOGIN: delta per room (room aktif dulu), diakhiri [SYNC_DONE]
+        # Format: [SYNC_ROOM]{"room", "messages": [baris asli], "reactions": {msg_id: {emoji: [user]}}}
+        elif kind == "sync_room":
+            self.post_ui(self.apply_sync, data)
             
         # 7. FILE SHARING PROTOCOL
-        elif msg.startswith("[FILE_SHARED]"):
-            # Format: [FILE_SHARED]room:file_id:filename:sender:size:base64
-            try:
-                data = msg[13:]
-                parts = data.split(':', 5)
-                if len(parts) == 6:
-                    room, file_id, filename, sender, size, b64_data = parts
-                    # Hanya tampilkan jika di room yang aktif
-                    if room == self.current_room:
-                        self.root.after(0, lambda: self.display_file(room, file_id, filename, sender, size, b64_data))
-            except:
-                pass
-            return
+        # Format: [FILE_SHARED]room:file_id:filename:sender:size:preview_base64
+        elif kind == "file_shared":
+            # Hanya tampilkan jika di room yang aktif
+            if data.room == self.current_room:
+                self.post_ui(self.display_file, *data)
+        
+        # Format: [FILE_DATA]file_id:variant:base64 (balasan [GET_FILE])
+        elif kind == "file_data":
+            file_id, variant, b64_data = data
+            self.post_ui(self.save_downloaded_file, file_id, b64_data)
             
         # 8. REGULAR CHAT MESSAGE (Fallback if no prefix)
-        else:
+        elif kind == "chat":
             # Play notification sound untuk messages dari orang lain
-            if self.username and f"] {self.username}:" not in msg:
-                try:
-                    winsound.MessageBeep(winsound.MB_OK)
-                except:
-                    pass
-            self.parse_chat_message(msg)
+            if self.username and (data is None or data.sender != self.username):
+                beep()
+            self.post_ui(self.parse_chat_message, event.raw)
+        
+        # [SENT] (outbox sudah dibersihkan Connection), [SYNC_DONE], [PONG] dan command rusak diabaikan
     
-    def parse_chat_message(self, msg, room=None):
+    def parse_chat_message(self, msg, room=None, cached=False):
         """
         Parse dan display chat message dengan format baru
         Format: [MSG_ID:id][timestamp] username: message
         Args:
             msg: Formatted message dari server
             room: Room tujuan (jika None, pakai current_room)
+            cached: Pesan dari cache (sudah pernah dibaca, tidak ditulis ulang ke cache)
         """
         target_room = room if room else self.current_room
         display = self.get_or_create_room_display(target_room)
-        
-        try:
-            # Extract message ID jika ada
-            msg_id = None
-            if msg.startswith("[MSG_ID:"):
-                end_id = msg.index("]", 1)
-                msg_id = msg[8:end_id]
-                msg = msg[end_id+1:]  # Remove MSG_ID part
-            
-            # Extract timestamp
-            end = msg.index("]")
-            time_str = msg[1:end]
-            rest = msg[end+2:]
-            
-            # Extract username dan message
-            if ": " in rest:
-                idx = rest.index(": ")
-                sender = rest[:idx]
-                content = rest[idx+2:]
-            else:
-                sender = "Unknown"
-                content = rest
-            
-            is_own = (sender == self.username)
-            sender_color = get_user_color(sender)
-            tag = "msg_own" if is_own else "msg_other"
-            
-            display.configure(state='normal')
-            
-            # Insert message
-            insert_index = display.index(tk.END)
-            display.insert(tk.END, f"\n")
-            
-            # Sender dengan colored name
-            display.insert(tk.END, f"● ", tag)
-            display.insert(tk.END, f"{sender}", tag)
-            display.insert(tk.END, f"  {time_str}\n", "time")
-            
-            # Message content line
-            msg_line_index = display.index(tk.END)
-            display.insert(tk.END, f"   {content}")
-            
-            # Simpan position untuk message ID
-            if msg_id:
-                self.message_positions[msg_id] = msg_line_index
-                
-                # Jika message dari orang lain, kirim read receipt
-                if not is_own:
-                    # Delay sedikit untuk simulate reading
-                    threading.Timer(0.5, lambda: self.send_read_receipt(msg_id)).start()
-                else:
-                    # Jika message sendiri, set status sent
-                    self.message_status[msg_id] = {'status': 'sent'}
-            
-            display.insert(tk.END, "\n")
-            
-            display.configure(state='disabled')
-            display.see(tk.END)
-            
-            # Refresh message status jika ada
-            if msg_id and is_own:
-                self.root.after(100, lambda: self.refresh_message_status(msg_id))
-        except:
+        chat = parse_chat(msg)
+        if chat is None:
             # Fallback untuk message yang tidak sesuai format
             self.add_message(msg, "system_info", room=target_room)
+            return
+        
+        msg_id = chat.msg_id
+        # Sudah tampil (history yang tumpang tindih setelah reconnect / history penuh)
+        if msg_id and msg_id in self.message_displays:
+            return
+        is_own = (chat.sender == self.username)
+        
+        # Mark awal blok pesan dipasang per message ID
+        segments = self.message_segments(chat.sender, chat.time, chat.text)
+        self.insert_text(display, segments, [(msg_id, 0)] if msg_id else ())
+        
+        if msg_id:
+            if not cached:
+                self.cache_item(target_room, msg_id, msg)
+            if is_own:
+                # Jika message sendiri, set status sent
+                self.message_status[msg_id] = {'status': 'sent'}
+                # Refresh message status
+                self.root.after(100, lambda: self.refresh_message_status(msg_id))
+            elif not cached:
+                # Jika message dari orang lain, kirim read receipt (gabungan, setelah terlihat)
+                self.queue_read_receipt(target_room, msg_id)
+    
+    def message_segments(self, sender, time_str, content):
+        """Segment insert_text satu pesan chat: header (sender + waktu) lalu baris isi"""
+        tag = "msg_own" if sender == self.username else "msg_other"
+        return [
+            ("\n", ""),
+            ("● ", tag),
+            (sender, tag),
+            (f"  {time_str}\n", "time"),
+            (f"   {content}", ""),
+            ("\n", ""),
+        ]
     
     def add_message(self, text, tag="system_info", room=None):
         """
@@ -1436,11 +2664,22 @@ class ChatApp:
         """
         target_room = room if room else self.current_room
         display = self.get_or_create_room_display(target_room)
-        
-        display.configure(state='normal')
-        display.insert(tk.END, f"\n{text}\n", tag)
-        display.configure(state='disabled')
-        display.see(tk.END)
+        self.insert_text(display, [(f"\n{text}\n", tag)])
+    
+    def show_search_results(self, data):
+        """
+        Tampilkan hasil [SEARCH] di display room yang dicari
+        Args:
+            data: Dictionary hasil [SEARCH_RESULTS]
+        """
+        room = data.get("room") or self.current_room
+        results = data.get("results", [])
+        lines = [f"🔍 {len(results)} hasil untuk \"{data.get('query', '')}\" ({data.get('took_ms', 0)} ms)"]
+        for result in results:
+            icon = "📎" if result.get("type") == "file" else "💬"
+            when = f"[{result['time']}] " if result.get("time") else ""
+            lines.append(f"{icon} {when}{result.get('sender', '')}: {result.get('snippet', '')}")
+        self.add_message("\n".join(lines), "system_info", room=room)
     
     def send_message(self):
         """
@@ -1451,15 +2690,35 @@ class ChatApp:
         if not msg or not self.client:
             return
         
+        # Tahan pesan selama server masih me-rate-limit (teks tetap di input)
+        if self.is_rate_limited("chat"):
+            wait = self.rate_limited_until["chat"] - time.time()
+            self.add_message(f"⏳ Tunggu {wait:.1f} detik sebelum mengirim pesan lagi", "system_error")
+            return
+        
+        # /search kata: cari di history room aktif (server membalas [SEARCH_RESULTS])
+        if msg.startswith("/search "):
+            query = msg[8:].strip()
+            if query:
+                try:
+                    self.send_command(f"[SEARCH]{self.current_room}:{query}:{SEARCH_LIMIT}")
+                except:
+                    pass
+            self.msg_entry.delete(0, tk.END)
+            return
+        
         try:
             # Stop typing indicator saat send message
             if self.is_typing:
                 self.stop_typing()
                 if self.typing_timer:
-                    self.typing_timer.cancel()
+                    self.scheduler.cancel(self.typing_timer)
+                    self.typing_timer = None
             
-            # Kirim message (server akan generate MSG_ID)
-            self.client.send((msg + "\n").encode())
+            # Kirim message dengan key idempotency (server akan generate MSG_ID)
+            # Saat terputus pesan disimpan di outbox dan dikirim setelah reconnect
+            if not self.client.send_chat(msg):
+                self.add_message("📤 Pesan akan dikirim setelah tersambung kembali", "system_info")
             self.msg_entry.delete(0, tk.END)
         except:
             messagebox.showerror("Error", "Gagal mengirim pesan")
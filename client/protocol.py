@@ -0,0 +1,549 @@
+"""
+Lapisan protokol PyRTC tanpa GUI: framing, kompresi, parsing pesan server dan
+client asyncio untuk bot, integration test dan load generator
+Dipakai juga oleh client Tk (client.py), jadi bot berjalan di jalur kode yang sama
+
+Event dari parse_event (kind -> data):
+    chat            ChatMessage, None jika baris tidak sesuai format chat
+    file_shared     SharedFile
+    users           {username: room}
+    typing          username
+    stop_typing     username
+    reaction        (msg_id, emoji, username)
+    delivered       msg_id
+    read            ([msg_id], reader)
+    info            teks pengumuman (tanpa prefix [INFO])
+    room_list       [room]
+    unread          (room, unread, mentions)
+    room_joined     room
+    room_created    room
+    room_error      pesan error
+    error           pesan error (mis. frame ditolak server)
+    search_results  dict [SEARCH_RESULTS]
+    older           dict [OLDER]
+    file_data       (file_id, variant, base64)
+    sent            (key, msg_id)
+    sync_room       dict [SYNC_ROOM] {"room", "messages", "reactions"}
+    sync_done       None
+    rate_limited    (kelas command, retry_ms)
+    ping / pong     None
+    reconnect       delay_ms (None jika tidak ada)
+    chunk           (chunk_id, index, count, potongan)
+    invalid         None (command dikenal tapi formatnya rusak)
+"""
+import asyncio
+import collections
+import json
+import struct
+import uuid
+import zlib
+
+# ==================== FRAMING & KOMPRESI ====================
+# Format frame harus sama dengan server/compression.py
+FRAME_RAW = 0
+FRAME_STREAM = 1
+FRAME_SHARED = 2
+FRAME_HEADER = struct.Struct("!BI")
+
+# Harus identik byte-per-byte dengan PRESET_DICTIONARY di server/compression.py
+DICTIONARY_VERSION = 1
+PRESET_DICTIONARY = (
+    b'iVBORw0KGgoAAAANSUhEUgAA/9j/4AAQSkZJRgABAQAAAQABAAD'
+    b'[ROOM_ERROR][ROOM_CREATED][ROOM_JOINED][DELIVERED][READ][REACTION]'
+    b'[STOP_TYPING][TYPING][INFO]  bergabung dari (\'127.0.0.1\',  keluar'
+    b'[FILE_SHARED]general:.png:.jpg:.pdf:'
+    b'[ROOM_LIST]["general", "[USERS]{"": "general", '
+    b'[MSG_ID:][:'
+)
+# Dikirim di [HELLO]; server hanya memakai kompresi jika sama dengan checksum dictionary-nya
+DICTIONARY_CHECKSUM = zlib.adler32(PRESET_DICTIONARY)
+
+class DeflateCodec:
+    """
+    Codec deflate sisi client
+    Frame ke server memakai konteks stream, frame dari server bisa stream atau shared
+    """
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, -15, zdict=PRESET_DICTIONARY)
+        self.decompressor = zlib.decompressobj(-15, zdict=PRESET_DICTIONARY)
+
+    def encode(self, message):
+        payload = message.encode()
+        if len(payload) < self.threshold:
+            return FRAME_HEADER.pack(FRAME_RAW, len(payload)) + payload
+        data = self.compressor.compress(payload) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return FRAME_HEADER.pack(FRAME_STREAM, len(data)) + data
+
+    def decode(self, frame_type, data):
+        if frame_type == FRAME_RAW:
+            return data.decode()
+        if frame_type == FRAME_STREAM:
+            return self.decompressor.decompress(data).decode()
+        if frame_type == FRAME_SHARED:
+            return zlib.decompressobj(-15, zdict=PRESET_DICTIONARY).decompress(data).decode()
+        raise ValueError(f"Tipe frame tidak dikenal: {frame_type}")
+
+class FrameReader:
+    """Memecah byte dari socket menjadi pesan teks (mode baris atau mode frame)"""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.codec = None
+
+    def feed(self, data):
+        self.buffer += data
+
+    def next_message(self):
+        if self.codec is None:
+            idx = self.buffer.find(b"\n")
+            if idx < 0:
+                return None
+            line = bytes(self.buffer[:idx])
+            del self.buffer[:idx + 1]
+            return line.decode(errors="replace")
+
+        if len(self.buffer) < FRAME_HEADER.size:
+            return None
+        frame_type, length = FRAME_HEADER.unpack_from(self.buffer)
+        end = FRAME_HEADER.size + length
+        if len(self.buffer) < end:
+            return None
+        data = bytes(self.buffer[FRAME_HEADER.size:end])
+        del self.buffer[:end]
+        return self.codec.decode(frame_type, data)
+
+# Error decode frame dari FrameReader.next_message: stream rusak, koneksi harus diulang
+# (ValueError mencakup UnicodeDecodeError dan tipe frame yang tidak dikenal)
+FRAME_ERRORS = (zlib.error, ValueError)
+
+def encode_message(codec, message):
+    """Byte siap kirim satu pesan (frame jika codec disepakati, selain itu baris)"""
+    return codec.encode(message) if codec else (message + "\n").encode()
+
+# ==================== HANDSHAKE ====================
+def hello_line(fields, compression=True):
+    """
+    Baris [HELLO] (selalu mode baris, sebelum codec disepakati)
+    Args:
+        fields: Field [HELLO], mis. {"username", "room", "last_id"}
+        compression: Tawarkan kompresi deflate
+    """
+    # chunks: pesan besar (file) boleh dipecah server jadi [CHUNK] agar chat tidak tertahan
+    hello = dict(fields, chunks=True)
+    if compression:
+        hello["compression"] = ["deflate"]
+        hello["dict"] = DICTIONARY_VERSION
+        hello["dict_checksum"] = DICTIONARY_CHECKSUM
+    return f"[HELLO]{json.dumps(hello)}\n".encode()
+
+def negotiated_codec(reply):
+    """
+    Codec dari balasan [HELLO_OK]
+    Returns:
+        DeflateCodec, atau None jika server tidak memakai kompresi
+    """
+    ack = json.loads(reply[10:])
+    if ack.get("compression") == "deflate":
+        return DeflateCodec(ack.get("threshold", 256))
+    return None
+
+# ==================== PARSING ====================
+Event = collections.namedtuple("Event", "kind data raw")
+ChatMessage = collections.namedtuple("ChatMessage", "msg_id time sender text")
+SharedFile = collections.namedtuple("SharedFile", "room file_id filename sender size preview")
+
+def parse_chat(raw):
+    """
+    Parse pesan chat
+    Format: [MSG_ID:id][timestamp] username: message ([MSG_ID:id] opsional)
+    Returns:
+        ChatMessage, None jika format tidak dikenali
+    """
+    msg_id = None
+    msg = raw
+    if msg.startswith("[MSG_ID:"):
+        end = msg.find("]")
+        if end < 0:
+            return None
+        msg_id = msg[8:end]
+        msg = msg[end + 1:]
+    end = msg.find("]")
+    if not msg.startswith("[") or end < 0:
+        return None
+    rest = msg[end + 2:]
+    sender, sep, text = rest.partition(": ")
+    if not sep:
+        sender, text = "Unknown", rest
+    return ChatMessage(msg_id, msg[1:end], sender, text)
+
+def parse_file_shared(payload):
+    """
+    Format: room:file_id:filename:sender:size:preview_base64 (tanpa prefix [FILE_SHARED])
+    Returns:
+        SharedFile
+    """
+    parts = payload.split(":", 5)
+    if len(parts) != 6:
+        raise ValueError("Format [FILE_SHARED] tidak valid")
+    return SharedFile(*parts)
+
+def item_id_of(raw):
+    """msg_id pesan chat atau file_id baris [FILE_SHARED], None jika tidak ada"""
+    if raw.startswith("[MSG_ID:"):
+        return raw[8:raw.find("]")]
+    if raw.startswith("[FILE_SHARED]"):
+        parts = raw[13:].split(":", 2)
+        if len(parts) == 3:
+            return parts[1]
+    return None
+
+def _split(count):
+    def parse(payload):
+        parts = payload.split(":", count - 1)
+        if len(parts) != count:
+            raise ValueError("Jumlah field kurang")
+        return tuple(parts)
+    return parse
+
+def _rate_limited(payload):
+    command_class, retry_ms = payload.rsplit(":", 1)
+    return command_class, int(retry_ms)
+
+def _read(payload):
+    msg_ids, reader = _split(2)(payload)
+    return msg_ids.split(","), reader
+
+def _unread(payload):
+    room, unread, mentions = payload.rsplit(":", 2)
+    return room, int(unread), int(mentions)
+
+def _reconnect(payload):
+    try:
+        return int(json.loads(payload).get("delay_ms"))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+def _chunk(payload):
+    chunk_id, index, count, piece = _split(4)(payload)
+    return chunk_id, int(index), int(count), piece
+
+def _none(payload):
+    return None
+
+def _text(payload):
+    return payload
+
+def _stripped(payload):
+    return payload.strip()
+
+# Prefix command -> (kind, parser payload)
+PARSERS = {
+    "[FILE_SHARED]": ("file_shared", parse_file_shared),
+    "[USERS]": ("users", json.loads),
+    "[TYPING]": ("typing", _text),
+    "[STOP_TYPING]": ("stop_typing", _text),
+    "[REACTION]": ("reaction", _split(3)),
+    "[DELIVERED]": ("delivered", _text),
+    "[READ]": ("read", _read),
+    "[INFO]": ("info", _stripped),
+    "[ROOM_LIST]": ("room_list", json.loads),
+    "[UNREAD]": ("unread", _unread),
+    "[ROOM_JOINED]": ("room_joined", _text),
+    "[ROOM_CREATED]": ("room_created", _text),
+    "[ROOM_ERROR]": ("room_error", _text),
+    "[ERROR]": ("error", _text),
+    "[SEARCH_RESULTS]": ("search_results", json.loads),
+    "[OLDER]": ("older", json.loads),
+    "[FILE_DATA]": ("file_data", _split(3)),
+    "[SENT]": ("sent", _split(2)),
+    "[SYNC_ROOM]": ("sync_room", json.loads),
+    "[SYNC_DONE]": ("sync_done", _none),
+    "[RATE_LIMITED]": ("rate_limited", _rate_limited),
+    "[PING]": ("ping", _none),
+    "[PONG]": ("pong", _none),
+    "[RECONNECT]": ("reconnect", _reconnect),
+    "[CHUNK]": ("chunk", _chunk),
+}
+
+def command_of(msg):
+    """Entri PARSERS untuk prefix pesan ini, None untuk chat"""
+    if msg.startswith("["):
+        end = msg.find("]")
+        if end > 0:
+            return PARSERS.get(msg[:end + 1])
+    return None
+
+def kind_of(msg):
+    """Kind event tanpa mem-parse payload (murah, untuk menyaring event yang tidak dipakai)"""
+    entry = command_of(msg)
+    return entry[0] if entry is not None else "chat"
+
+def parse_event(msg):
+    """
+    Ubah satu pesan server menjadi Event (lihat daftar kind di awal modul)
+    Pesan tanpa prefix command yang dikenal dianggap chat
+    """
+    entry = command_of(msg)
+    if entry is None:
+        return Event("chat", parse_chat(msg), msg)
+    kind, parse = entry
+    try:
+        return Event(kind, parse(msg[msg.find("]") + 1:]), msg)
+    except (ValueError, TypeError, AttributeError):
+        return Event("invalid", None, msg)
+
+class ChunkAssembler:
+    """Gabungkan potongan [CHUNK] pesan besar yang dipecah server"""
+    def __init__(self):
+        self.pending = {}  # chunk_id -> potongan yang sudah diterima
+
+    def add(self, chunk_id, index, count, piece):
+        """
+        Returns:
+            Pesan utuh setelah potongan terakhir diterima, selain itu None
+        """
+        parts = self.pending.setdefault(chunk_id, [None] * count)
+        if not 0 <= index < len(parts):
+            return None  # Potongan rusak dibuang
+        parts[index] = piece
+        if None in parts:
+            return None
+        del self.pending[chunk_id]
+        return "".join(parts)
+
+# ==================== CLIENT ASYNCIO ====================
+class AsyncClient:
+    """
+    Satu sesi chat tanpa GUI di atas asyncio
+    Tiap sesi hanya satu task pembaca (tanpa thread), jadi ribuan sesi bisa
+    berjalan di satu event loop. [PING], [CHUNK] dan ack [SENT] ditangani di sini,
+    event lain dibagikan ke callback on(kind, fn) dan iterator events(kind)
+    Tidak reconnect otomatis: saat koneksi putus closed di-set dan iterator berhenti
+    Contoh:
+        client = AsyncClient("bot")
+        await client.connect("127.0.0.1", 12345)
+        msg_id = await client.send_chat("halo")
+        async for event in client.events("chat"):
+            print(event.data.sender, event.data.text)
+    Args:
+        username: Username untuk [HELLO]
+        room: Room aktif awal
+        compression: Tawarkan kompresi deflate ke server
+    """
+    INTERNAL = ("ping", "chunk", "sent", "room_joined", "room_created")  # Selalu diproses client
+
+    def __init__(self, username, room="general", compression=True):
+        self.username = username
+        self.room = room
+        self.compression = compression
+        self.reader = None
+        self.writer = None
+        self.codec = None
+        self.frames = FrameReader()
+        self.chunks = ChunkAssembler()
+        self.callbacks = collections.defaultdict(list)  # kind -> [fn(event)], "*" = semua event
+        self.queues = collections.defaultdict(list)     # kind -> [asyncio.Queue] milik events()
+        self.acks = {}  # key [SEND] -> Future msg_id
+        self.task = None
+        self.closed = False
+
+    async def connect(self, host, port, timeout=10, **hello):
+        """
+        Buka koneksi, handshake [HELLO], lalu mulai task pembaca
+        Args:
+            hello: Field [HELLO] tambahan, mis. last_id
+        """
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        fields = dict(hello, username=self.username, room=self.room)
+        self.writer.write(hello_line(fields, self.compression))
+        first = await asyncio.wait_for(self._handshake(), timeout)
+        self.task = asyncio.ensure_future(self._read_loop())
+        if first is not None:
+            self._dispatch(first)
+
+    async def _handshake(self):
+        """Returns: pesan pertama jika server lama tanpa handshake, selain itu None"""
+        reply = None
+        while reply is None:
+            data = await self.reader.read(4096)
+            if not data:
+                raise ConnectionError("Server menutup koneksi saat handshake")
+            self.frames.feed(data)
+            reply = self.frames.next_message()
+        if not reply.startswith("[HELLO_OK]"):
+            return reply
+        self.codec = negotiated_codec(reply)
+        self.frames.codec = self.codec
+        return None
+
+    # ---- Event ----
+
+    def on(self, kind, fn):
+        """
+        Daftarkan callback fn(event) untuk satu kind ("*" = semua event)
+        fn boleh coroutine function, dijalankan sebagai task
+        """
+        self.callbacks[kind].append(fn)
+        return fn
+
+    async def events(self, kind="*"):
+        """Async iterator event satu kind ("*" = semua), berhenti saat koneksi ditutup"""
+        queue = asyncio.Queue()
+        self.queues[kind].append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.queues[kind].remove(queue)
+
+    async def wait_for(self, kind, predicate=None, timeout=None):
+        """Tunggu event pertama kind ini yang memenuhi predicate(event)"""
+        future = asyncio.get_running_loop().create_future()
+
+        def check(event):
+            if not future.done() and (predicate is None or predicate(event)):
+                future.set_result(event)
+        self.on(kind, check)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.callbacks[kind].remove(check)
+
+    def _dispatch(self, msg):
+        # Payload hanya di-parse jika ada yang mendengarkan (mis. [USERS] tiap login
+        # berukuran O(jumlah user) dan biasanya tidak dipakai bot)
+        kind = kind_of(msg)
+        if kind not in self.INTERNAL and not (self.callbacks.get(kind) or self.queues.get(kind)
+                                              or self.callbacks.get("*") or self.queues.get("*")):
+            return
+        event = parse_event(msg)
+        if event.kind == "ping":
+            self.send("[PONG]")
+            return
+        if event.kind == "chunk":
+            full = self.chunks.add(*event.data)
+            if full is not None:
+                self._dispatch(full)
+            return
+        if event.kind == "sent":
+            future = self.acks.pop(event.data[0], None)
+            if future is not None and not future.done():
+                future.set_result(event.data[1])
+        elif event.kind in ("room_joined", "room_created"):
+            self.room = event.data
+
+        for kind in (event.kind, "*"):
+            for fn in list(self.callbacks.get(kind, ())):
+                # Bug di callback aplikasi tidak boleh memutus sesi atau callback lain
+                try:
+                    result = fn(event)
+                except Exception as e:
+                    print(f"Callback error: {e!r} ({event.raw[:80]!r})")
+                    continue
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+            for queue in self.queues.get(kind, ()):
+                queue.put_nowait(event)
+
+    async def _read_loop(self):
+        # Hanya error socket/stream yang menutup sesi; error callback ditangani _dispatch
+        try:
+            while True:
+                # Proses isi buffer dulu: frame yang terbaca bersama [HELLO_OK] saat
+                # handshake sudah ada di buffer sebelum read pertama
+                while True:
+                    try:
+                        msg = self.frames.next_message()
+                    except FRAME_ERRORS:
+                        return
+                    if msg is None:
+                        break
+                    if msg:
+                        self._dispatch(msg)
+                try:
+                    data = await self.reader.read(65536)
+                except OSError:
+                    return
+                if not data:
+                    return
+                self.frames.feed(data)
+        finally:
+            self._closed()
+
+    def _closed(self):
+        self.closed = True
+        for future in self.acks.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Koneksi ditutup sebelum [SENT]"))
+        self.acks.clear()
+        for queues in self.queues.values():
+            for queue in queues:
+                queue.put_nowait(None)
+
+    # ---- Command ----
+
+    def send(self, text):
+        """Tulis satu pesan/command ke buffer socket (pakai drain() untuk flow control)"""
+        if self.closed or self.writer is None:
+            raise ConnectionError("Tidak terhubung")
+        self.writer.write(encode_message(self.codec, text))
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def send_chat(self, text, wait=True):
+        """
+        Kirim pesan chat dengan key idempotency ([SEND]key:text)
+        Returns:
+            msg_id dari ack [SENT] (wait=True), atau key jika tidak menunggu
+        """
+        key = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future() if wait else None
+        if future is not None:
+            self.acks[key] = future
+        self.send(f"[SEND]{key}:{text}")
+        if future is None:
+            return key
+        return await future
+
+    def switch_room(self, room, delta=False):
+        self.send(f"[SWITCH_ROOM]{room}:delta" if delta else f"[SWITCH_ROOM]{room}")
+
+    def join_room(self, room):
+        self.send(f"[JOIN_ROOM]{room}")
+
+    def create_room(self, room):
+        self.send(f"[CREATE_ROOM]{room}")
+
+    def get_history(self, room, since_id=None):
+        self.send(f"[GET_HISTORY]{room}:{since_id}" if since_id else f"[GET_HISTORY]{room}")
+
+    def sync(self, rooms):
+        """[SYNC] untuk [(room, since_id)], balasan event sync_room per room lalu sync_done"""
+        self.send("[SYNC]" + json.dumps({"rooms": [{"room": room, "since": since_id} for room, since_id in rooms]}))
+
+    def react(self, msg_id, emoji):
+        self.send(f"[REACTION]{msg_id}:{emoji}")
+
+    def typing(self, is_typing=True):
+        self.send("[TYPING]" if is_typing else "[STOP_TYPING]")
+
+    def read(self, room, msg_ids):
+        self.send(f"[READ]{room}:{','.join(msg_ids)}")
+
+    def search(self, room, query, limit=20):
+        self.send(f"[SEARCH]{room}:{query}:{limit}")
+
+    async def close(self):
+        if self.writer is not None and not self.closed:
+            self.writer.close()
+        if self.task is not None:
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        else:
+            self._closed()
@@ -1,35 +1,86 @@
+import socket
 import threading
 from datetime import datetime
 import json
 import uuid
 import base64
 import os
+import random
+import time
+from config import COMPRESSION_ENABLED, COMPRESSION_LEVEL, COMPRESSION_THRESHOLD, COMPRESSION_MAX_FRAME
+from config import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, IDLE_TIMEOUT, REAPER_TICK
+from config import DRAIN_TIMEOUT, RECONNECT_DELAY_MIN_MS, RECONNECT_DELAY_MAX_MS
+from config import RATE_LIMIT_ENABLED, RATE_LIMITS, UPLOAD_BYTES_PER_SEC, UPLOAD_BURST_BYTES
+from compression import FrameReader, LineCodec, BroadcastFrame, negotiate_codec
+from heartbeat import HeartbeatMonitor
+from config import ROOM_WORKERS, ROOM_MAILBOX_BATCH, FANOUT_BATCH
+from rate_limiter import RateLimiter
+from rooms import Room, RoomHub, RoomMember
+from room_store import RoomStore, RoomCacheStats
+from config import ROOM_STORE_DIR, ROOM_IDLE_TIMEOUT, ROOM_MAX_RESIDENT, ROOM_MEMORY_BUDGET, ROOM_SWEEP_INTERVAL
+from sessions import SessionTable, RecentSends
+from config import LOCK_PROFILING, LOCK_STALL_THRESHOLD, LOCK_WATCHDOG_INTERVAL
+from config import LOCK_REPORT_FILE, LOCK_REPORT_INTERVAL
+import lockprof
+from config import UPLOAD_DIR, THUMBNAILS_ENABLED, THUMBNAIL_MAX_WIDTH, THUMBNAIL_QUALITY, THUMBNAIL_WORKERS
+import thumbnails
+from config import SEARCH_INDEX_DIR, SEARCH_FLUSH_DOCS, SEARCH_MAX_SEGMENT_DOCS, SEARCH_CACHE_TERMS, SEARCH_MAX_RESULTS
+from config import OLDER_MAX_MESSAGES, READ_MAX_IDS, SYNC_MAX_ROOMS, SUBSCRIBE_MAX_ROOMS
+from config import SEND_DEDUP_KEYS, SEND_DEDUP_TTL, SEND_KEY_MAX_LENGTH
+import search
+from config import EVENT_LOG_ENABLED, EVENT_LOG_DIR, EVENT_LOG_MAX_BYTES, EVENT_LOG_INLINE_MAX, EVENT_LOG_INDEX_INTERVAL
+from event_log import EventLog, EVENT_CONNECT, EVENT_COMMAND, EVENT_DISCONNECT
+from config import OUTBOX_LIMITS
+from outbox import Outbox, OutboxStats
 
-# Dictionary untuk menyimpan semua client yang terhubung
-# Key: socket object, Value: username
-clients = {}
-clients_lock = threading.Lock()
+# Semua lock di modul ini dibuat lewat lockprof.new_lock agar bisa diprofil (opsional)
+lockprof.configure(LOCK_PROFILING, LOCK_STALL_THRESHOLD, LOCK_REPORT_FILE)
 
-# Dictionary untuk menyimpan reactions pada setiap pesan
-# Key: message_id, Value: {emoji: [list of usernames]}
-message_reactions = {}
-reactions_lock = threading.Lock()
+# Tabel semua sesi yang terhubung (lihat sessions.py)
+# socket -> Session (username, codec, room aktif, ...)
+sessions = SessionTable(lockprof.new_lock("sessions_lock"))
 
-# Dictionary untuk tracking typing status
-# Key: username, Value: True/False
-typing_users = {}
-typing_lock = threading.Lock()
+# Key idempotency [SEND] per username (pesan yang dikirim ulang setelah reconnect)
+recent_sends = RecentSends(SEND_DEDUP_KEYS, SEND_DEDUP_TTL, lockprof.new_lock("recent_sends_lock"))
 
 # FITUR BARU: Discord-style Rooms
-# Dictionary untuk menyimpan semua rooms
-# Format: {room_name: {"users": [usernames], "messages": []}}
-rooms = {"general": {"users": [], "messages": []}}
-rooms_lock = threading.Lock()
+# Tiap room adalah actor (lihat rooms.py) yang memiliki member, history,
+# typing dan reactions-nya sendiri, diproses worker dari room_hub
+room_hub = RoomHub(ROOM_WORKERS, ROOM_MAILBOX_BATCH, lockprof.new_lock, FANOUT_BATCH)
 
-# Track active room per user
-# Format: {username: room_name}
-user_active_room = {}
-active_room_lock = threading.Lock()
+# Registry room copy-on-write: pembaca cukup get_room(name) tanpa lock,
+# rooms_lock hanya dipegang saat membuat/menghapus/page-in/page-out room
+# Format: {room_name: Room, atau None jika room sedang di-page ke disk}
+rooms = {"general": Room("general", room_hub)}
+rooms_lock = lockprof.new_lock("rooms_lock")
+
+# Subscriber background room yang sedang di-page ke disk: {room_name: {socket: RoomMember}}
+# Subscribe tidak memuat room; member dipasang lagi ke Room saat page-in (dilindungi rooms_lock)
+paged_members = {}
+
+# Room tanpa member yang idle / melebihi budget disimpan di sini (LRU room cache)
+room_store = RoomStore(ROOM_STORE_DIR)
+room_cache_stats = RoomCacheStats()
+
+# Index full-text per room (lihat search.py), kamus segmen di-cache bersama dengan budget term
+search_term_cache = search.TermCache(SEARCH_CACHE_TERMS)
+
+SUBSCRIPTION_MODES = ("unread", "mentions")
+
+# Metrik antrean kirim per lane semua koneksi ([DEBUG_OUTBOX])
+outbox_stats = OutboxStats()
+
+# Heartbeat & reaper untuk koneksi yang hilang tanpa FIN
+heartbeat = HeartbeatMonitor(HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, IDLE_TIMEOUT, REAPER_TICK)
+
+# Thumbnail gambar upload (process pool, opsional)
+thumbnail_pool = thumbnails.ThumbnailPool(THUMBNAIL_WORKERS, THUMBNAIL_MAX_WIDTH, THUMBNAIL_QUALITY)
+
+# Event log terstruktur (opsional) untuk replay load test dan analitik
+event_log = EventLog(EVENT_LOG_DIR, EVENT_LOG_MAX_BYTES, EVENT_LOG_INLINE_MAX, EVENT_LOG_INDEX_INTERVAL)
+
+# True saat server sedang diserahkan ke proses baru (graceful restart)
+draining = False
 
 def log_message(message, log_file):
     """
@@ -41,6 +92,54 @@ def log_message(message, log_file):
     with open(log_file, "a", encoding="utf-8") as f:
         f.write(message + "\n")
 
+def send_to_client(client_socket, message, frame=None):
+    """
+    Kirim satu pesan ke client lewat outbox sesinya (tidak menunggu socket)
+    Thread writer outbox yang meng-encode sesuai codec dan menulis ke socket
+    Args:
+        client_socket: Socket tujuan
+        message: Pesan teks (tanpa newline)
+        frame: BroadcastFrame opsional agar hasil encode dipakai ulang
+    Returns:
+        False jika sesi sudah ditutup
+    """
+    session = sessions.get(client_socket)
+    if session is None:
+        # Sesi sudah dihapus: pesan dibuang (menulis langsung ke socket bisa merusak
+        # stream deflate dan menahan room worker di peer yang mati)
+        return False
+    return session.outbox.put(message, frame)
+
+def send_batch_to_client(client_socket, items):
+    """
+    Kirim beberapa pesan sekaligus (batch fan-out room) lewat outbox sesi
+    Args:
+        client_socket: Socket tujuan
+        items: List (message, frame)
+    Returns:
+        False jika sesi sudah ditutup
+    """
+    session = sessions.get(client_socket)
+    if session is None:
+        return False
+    return session.outbox.put_many(items)
+
+def send_history(client_socket, history, since_seq=None):
+    """
+    Kirim history room dalam satu vectored write
+    Frame sudah di-encode di snapshot room, jadi tidak ada encode per pesan di sini
+    Args:
+        client_socket: Socket tujuan
+        history: HistorySnapshot room
+        since_seq: Hanya kirim pesan dengan seq > since_seq (None = seluruh history)
+    """
+    session = sessions.get(client_socket)
+    if session is None:
+        return
+    frames = history.frames(session.codec, since_seq)
+    if frames:
+        session.outbox.put_frames(frames)
+
 def broadcast(message, log_file, exclude_client=None):
     """
     Broadcast pesan ke semua client yang terhubung
@@ -50,76 +149,160 @@ def broadcast(message, log_file, exclude_client=None):
         exclude_client: Socket client yang tidak perlu menerima pesan (optional)
     """
     disconnected = []
-    with clients_lock:
-        for client in clients:
-            # Skip client yang di-exclude (contoh: pengirim pesan)
-            if client == exclude_client:
-                continue
-            try:
-                client.send((message + "\n").encode())
-            except:
-                # Jika gagal kirim, tandai untuk dihapus
-                disconnected.append(client)
-        
-        # Hapus client yang disconnect
-        for client in disconnected:
-            if client in clients:
-                del clients[client]
+    frame = BroadcastFrame(message)
+    for session in sessions:
+        # Skip client yang di-exclude (contoh: pengirim pesan)
+        if session.sock == exclude_client:
+            continue
+        try:
+            send_to_client(session.sock, message, frame)
+        except:
+            # Jika gagal kirim, tandai untuk dihapus
+            disconnected.append(session.sock)
+    
+    # Hapus client yang disconnect
+    for client in disconnected:
+        sessions.remove(client)
     
     log_message(message, log_file)
 
-def broadcast_to_room(room_name, message, log_file):
-    """
-    Broadcast pesan hanya ke users di room tertentu
-    Args:
-        room_name: Nama room
-        message: Pesan yang akan di-broadcast
-        log_file: Path ke file log
-    """
-    with clients_lock:
-        with active_room_lock:
-            for client_socket, username in clients.items():
-                # Only send if user's active room matches
-                if user_active_room.get(username) == room_name:
-                    try:
-                        client_socket.send((message + "\n").encode())
-                    except:
-                        pass
-    log_message(f"[{room_name}] {message}", log_file)
-
 def broadcast_user_list():
     """
     Kirim daftar user yang online ke semua client beserta room aktifnya
     Format: [USERS]{"user1": "general", "user2": "gaming"}
     """
-    with clients_lock:
-        with active_room_lock:
-            # Buat mapping username -> active_room
-            user_status = {}
-            for username in clients.values():
-                user_status[username] = user_active_room.get(username, "general")
-            
-            user_list_msg = f"[USERS]{json.dumps(user_status)}\n"
-            for client in clients:
-                try:
-                    client.send(user_list_msg.encode())
-                except:
-                    pass
+    snapshot = sessions.snapshot
+    # Buat mapping username -> active_room
+    user_status = {}
+    for session in snapshot:
+        user_status[session.username] = session.active_room_name
+    
+    user_list_msg = f"[USERS]{json.dumps(user_status)}"
+    frame = BroadcastFrame(user_list_msg)
+    for session in snapshot:
+        try:
+            send_to_client(session.sock, user_list_msg, frame)
+        except:
+            pass
 
 def broadcast_room_list():
     """
     Kirim daftar rooms yang tersedia ke semua client
     Format: [ROOM_LIST]["general", "gaming", "study"]
     """
+    room_names = list(rooms.keys())
+    room_list_msg = f"[ROOM_LIST]{json.dumps(room_names)}"
+    frame = BroadcastFrame(room_list_msg)
+    for session in sessions:
+        try:
+            send_to_client(session.sock, room_list_msg, frame)
+        except:
+            pass
+
+def room_from_state(name, state):
+    """Buat Room dari snapshot (state handoff atau file room store)"""
+    messages = state.get("messages", [])
+    return Room(name, room_hub, created_by=state.get("created_by"), messages=messages,
+                seq=state.get("seq", len(messages)), reactions=state.get("reactions") or {},
+                incarnation=state.get("incarnation"))
+
+def new_room_index(room):
+    """Index pencarian untuk room (dipanggil room actor saat index pertama dipakai)"""
+    directory = search.index_directory(SEARCH_INDEX_DIR, room.name, room.incarnation)
+    return search.RoomIndex(directory, search_term_cache, SEARCH_FLUSH_DOCS, SEARCH_MAX_SEGMENT_DOCS)
+
+def get_room(room_name):
+    """
+    Ambil Room berdasarkan nama, room yang di-page ke disk dimuat ulang secara transparan
+    Returns:
+        Room, atau None jika room tidak ada
+    """
+    global rooms
+    room = rooms.get(room_name)
+    if room is not None or room_name not in rooms:
+        return room
+    
+    with rooms_lock:
+        if room_name not in rooms:
+            return None
+        room = rooms[room_name]
+        if room is None:
+            start = time.perf_counter()
+            room = room_from_state(room_name, room_store.load(room_name) or {})
+            for sock, member in paged_members.pop(room_name, {}).items():
+                if member.delivered_seq is None:
+                    member.delivered_seq = room.seq  # Subscribe saat room di disk: belum ada pesan baru
+                room.members[sock] = member
+            updated = dict(rooms)
+            updated[room_name] = room
+            rooms = updated
+            room_cache_stats.page_ins += 1
+            room_cache_stats.page_in_time += time.perf_counter() - start
+    return room
+
+def page_out_room(room):
+    """
+    Simpan room ke disk dan lepas dari memori (dipanggil dari mailbox room itu)
+    Returns:
+        True jika room berhasil di-page keluar
+    """
+    global rooms
+    room_store.save(room.name, room.snapshot())
     with rooms_lock:
-        room_names = list(rooms.keys())
-        room_list_msg = f"[ROOM_LIST]{json.dumps(room_names)}\n"
-        with clients_lock:
-            for client in clients:
-                try:
-                    client.send(room_list_msg.encode())
-                except:
-                    pass
+        if rooms.get(room.name) is not room:
+            return False  # Sudah dihapus/diganti
+        updated = dict(rooms)
+        updated[room.name] = None
+        rooms = updated
+        if room.members:
+            # Hanya member background (room dengan member aktif tidak di-page keluar)
+            paged_members[room.name] = dict(room.members)
+        room_cache_stats.evictions += 1
+    return True
+
+def sweep_rooms():
+    """
+    Pilih room yang di-page keluar: room tanpa member yang idle melebihi ROOM_IDLE_TIMEOUT,
+    atau room kosong yang paling lama tidak aktif selama budget jumlah/byte terlampaui
+    """
+    room_cache_stats.sweeps += 1
+    now = time.monotonic()
+    resident = [room for room in rooms.values() if room is not None]
+    over_count = len(resident) - ROOM_MAX_RESIDENT
+    over_bytes = sum(room.nbytes for room in resident) - ROOM_MEMORY_BUDGET
+    
+    # Member dibaca tanpa lock hanya sebagai petunjuk, page_out memeriksa ulang di mailbox
+    # Subscriber background tidak menahan room di memori
+    candidates = [room for room in resident if room.name != "general" and not room.pinned]
+    candidates.sort(key=lambda room: room.last_active)
+    for room in candidates:
+        idle = now - room.last_active >= ROOM_IDLE_TIMEOUT
+        if not idle and over_count <= 0 and over_bytes <= 0:
+            break
+        room.tell(room.page_out)
+        over_count -= 1
+        over_bytes -= room.nbytes
+
+def run_room_sweeper():
+    while True:
+        time.sleep(ROOM_SWEEP_INTERVAL)
+        try:
+            sweep_rooms()
+        except Exception as e:
+            print(f"[ERROR] Room sweeper: {e}")
+
+def room_cache_summary():
+    """Ringkasan metrik room cache untuk [DEBUG_ROOMS]"""
+    resident = [room for room in rooms.values() if room is not None]
+    return (room_cache_stats.summary(len(resident), len(rooms) - len(resident),
+                                     sum(room.nbytes for room in resident))
+            + f" search_terms={search_term_cache.total} search_dict_loads={search_term_cache.loads}")
+
+def fanout_summary(limit=5):
+    """Window fan-out room teramai untuk [DEBUG_ROOMS]"""
+    resident = [room for room in rooms.values() if room is not None and room.fanout is not None]
+    resident.sort(key=lambda room: room.fanout.rate, reverse=True)
+    return [f"Fan-out #{room.name}: {room.fanout.summary()}" for room in resident[:limit]]
 
 def create_room(room_name, creator):
     """
@@ -130,65 +313,120 @@ def create_room(room_name, creator):
     Returns:
         (success: bool, message: str)
     """
+    global rooms
     with rooms_lock:
         if room_name in rooms:
             return False, "Room sudah ada"
-        if not room_name or len(room_name) > 20:
+        if not room_name or len(room_name) > 20 or ":" in room_name or "," in room_name:
             return False, "Nama room invalid"
         
-        rooms[room_name] = {
-            "users": [],
-            "messages": [],
-            "created_by": creator
-        }
+        updated = dict(rooms)
+        updated[room_name] = Room(room_name, room_hub, created_by=creator, incarnation=uuid.uuid4().hex[:12])
+        rooms = updated
         return True, f"Room '{room_name}' berhasil dibuat"
 
 def delete_room(room_name):
     """
-    Hapus room dan pindahkan user di dalamnya ke general
+    Hapus room, client yang sedang membukanya diarahkan ke general
     Args:
         room_name: Nama room yang akan dihapus
     Returns:
         (success: bool, message: str)
     """
+    global rooms
     if room_name == "general":
         return False, "Room 'general' tidak bisa dihapus"
         
     with rooms_lock:
         if room_name not in rooms:
             return False, "Room tidak ditemukan"
-            
-        # Pindahkan user yang ada di room ini (di state user_active_room)
-        with active_room_lock:
-            for user, active_room in user_active_room.items():
-                if active_room == room_name:
-                    user_active_room[user] = "general"
-        
-        del rooms[room_name]
-        return True, f"Room '{room_name}' berhasil dihapus"
+        updated = dict(rooms)
+        room = updated.pop(room_name)
+        rooms = updated
+        paged_members.pop(room_name, None)
+        if room is None:
+            # Room di-page keluar: actor dibuat dari snapshot agar close() menghapus index-nya
+            room = room_from_state(room_name, room_store.load(room_name) or {})
+        room_store.delete(room_name)
+    
+    room.tell(room.close, "general")
+    # close() hanya memberi tahu client; state sesi di server ikut dipindah ke general
+    # agar active_room tidak menunjuk actor yang sudah ditutup
+    fallback = get_room("general")
+    for session in sessions:
+        if session.active_room is room:
+            set_active_room(session, fallback)
+        session.rooms.discard(room_name)
+    return True, f"Room '{room_name}' berhasil dihapus"
 
-def join_room(room_name, username):
+def set_active_room(session, room, want_delta=False, resume_id=None):
     """
-    Join user ke room
+    Pindahkan room aktif sesi, room lama tetap di-subscribe sebagai background
     Args:
-        room_name: Nama room
-        username: Username yang join
+        session: Session yang pindah room
+        room: Room aktif yang baru
+        want_delta: Client sudah punya display room, kirim pesan yang terlewat saja
+        resume_id: msg_id terakhir di display client yang reconnect
+    """
+    previous = session.active_room
+    if previous is not None and previous is not room:
+        previous.tell(previous.deactivate, session.sock)
+    room.tell(room.activate, session.sock, session.username, want_delta, resume_id)
+    session.active_room = room
+    session.rooms.add(room.name)
+
+def subscribe_room(session, room_name, mode):
+    """
+    Subscribe background sesi ke room, room yang di-page ke disk tidak dimuat
+    (member dicatat di paged_members dan dipasang saat room dimuat ulang)
     Returns:
-        (success: bool, message: str)
+        False jika room tidak ada
     """
+    room = rooms.get(room_name)
+    if room is None:
+        with rooms_lock:
+            if room_name not in rooms:
+                return False
+            room = rooms[room_name]
+            if room is None:
+                members = paged_members.setdefault(room_name, {})
+                member = members.get(session.sock)
+                if member is None:
+                    members[session.sock] = RoomMember(session.sock, session.username, None, mode)
+                else:
+                    member.mode = mode
+                session.rooms.add(room_name)
+                return True
+    room.tell(room.subscribe, session.sock, session.username, mode)
+    session.rooms.add(room_name)
+    return True
+
+def release_paged_member(room_name, sock):
+    """
+    Lepas member background dari room yang di-page ke disk tanpa memuat room
+    Returns:
+        Room resident yang harus diberi tahu lewat mailbox, atau None
+    """
+    room = rooms.get(room_name)
+    if room is not None or room_name not in rooms:
+        return room
     with rooms_lock:
-        if room_name not in rooms:
-            return False, "Room tidak ditemukan"
-        
-        if username not in rooms[room_name]["users"]:
-            rooms[room_name]["users"].append(username)
-        
-        return True, f"Berhasil join room '{room_name}'"
+        room = rooms.get(room_name)
+        if room is None:
+            members = paged_members.get(room_name)
+            if members is not None:
+                members.pop(sock, None)
+                if not members:
+                    del paged_members[room_name]
+    return room
 
 def handle_file_upload(message, username, log_file):
     """
     Handle file upload dari client
     Format: [FILE]room:filename:size:base64_data
+    Room menerima [FILE_SHARED]room:file_id:filename:sender:size:preview_base64
+    preview = thumbnail untuk gambar (gambar asli jika thumbnail tidak tersedia),
+    kosong untuk file lain; file asli diambil client lewat [GET_FILE]
     Args:
         message: Message dengan format file upload
         username: Username yang upload
@@ -204,133 +442,225 @@ def handle_file_upload(message, username, log_file):
         room_name, filename, filesize, b64_data = parts
         
         # Create uploads directory if not exists
-        uploads_dir = os.path.join(os.path.dirname(log_file), "../uploads")
-        os.makedirs(uploads_dir, exist_ok=True)
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
         
         # Generate unique file ID
         file_id = str(uuid.uuid4())
-        filepath = os.path.join(uploads_dir, f"{file_id}_{filename}")
+        filepath = os.path.join(UPLOAD_DIR, f"{file_id}_{filename}")
         
         # Decode and save file
         file_data = base64.b64decode(b64_data)
         with open(filepath, 'wb') as f:
             f.write(file_data)
         
-        # Broadcast to room
-        file_msg = f"[FILE_SHARED]{room_name}:{file_id}:{filename}:{username}:{filesize}:{b64_data}"
+        room = get_room(room_name)
+        if room is None:
+            return
+        
+        def share(preview):
+            # Broadcast to room (room actor juga menyimpannya ke history)
+            file_msg = f"[FILE_SHARED]{room_name}:{file_id}:{filename}:{username}:{filesize}:{preview}"
+            room.tell(room.post, file_msg)
         
-        # FITUR BARU: Simpan ke history room
-        with rooms_lock:
-            if room_name in rooms:
-                rooms[room_name]["messages"].append(file_msg)
-                # Limit history to 50 items
-                if len(rooms[room_name]["messages"]) > 50:
-                    rooms[room_name]["messages"].pop(0)
-                    
-        broadcast_to_room(room_name, file_msg, log_file)
+        if not thumbnails.is_image(filename):
+            share("")
+        elif thumbnail_pool.enabled:
+            # Resize di process pool, [FILE_SHARED] dikirim setelah thumbnail siap
+            def on_thumbnails(paths):
+                path = thumbnails.smallest(paths)
+                if path is None:
+                    share(b64_data)
+                    return
+                with open(path, "rb") as f:
+                    share(base64.b64encode(f.read()).decode())
+            thumbnail_pool.submit(filepath, os.path.join(UPLOAD_DIR, file_id), on_thumbnails)
+        else:
+            share(b64_data)
         
         print(f"[FILE] {username} uploaded {filename} ({filesize} bytes) to {room_name}")
     except Exception as e:
         print(f"[ERROR] File upload failed: {e}")
 
-def broadcast_typing_status(username, is_typing):
+def send_file_data(client_socket, file_id, variant):
     """
-    Broadcast status typing ke semua client
+    Kirim file asli (atau varian thumbnail) yang diminta client
+    Format balasan: [FILE_DATA]file_id:variant:base64 (base64 kosong jika tidak ditemukan)
     Args:
-        username: Nama user yang sedang/berhenti mengetik
-        is_typing: True jika mulai mengetik, False jika berhenti
+        client_socket: Socket client
+        file_id: ID file dari [FILE_SHARED]
+        variant: "original", "jpeg" atau "webp"
     """
-    with typing_lock:
-        typing_users[username] = is_typing
-    
-    # Format pesan typing indicator
-    if is_typing:
-        msg = f"[TYPING]{username}\n"
-    else:
-        msg = f"[STOP_TYPING]{username}\n"
-    
-    # Kirim ke semua client
-    with clients_lock:
-        for client in clients:
-            try:
-                client.send(msg.encode())
-            except:
-                pass
+    b64_data = ""
+    try:
+        uuid.UUID(file_id)  # Validasi: file_id dipakai sebagai bagian path
+        if variant == "original":
+            prefix = f"{file_id}_"
+            names = [name for name in os.listdir(UPLOAD_DIR) if name.startswith(prefix)]
+            path = os.path.join(UPLOAD_DIR, names[0]) if names else None
+        else:
+            path = thumbnails.thumbnail_path(os.path.join(UPLOAD_DIR, file_id), variant)
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                b64_data = base64.b64encode(f.read()).decode()
+    except (ValueError, KeyError, OSError):
+        pass
+    send_to_client(client_socket, f"[FILE_DATA]{file_id}:{variant}:{b64_data}")
 
-def broadcast_reaction(message_id, emoji, username, log_file):
+def send_ping(client_socket):
     """
-    Broadcast reaction baru ke semua client
+    Antrekan [PING] di lane control (dipanggil dari thread reaper, tidak pernah blocking)
+    Returns:
+        True jika masuk antrean, False jika sesi sudah ditutup
+    """
+    session = sessions.get(client_socket)
+    if session is None:
+        return False
+    return session.outbox.put("[PING]")
+
+def reap_sessions(sockets, log_file):
+    """
+    Tutup sesi yang mati/idle dan hapus dari presence dalam satu update
     Args:
-        message_id: ID pesan yang di-reaction
-        emoji: Emoji yang ditambahkan
-        username: User yang menambahkan reaction
+        sockets: List socket yang di-reap pada tick ini
         log_file: Path ke file log
     """
-    with reactions_lock:
-        # Initialize message reactions jika belum ada
-        if message_id not in message_reactions:
-            message_reactions[message_id] = {}
-        
-        # Initialize emoji list jika belum ada
-        if emoji not in message_reactions[message_id]:
-            message_reactions[message_id][emoji] = []
-        
-        # Toggle reaction: jika sudah ada, hapus; jika belum ada, tambahkan
-        if username in message_reactions[message_id][emoji]:
-            message_reactions[message_id][emoji].remove(username)
-            # Hapus emoji jika tidak ada yang react lagi
-            if not message_reactions[message_id][emoji]:
-                del message_reactions[message_id][emoji]
-        else:
-            message_reactions[message_id][emoji].append(username)
+    # Shutdown dulu tanpa lock agar recv()/sendall() yang tertahan di socket ini terlepas
+    for client_socket in sockets:
+        try:
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
     
-    # Broadcast reaction update ke semua client
-    # Format: [REACTION]message_id:emoji:username
-    msg = f"[REACTION]{message_id}:{emoji}:{username}\n"
-    with clients_lock:
-        for client in clients:
-            try:
-                client.send(msg.encode())
-            except:
-                pass
+    reaped = []
+    for client_socket in sockets:
+        session = sessions.remove(client_socket)
+        if session is not None:
+            session.reaped = True
+            reaped.append(session.username)
+    
+    # Membership room (termasuk typing) dibersihkan thread handler saat recv() gagal
+    for username in reaped:
+        broadcast(f"[INFO] {username} keluar (koneksi timeout)", log_file)
     
-    log_message(msg.strip(), log_file)
+    # Satu snapshot [USERS] untuk semua user yang di-reap
+    if reaped:
+        broadcast_user_list()
+        print(f"[REAPER] {len(reaped)} sesi ditutup: {', '.join(reaped)}")
+
+def start_heartbeat(log_file):
+    """Jalankan thread heartbeat/reaper (dipanggil sekali dari server.py)"""
+    heartbeat.start(send_ping, lambda sockets: reap_sessions(sockets, log_file))
 
-def broadcast_read_status(message_id, username, log_file):
+def start_rooms(log_file):
+    """Jalankan worker pool room actor + sweeper LRU (dipanggil sekali dari server.py)"""
+    global rooms
+    # Room yang sudah di-page ke disk (proses sebelumnya) tetap terdaftar tanpa dimuat
+    with rooms_lock:
+        updated = dict(rooms)
+        for name in room_store.names():
+            updated.setdefault(name, None)
+        rooms = updated
+    room_hub.start(send_to_client, send_history, lambda text: log_message(text, log_file),
+                   resolve=get_room, page_out=page_out_room, new_index=new_room_index,
+                   send_batch=send_batch_to_client)
+    threading.Thread(target=run_room_sweeper, name="room-sweeper", daemon=True).start()
+
+def start_thumbnails():
+    """Siapkan process pool thumbnail (dipanggil sekali dari server.py)"""
+    if THUMBNAILS_ENABLED:
+        thumbnail_pool.start()
+
+def start_event_log():
+    """Buka event log jika EVENT_LOG_ENABLED (dipanggil sekali dari server.py)"""
+    if EVENT_LOG_ENABLED:
+        event_log.start()
+
+def stop_event_log():
+    """Tulis sisa event lalu tutup file (setelah drain saat handoff)"""
+    event_log.close()
+
+def start_lock_profiler():
+    """Jalankan watchdog stall + laporan berkala jika LOCK_PROFILING aktif"""
+    lockprof.start(LOCK_WATCHDOG_INTERVAL, LOCK_REPORT_INTERVAL)
+
+def export_state():
     """
-    Broadcast read receipt ke semua client
-    Args:
-        message_id: ID pesan yang sudah dibaca
-        username: User yang membaca pesan
-        log_file: Path ke file log
+    Ambil snapshot state yang perlu dibawa ke proses server baru
+    Snapshot diambil lewat mailbox tiap room, jadi pesan yang masih antre ikut tersimpan
+    Returns:
+        Dictionary yang bisa di-serialize ke JSON
     """
-    # Format: [READ]message_id:username
-    msg = f"[READ]{message_id}:{username}\n"
-    with clients_lock:
-        for client in clients:
-            try:
-                client.send(msg.encode())
-            except:
-                pass
-    
-    log_message(msg.strip(), log_file)
+    room_state = {}
+    for name, room in rooms.items():
+        if room is None:
+            continue  # Sudah tersimpan di room store
+        snapshot = room.ask(room.checkpoint)
+        if snapshot is not None:
+            room_state[name] = snapshot
+    return {"version": 2, "rooms": room_state}
 
-def send_room_history(client_socket, room_name):
+def import_state(state):
     """
-    Kirim history pesan di suatu room ke client tertentu
+    Muat state hasil export_state() dari proses server sebelumnya
     Args:
-        client_socket: Socket client
-        room_name: Nama room
+        state: Dictionary hasil export_state()
     """
+    global rooms
+    # Versi 1 menyimpan reactions global, bukan per room
+    legacy_reactions = state.get("reactions", {})
     with rooms_lock:
-        if room_name in rooms:
-            history = rooms[room_name]["messages"]
-            for msg in history:
-                try:
-                    # Kirim history satu per satu
-                    client_socket.send((msg + "\n").encode())
-                except:
-                    break
+        updated = dict(rooms)
+        for name, room in state.get("rooms", {}).items():
+            if room.get("reactions") is None:
+                room["reactions"] = {}
+                for msg in room["messages"]:
+                    msg_id = msg[8:msg.find("]")] if msg.startswith("[MSG_ID:") else None
+                    if msg_id in legacy_reactions:
+                        room["reactions"][msg_id] = legacy_reactions[msg_id]
+            updated[name] = room_from_state(name, room)
+        rooms = updated
+
+def drain_sessions():
+    """
+    Kirim hint [RECONNECT] dengan delay acak ke semua client lalu tutup koneksi
+    Tidak ada broadcast keluar/[USERS] per client selama drain
+    """
+    global draining
+    draining = True
+    
+    drained = list(sessions)
+    sockets = [session.sock for session in drained]
+    
+    for session in drained:
+        hint = {
+            "delay_ms": random.randint(RECONNECT_DELAY_MIN_MS, RECONNECT_DELAY_MAX_MS),
+            "reason": "restart"
+        }
+        # [RECONNECT] antre di belakang pesan lain, writer mengirim semua lalu berhenti
+        session.outbox.put(f"[RECONNECT]{json.dumps(hint)}")
+        session.outbox.close(flush=True)
+    
+    # Tunggu semua outbox kosong (flush) lalu FIN
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    for session in drained:
+        session.outbox.wait(max(0, deadline - time.monotonic()))
+        try:
+            session.sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+    
+    # Tunggu thread handler selesai, paksa tutup yang masih tersisa
+    while time.monotonic() < deadline:
+        if not len(sessions):
+            break
+        time.sleep(0.05)
+    
+    for client_socket in [session.sock for session in sessions]:
+        try:
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    print(f"[HANDOFF] {len(sockets)} sesi di-drain")
 
 def handle_client(client_socket, address, log_file):
     """
@@ -341,23 +671,59 @@ def handle_client(client_socket, address, log_file):
         log_file: Path ke file log
     """
     username = None
+    session = None
     try:
-        # Terima username dari client (dengan buffering singkat)
-        buffer = ""
-        while "\n" not in buffer:
-            data = client_socket.recv(1024).decode()
+        # Terima handshake dari client (dengan buffering singkat)
+        # Client baru: [HELLO]{"username": ..., "compression": [...], "dict": n, "dict_checksum": adler32}
+        # Client lama: hanya username diakhiri newline
+        reader = FrameReader()
+        first_line = None
+        while first_line is None:
+            data = client_socket.recv(1024)
             if not data: break
-            buffer += data
+            reader.feed(data)
+            first_line = reader.next_message()
         
-        if "\n" in buffer:
-            username, buffer = buffer.split("\n", 1)
+        if first_line is None:
+            first_line = bytes(reader.buffer).decode(errors="replace")
+            reader.buffer.clear()
+        
+        codec = LineCodec()
+        codec.send_lock = lockprof.new_lock("send_lock")
+        initial_room = "general"
+        offer = None
+        if first_line.startswith("[HELLO]"):
+            try:
+                offer = json.loads(first_line[7:])
+            except ValueError:
+                offer = {}
+            username = str(offer.get("username", ""))
+            # Client yang reconnect (mis. setelah restart) langsung kembali ke room terakhir
+            initial_room = str(offer.get("room") or "general")
+            codec = negotiate_codec(offer, COMPRESSION_ENABLED, COMPRESSION_LEVEL, COMPRESSION_THRESHOLD,
+                                    COMPRESSION_MAX_FRAME)
+            codec.send_lock = lockprof.new_lock("send_lock")
+            ack = {"compression": codec.name}
+            if codec.name:
+                ack["threshold"] = codec.threshold
+                ack["dict"] = offer.get("dict")
+            # HELLO_OK selalu dikirim sebagai baris biasa, frame sesudahnya memakai codec
+            with codec.send_lock:
+                client_socket.sendall(f"[HELLO_OK]{json.dumps(ack)}\n".encode())
+            reader.codec = codec
         else:
-            username = buffer
-            buffer = ""
+            username = first_line
             
         username = username.strip()
-        with clients_lock:
-            clients[client_socket] = username
+        # Mulai dari sini semua kiriman ke client lewat outbox (writer thread per koneksi)
+        outbox = Outbox(client_socket, codec, outbox_stats, OUTBOX_LIMITS,
+                        chunks=bool(offer and offer.get("chunks")))
+        outbox.start(f"outbox-{address[1] if isinstance(address, tuple) else address}")
+        session = sessions.add(client_socket, address, username, codec, outbox)
+        event_log.record(EVENT_CONNECT, session.id, initial_room, json.dumps(
+            {"username": username, "address": list(address), "hello": offer}), command="")
+        heartbeat.register(client_socket)
+        limiter = RateLimiter(RATE_LIMITS, UPLOAD_BYTES_PER_SEC, UPLOAD_BURST_BYTES) if RATE_LIMIT_ENABLED else None
 
         # Broadcast pesan join
         join_msg = f"[INFO] {username} bergabung dari {address}"
@@ -365,33 +731,62 @@ def handle_client(client_socket, address, log_file):
         
         # FITUR BARU: Discord-style Rooms initialization
         # Auto-join ke room 'general' saat login
-        with active_room_lock:
-            user_active_room[username] = "general"
+        room = get_room(initial_room)
+        resume_id = str(offer.get("last_id") or "") if offer else ""
+        if room is None:
+            initial_room = "general"
+            room = rooms["general"]
+            resume_id = ""
         
-        join_room("general", username)
+        # Client yang reconnect hanya menerima pesan setelah last_id (bukan history penuh)
+        set_active_room(session, room, resume_id=resume_id or None)
         
         # Kirim info daftar user dan daftar rooms ke client
         broadcast_user_list()
         broadcast_room_list()
         
         # Kirim konfirmasi join room ke client
-        client_socket.send("[ROOM_JOINED]general\n".encode())
+        send_to_client(client_socket, f"[ROOM_JOINED]{initial_room}")
 
         # Loop untuk menerima pesan dari client
-        buffer = ""
         while True:
             try:
-                data = client_socket.recv(4096).decode()
+                data = client_socket.recv(4096)
                 if not data:
                     break
                 
-                buffer += data
-                while "\n" in buffer:
-                    message, buffer = buffer.split("\n", 1)
+                heartbeat.touch(client_socket)
+                reader.feed(data)
+                while not draining:
+                    message = reader.next_message()
+                    if message is None:
+                        break
                     message = message.strip()
                     if not message:
                         continue
 
+                    # 0. HEARTBEAT (last_seen sudah dicatat saat recv)
+                    if message == "[PONG]":
+                        continue
+                    # Dicatat sebelum rate limit agar replay mereproduksi traffic asli
+                    event_log.record(EVENT_COMMAND, session.id, session.active_room_name, message)
+                    if message == "[PING]":
+                        send_to_client(client_socket, "[PONG]")
+                        continue
+                    heartbeat.touch(client_socket, active=True)
+                    
+                    # RATE LIMIT per kelas command (bucket milik thread ini, tanpa lock)
+                    if limiter:
+                        command_class, retry_after = limiter.check(message)
+                        if retry_after is None:
+                            # Melebihi burst: retry tidak akan pernah berhasil, tolak langsung
+                            send_to_client(client_socket, f"[ERROR]{command_class} terlalu besar")
+                            continue
+                        if retry_after:
+                            if limiter.should_notify(command_class, retry_after):
+                                send_to_client(client_socket, f"[RATE_LIMITED]{command_class}:{int(retry_after * 1000) + 1}")
+                            continue
+                    
                     # DEBUG LOGGING (Opsional: simpan ke file log)
                     with open(log_file, "a", encoding="utf-8") as f:
                         f.write(f"[{datetime.now().strftime('%H:%M:%S')}] RECV from {username}: {message}\n")
@@ -399,12 +794,14 @@ def handle_client(client_socket, address, log_file):
                     # Handle berbagai jenis pesan berdasarkan prefix dengan lebih robust
                     
                     # 1. TYPING INDICATOR
+                    # Semua event room diteruskan ke mailbox room aktif
+                    active_room = session.active_room
                     if message.startswith("[TYPING]"):
-                        broadcast_typing_status(username, True)
+                        active_room.tell(active_room.set_typing, client_socket, True)
                         continue
                     
                     elif message.startswith("[STOP_TYPING]"):
-                        broadcast_typing_status(username, False)
+                        active_room.tell(active_room.set_typing, client_socket, False)
                         continue
                     
                     # 2. MESSAGE REACTION
@@ -412,16 +809,20 @@ def handle_client(client_socket, address, log_file):
                         try:
                             data = message[10:]
                             msg_id, emoji = data.split(":", 1)
-                            broadcast_reaction(msg_id, emoji, username, log_file)
+                            active_room.tell(active_room.toggle_reaction, msg_id, emoji, username)
                         except:
                             pass
                         continue
                     
                     # 3. READ RECEIPT
+                    # Format: [READ]room:id1,id2,... (gabungan per interval) atau [READ]msg_id (room aktif)
                     elif message.startswith("[READ]"):
                         try:
-                            msg_id = message[6:]
-                            broadcast_read_status(msg_id, username, log_file)
+                            room_name, _, ids = message[6:].rpartition(":")
+                            room = get_room(room_name) if room_name else active_room
+                            msg_ids = [msg_id for msg_id in ids.split(",") if msg_id][:READ_MAX_IDS]
+                            if room is not None and msg_ids:
+                                room.tell(room.read_receipt, msg_ids, username)
                         except:
                             pass
                         continue
@@ -430,28 +831,26 @@ def handle_client(client_socket, address, log_file):
                     elif message.startswith("[CREATE_ROOM]"):
                         room_name = message[13:].strip()
                         success, m = create_room(room_name, username)
-                        if success:
+                        room = get_room(room_name) if success else None
+                        if room is not None:
                             broadcast_room_list()
-                            join_room(room_name, username)
-                            with active_room_lock:
-                                user_active_room[username] = room_name
-                            client_socket.send(f"[ROOM_CREATED]{room_name}\n".encode())
+                            set_active_room(session, room)
+                            send_to_client(client_socket, f"[ROOM_CREATED]{room_name}")
                             broadcast_user_list()
                         else:
-                            client_socket.send(f"[ROOM_ERROR]{m}\n".encode())
+                            send_to_client(client_socket, f"[ROOM_ERROR]{m}")
                         continue
 
                     # 5. JOIN ROOM
                     elif message.startswith("[JOIN_ROOM]"):
                         room_name = message[11:].strip()
-                        success, m = join_room(room_name, username)
-                        if success:
-                            with active_room_lock:
-                                user_active_room[username] = room_name
-                            client_socket.send(f"[ROOM_JOINED]{room_name}\n".encode())
+                        room = get_room(room_name)
+                        if room is not None:
+                            set_active_room(session, room)
+                            send_to_client(client_socket, f"[ROOM_JOINED]{room_name}")
                             broadcast_user_list()
                         else:
-                            client_socket.send(f"[ROOM_ERROR]{m}\n".encode())
+                            send_to_client(client_socket, "[ROOM_ERROR]Room tidak ditemukan")
                         continue
 
                     # 5.5 DELETE ROOM
@@ -463,53 +862,183 @@ def handle_client(client_socket, address, log_file):
                             broadcast_user_list() 
                             broadcast(f"[INFO] Room '{room_name}' telah dihapus", log_file)
                         else:
-                            client_socket.send(f"[ROOM_ERROR]{m}\n".encode())
+                            send_to_client(client_socket, f"[ROOM_ERROR]{m}")
                         continue
 
                     # 6. SWITCH ROOM
+                    # Format: [SWITCH_ROOM]room atau [SWITCH_ROOM]room:delta
+                    # (client sudah punya display room, minta pesan yang terlewat saja)
                     elif message.startswith("[SWITCH_ROOM]"):
                         room_name = message[13:].strip()
-                        with active_room_lock:
-                            user_active_room[username] = room_name
+                        want_delta = room_name.endswith(":delta")
+                        if want_delta:
+                            room_name = room_name[:-6]
+                        room = get_room(room_name)
+                        if room is None:
+                            send_to_client(client_socket, "[ROOM_ERROR]Room tidak ditemukan")
+                            continue
+                        set_active_room(session, room, want_delta)
                         broadcast_user_list()
                         continue
 
+                    # 6.2 SUBSCRIBE ROOM BACKGROUND
+                    # Format: [SUBSCRIBE]room1,room2,...:mode (mode: unread/mentions)
+                    # Semua room baru saat login dikirim dalam satu command (satu token rate limit)
+                    elif message.startswith("[SUBSCRIBE]"):
+                        room_names, _, mode = message[11:].strip().partition(":")
+                        mode = mode or "unread"
+                        if mode not in SUBSCRIPTION_MODES:
+                            send_to_client(client_socket, "[ROOM_ERROR]Mode subscription invalid")
+                            continue
+                        missing = [room_name for room_name in
+                                   [name for name in room_names.split(",") if name][:SUBSCRIBE_MAX_ROOMS]
+                                   if not subscribe_room(session, room_name, mode)]
+                        if missing:
+                            send_to_client(client_socket, f"[ROOM_ERROR]Room tidak ditemukan: {', '.join(missing)}")
+                        continue
+
+                    elif message.startswith("[UNSUBSCRIBE]"):
+                        room_name = message[13:].strip()
+                        if room_name != session.active_room_name:
+                            room = release_paged_member(room_name, client_socket)
+                            if room is not None:
+                                room.tell(room.unsubscribe, client_socket)
+                            session.rooms.discard(room_name)
+                        continue
+
                     # 6.5 GET ROOM HISTORY
+                    # Format: [GET_HISTORY]room atau [GET_HISTORY]room:last_id (sesudah item terakhir di cache client)
                     elif message.startswith("[GET_HISTORY]"):
-                        room_name = message[13:].strip()
-                        send_room_history(client_socket, room_name)
+                        room_name, _, since_id = message[13:].partition(":")
+                        room = get_room(room_name.strip())
+                        if room is not None:
+                            room.tell(room.send_history, client_socket, since_id.strip() or None)
+                        continue
+
+                    # 6.5 SYNC SAAT LOGIN: delta semua room yang di-cache client dalam satu request
+                    # Format: [SYNC]{"rooms": [{"room", "since"}]} (since = item terakhir di cache client)
+                    # Balasan: [SYNC_ROOM]{"room", "messages", "reactions"} per room, room aktif dulu,
+                    # lalu [SYNC_DONE]
+                    elif message.startswith("[SYNC]"):
+                        try:
+                            wanted = [(str(entry["room"]), str(entry.get("since") or "") or None)
+                                      for entry in json.loads(message[6:])["rooms"][:SYNC_MAX_ROOMS]]
+                        except (ValueError, KeyError, TypeError, AttributeError):
+                            continue
+                        plan = []
+                        for room_name, since_id in wanted:
+                            room = get_room(room_name)
+                            if room is None or any(room is planned for planned, _ in plan):
+                                continue
+                            # Subscribe di sini (urutan mailbox sebelum leave saat disconnect),
+                            # [SWITCH_ROOM]room:delta nanti hanya mengirim pesan sesudah sync
+                            if room is not session.active_room:
+                                room.tell(room.subscribe, client_socket, username, "unread")
+                            session.rooms.add(room_name)
+                            plan.append((room, since_id))
+                        plan.sort(key=lambda item: item[0] is not session.active_room)
+                        if plan:
+                            room, since_id = plan[0]
+                            room.tell(room.sync, client_socket, since_id, plan[1:])
+                        else:
+                            send_to_client(client_socket, "[SYNC_DONE]")
+                        continue
+
+                    # 6.6 FULL-TEXT SEARCH
+                    # Format: [SEARCH]room:query:limit (limit opsional)
+                    # Balasan: [SEARCH_RESULTS]{"room", "query", "results": [{id, seq, sender, time, type, snippet}], "took_ms"}
+                    elif message.startswith("[SEARCH]"):
+                        room_name, _, query = message[8:].partition(":")
+                        limit = 20
+                        head, sep, tail = query.rpartition(":")
+                        if sep and tail.strip().isdigit():
+                            query, limit = head, int(tail)
+                        room = get_room(room_name.strip())
+                        if room is None:
+                            send_to_client(client_socket, "[ROOM_ERROR]Room tidak ditemukan")
+                        else:
+                            room.tell(room.search, client_socket, query.strip(), max(1, min(limit, SEARCH_MAX_RESULTS)))
+                        continue
+
+                    # 6.6 PESAN LAMA (scrollback client yang sudah dipotong)
+                    # Format: [GET_OLDER]room:msg_id:limit
+                    # Balasan: [OLDER]{"room", "before", "messages": [{seq, id, sender, time, type, text}], "more"}
+                    elif message.startswith("[GET_OLDER]"):
+                        try:
+                            room_name, before_id, limit = message[11:].split(":", 2)
+                            limit = max(1, min(int(limit), OLDER_MAX_MESSAGES))
+                        except ValueError:
+                            continue
+                        room = get_room(room_name.strip())
+                        if room is None:
+                            send_to_client(client_socket, "[ROOM_ERROR]Room tidak ditemukan")
+                        else:
+                            room.tell(room.older, client_socket, before_id.strip(), limit)
+                        continue
+
+                    # 6.7 DEBUG: statistik lock (LOCK_PROFILING)
+                    elif message.startswith("[DEBUG_LOCKS]"):
+                        if lockprof.enabled:
+                            for line in lockprof.report():
+                                send_to_client(client_socket, f"[INFO] {line}")
+                        else:
+                            send_to_client(client_socket, "[INFO] Lock profiling nonaktif (LOCK_PROFILING = False)")
+                        continue
+
+                    elif message.startswith("[DEBUG_OUTBOX]"):
+                        for line in outbox_stats.report([s.outbox for s in sessions]):
+                            send_to_client(client_socket, f"[INFO] {line}")
+                        continue
+
+                    elif message.startswith("[DEBUG_ROOMS]"):
+                        send_to_client(client_socket, f"[INFO] {room_cache_summary()}")
+                        for line in fanout_summary():
+                            send_to_client(client_socket, f"[INFO] {line}")
                         continue
 
                     # 7. FILE SHARING
                     elif message.startswith("[FILE]"):
                         handle_file_upload(message, username, log_file)
                         continue
+
+                    # 7.5 DOWNLOAD FILE ON DEMAND
+                    # Format: [GET_FILE]file_id atau [GET_FILE]file_id:variant
+                    elif message.startswith("[GET_FILE]"):
+                        file_id, _, variant = message[10:].strip().partition(":")
+                        send_file_data(client_socket, file_id, variant or "original")
+                        continue
+                    
+                    # 7.8 CHAT DENGAN KEY IDEMPOTENCY
+                    # Format: [SEND]key:teks, balasan [SENT]key:msg_id
+                    # Key yang sama (dikirim ulang setelah reconnect) tidak di-post dua kali
+                    elif message.startswith("[SEND]"):
+                        key, _, text = message[6:].partition(":")
+                        if not key or len(key) > SEND_KEY_MAX_LENGTH or not text.strip():
+                            continue
+                        msg_id = str(uuid.uuid4())
+                        previous_id = recent_sends.claim(username, key, msg_id)
+                        if previous_id is None:
+                            time_msg = datetime.now().strftime("%H:%M:%S")
+                            full_msg = f"[MSG_ID:{msg_id}][{time_msg}] {username}: {text}"
+                            active_room.tell(active_room.post, full_msg, client_socket, msg_id)
+                        send_to_client(client_socket, f"[SENT]{key}:{previous_id or msg_id}")
+                        continue
                     
                     # 8. REGULAR CHAT MESSAGE (Hanya jika tidak ada prefix [XXX])
                     elif not message.startswith("["):
-                        with active_room_lock:
-                            current_room = user_active_room.get(username, "general")
-                        
                         msg_id = str(uuid.uuid4())
                         time_msg = datetime.now().strftime("%H:%M:%S")
                         full_msg = f"[MSG_ID:{msg_id}][{time_msg}] {username}: {message}"
                         
-                        with rooms_lock:
-                            if current_room in rooms:
-                                rooms[current_room]["messages"].append(full_msg)
-                                if len(rooms[current_room]["messages"]) > 50:
-                                    rooms[current_room]["messages"].pop(0)
-                                    
-                        broadcast_to_room(current_room, full_msg, log_file)
-                        
-                        try:
-                            client_socket.send(f"[DELIVERED]{msg_id}\n".encode())
-                        except:
-                            pass
+                        # Room menyimpan ke history, broadcast, lalu kirim [DELIVERED] ke pengirim
+                        active_room.tell(active_room.post, full_msg, client_socket, msg_id)
                     else:
                         # Ini kemungkinan command yang typo atau corrupt, log saja
                         with open(log_file, "a") as f:
                             f.write(f"[WARN] Unknown protocol format: {message}\n")
+                # Selama drain, command baru tidak diproses lagi (state sudah dibekukan)
+                if draining:
+                    break
             except Exception as e:
                 print(f"[ERROR] {e}")
                 break
@@ -518,18 +1047,27 @@ def handle_client(client_socket, address, log_file):
         print(f"[ERROR] {e}")
     finally:
         # Cleanup saat client disconnect
-        if username:
+        heartbeat.unregister(client_socket)
+        sessions.remove(client_socket)
+        if session is not None:
+            event_log.record(EVENT_DISCONNECT, session.id, session.active_room_name, command="")
+        # Sesi yang sudah di-reap tidak perlu broadcast keluar lagi
+        was_reaped = session is not None and session.reaped
+        
+        if session is not None and not was_reaped and not draining:
             leave_msg = f"[INFO] {username} keluar"
             broadcast(leave_msg, log_file)
-            
-            # Reset typing status
-            with typing_lock:
-                if username in typing_users:
-                    del typing_users[username]
-            broadcast_typing_status(username, False)
         
-        with clients_lock:
-            if client_socket in clients:
-                del clients[client_socket]
+        # Keluar dari semua room (room juga mereset typing status)
+        if session is not None:
+            # Salinan: delete_room dari thread lain bisa mengubah session.rooms
+            for room_name in tuple(session.rooms):
+                room = release_paged_member(room_name, client_socket)
+                if room is not None:
+                    room.tell(room.leave, client_socket, not draining)
+        
+        if session is not None and not draining:
+            session.outbox.close(flush=False)
         client_socket.close()
-        broadcast_user_list()
+        if not was_reaped and not draining:
+            broadcast_user_list()
@@ -0,0 +1,209 @@
+import struct
+import threading
+import zlib
+
+# Tipe frame setelah kompresi dinegosiasikan
+# Format frame: [1 byte tipe][4 byte panjang payload][payload]
+FRAME_RAW = 0      # payload UTF-8 apa adanya (frame kecil di bawah threshold)
+FRAME_STREAM = 1   # deflate dengan konteks stream per koneksi (window dipakai lintas frame)
+FRAME_SHARED = 2   # deflate mandiri + preset dictionary, hasilnya bisa dipakai ulang saat broadcast
+
+FRAME_HEADER = struct.Struct("!BI")
+
+# Preset dictionary berisi potongan protokol yang paling sering muncul.
+# Harus identik byte-per-byte dengan PRESET_DICTIONARY di client/protocol.py:
+# client mengirim checksum-nya di [HELLO] dan kompresi hanya dipakai jika cocok
+DICTIONARY_VERSION = 1
+PRESET_DICTIONARY = (
+    b'iVBORw0KGgoAAAANSUhEUgAA/9j/4AAQSkZJRgABAQAAAQABAAD'
+    b'[ROOM_ERROR][ROOM_CREATED][ROOM_JOINED][DELIVERED][READ][REACTION]'
+    b'[STOP_TYPING][TYPING][INFO]  bergabung dari (\'127.0.0.1\',  keluar'
+    b'[FILE_SHARED]general:.png:.jpg:.pdf:'
+    b'[ROOM_LIST]["general", "[USERS]{"": "general", '
+    b'[MSG_ID:][:'
+)
+DICTIONARY_CHECKSUM = zlib.adler32(PRESET_DICTIONARY)  # Sama dengan dictid di header zlib
+
+
+class LineCodec:
+    """
+    Codec untuk client lama / client tanpa kompresi
+    Setiap pesan dikirim sebagai satu baris teks diakhiri newline
+    """
+    name = None
+    settings_key = None
+
+    def __init__(self):
+        # Lock pengiriman: frame dari beberapa thread tidak boleh saling menyisip
+        self.send_lock = threading.Lock()
+
+    def encode(self, message):
+        return (message + "\n").encode()
+
+    def encode_shared(self, message):
+        return (message + "\n").encode()
+
+
+class DeflateCodec:
+    """
+    Codec kompresi deflate per koneksi
+    - Frame unicast memakai konteks stream (window 32KB dipakai lintas frame)
+    - Frame broadcast dikompres mandiri dengan preset dictionary sehingga
+      byte hasilnya sama untuk semua penerima dengan setting yang sama
+    - Frame di bawah threshold dikirim tanpa kompresi
+    - Frame masuk lebih besar dari max_frame (sebelum atau sesudah dekompresi) ditolak,
+      agar payload kecil yang mengembang besar tidak menghabiskan memori server
+    """
+    name = "deflate"
+
+    def __init__(self, level, threshold, max_frame=None):
+        self.level = level
+        self.threshold = threshold
+        self.max_frame = max_frame
+        self.settings_key = (self.name, level, DICTIONARY_VERSION)
+        self.send_lock = threading.Lock()
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=PRESET_DICTIONARY)
+        self.decompressor = zlib.decompressobj(-15, zdict=PRESET_DICTIONARY)
+
+    def encode(self, message):
+        """Encode frame unicast. Wajib dipanggil sambil memegang send_lock (urutan stream)"""
+        payload = message.encode()
+        if len(payload) < self.threshold:
+            return FRAME_HEADER.pack(FRAME_RAW, len(payload)) + payload
+        data = self.compressor.compress(payload) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return FRAME_HEADER.pack(FRAME_STREAM, len(data)) + data
+
+    def encode_shared(self, message):
+        """Encode frame tanpa state koneksi, aman dipakai ulang untuk banyak penerima"""
+        payload = message.encode()
+        if len(payload) < self.threshold:
+            return FRAME_HEADER.pack(FRAME_RAW, len(payload)) + payload
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=PRESET_DICTIONARY)
+        data = compressor.compress(payload) + compressor.flush()
+        return FRAME_HEADER.pack(FRAME_SHARED, len(data)) + data
+
+    def decode(self, frame_type, data):
+        if frame_type == FRAME_RAW:
+            return data.decode()
+        if frame_type == FRAME_STREAM:
+            decompressor = self.decompressor
+        elif frame_type == FRAME_SHARED:
+            decompressor = zlib.decompressobj(-15, zdict=PRESET_DICTIONARY)
+        else:
+            raise ValueError(f"Tipe frame tidak dikenal: {frame_type}")
+        if self.max_frame is None:
+            return decompressor.decompress(data).decode()
+        payload = decompressor.decompress(data, self.max_frame)
+        if decompressor.unconsumed_tail:
+            # Konteks stream sudah tidak bisa dipakai lagi, koneksi harus ditutup
+            raise ValueError(f"Frame melebihi {self.max_frame} byte setelah dekompresi")
+        return payload.decode()
+
+
+def negotiate_codec(offer, enabled, level, threshold, max_frame=None):
+    """
+    Pilih codec berdasarkan penawaran client di [HELLO]
+    Args:
+        offer: Dictionary dari JSON [HELLO]
+        enabled: Apakah server mengizinkan kompresi
+        level: Level kompresi zlib
+        threshold: Ukuran minimum frame yang dikompres
+        max_frame: Ukuran maksimal frame dari client, None = tanpa batas
+    Returns:
+        Instance LineCodec atau DeflateCodec
+    """
+    if (enabled and DeflateCodec.name in offer.get("compression", [])
+            and offer.get("dict") == DICTIONARY_VERSION):
+        # Client lama tidak mengirim checksum; checksum beda = dictionary tidak identik,
+        # semua frame dictionary akan rusak, jadi kirim tanpa kompresi
+        checksum = offer.get("dict_checksum")
+        if checksum is None or checksum == DICTIONARY_CHECKSUM:
+            return DeflateCodec(level, threshold, max_frame)
+        print(f"[WARN] Checksum dictionary client {checksum} != {DICTIONARY_CHECKSUM}, kompresi dimatikan")
+    return LineCodec()
+
+
+class FrameReader:
+    """
+    Memecah byte stream dari socket menjadi pesan teks
+    Mode baris (codec None atau LineCodec) atau mode frame (DeflateCodec)
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.codec = None
+
+    def feed(self, data):
+        self.buffer += data
+
+    def next_message(self):
+        """Ambil satu pesan lengkap dari buffer, None jika belum lengkap"""
+        if not isinstance(self.codec, DeflateCodec):
+            idx = self.buffer.find(b"\n")
+            if idx < 0:
+                return None
+            line = bytes(self.buffer[:idx])
+            del self.buffer[:idx + 1]
+            return line.decode(errors="replace")
+
+        if len(self.buffer) < FRAME_HEADER.size:
+            return None
+        frame_type, length = FRAME_HEADER.unpack_from(self.buffer)
+        if self.codec.max_frame is not None and length > self.codec.max_frame:
+            # Ditolak dari header, sebelum payload-nya ditampung di buffer
+            raise ValueError(f"Frame {length} byte melebihi {self.codec.max_frame} byte")
+        end = FRAME_HEADER.size + length
+        if len(self.buffer) < end:
+            return None
+        data = bytes(self.buffer[FRAME_HEADER.size:end])
+        del self.buffer[:end]
+        return self.codec.decode(frame_type, data)
+
+
+class BroadcastFrame:
+    """
+    Satu pesan broadcast yang di-encode sekali per setting kompresi
+    Penerima dengan settings_key yang sama memakai byte hasil kompresi yang sama,
+    sehingga biaya CPU tidak naik seiring jumlah penerima
+    """
+    def __init__(self, message):
+        self.message = message
+        self._encoded = {}
+        self.chunks = None  # Potongan [CHUNK] untuk lane bulk (lihat outbox.split_chunks)
+
+    def for_codec(self, codec):
+        key = codec.settings_key
+        data = self._encoded.get(key)
+        if data is None:
+            data = codec.encode_shared(self.message)
+            self._encoded[key] = data
+        return data
+
+    def cached(self, settings_key):
+        """Hasil encode untuk setting ini jika sudah pernah dibuat, selain itu None"""
+        return self._encoded.get(settings_key)
+
+
+# Batas jumlah buffer per sendmsg (IOV_MAX Linux = 1024)
+MAX_IOV = 1024
+
+
+def send_frames(sock, frames):
+    """
+    Kirim banyak frame dengan vectored write (sendmsg), bukan satu send per frame
+    Kiriman parsial dilanjutkan dari byte yang belum terkirim
+    Args:
+        sock: Socket tujuan (pemanggil memegang send_lock codec)
+        frames: Sequence bytes yang sudah di-encode
+    """
+    if not hasattr(sock, "sendmsg"):
+        # Windows: tanpa sendmsg, gabungkan jadi satu sendall
+        sock.sendall(b"".join(frames))
+        return
+    buffers = [memoryview(frame) for frame in frames if frame]
+    while buffers:
+        sent = sock.sendmsg(buffers[:MAX_IOV])
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if sent:
+            buffers[0] = buffers[0][sent:]
@@ -14,3 +14,123 @@ if not os.path.exists(LOG_DIR):
 
 if not os.path.exists(LOG_FILE):
     open(LOG_FILE, "w").close()
+
+# Kompresi stream per koneksi (dinegosiasikan saat handshake [HELLO])
+COMPRESSION_ENABLED = True
+COMPRESSION_LEVEL = 6
+COMPRESSION_THRESHOLD = 256  # Frame lebih kecil dari ini (byte) dikirim tanpa kompresi
+# Frame dari client maksimal (byte, sebelum dan sesudah dekompresi), lebih besar = koneksi ditutup
+# Harus lebih besar dari UPLOAD_BURST_BYTES agar [FILE] kebesaran masih dijawab [ERROR]
+COMPRESSION_MAX_FRAME = 16 * 1024 * 1024
+
+# Heartbeat aplikasi ([PING]/[PONG]) dan reaper sesi mati
+HEARTBEAT_INTERVAL = 30   # Detik tanpa data dari client sebelum server mengirim [PING]
+HEARTBEAT_TIMEOUT = 15    # Detik menunggu balasan [PONG] sebelum sesi di-reap
+IDLE_TIMEOUT = None       # Detik tanpa command (selain [PONG]) sebelum sesi ditutup, None = nonaktif
+REAPER_TICK = 1.0         # Resolusi timer wheel reaper (detik)
+
+# TCP keepalive pada socket client
+TCP_KEEPALIVE = True
+TCP_KEEPIDLE = 60         # Detik idle sebelum probe pertama
+TCP_KEEPINTVL = 10        # Detik antar probe
+TCP_KEEPCNT = 5           # Probe gagal sebelum OS menutup koneksi
+TCP_USER_TIMEOUT = 120    # Detik maksimal data tak ter-ACK (Linux), None = default OS
+
+# Restart tanpa downtime (python server.py --takeover)
+RUN_DIR = os.path.join(BASE_DIR, "..", "run")
+DATA_DIR = os.path.join(BASE_DIR, "..", "data")
+HANDOFF_SOCKET = os.path.join(RUN_DIR, "handoff.sock")
+STATE_FILE = os.path.join(DATA_DIR, "state.json")
+DRAIN_TIMEOUT = 5             # Detik menunggu client menutup koneksi sebelum dipaksa
+RECONNECT_DELAY_MIN_MS = 500  # Rentang jitter hint [RECONNECT] agar reconnect tidak serentak
+RECONNECT_DELAY_MAX_MS = 15000
+
+# Rate limit per sesi (token bucket per kelas command)
+RATE_LIMIT_ENABLED = True
+RATE_LIMITS = {
+    # kelas: (token per detik, burst)
+    "chat": (5, 15),
+    "typing": (4, 10),
+    "reaction": (5, 15),
+    "read": (20, 60),
+    "room": (1, 5),
+    "subscribe": (2, 10),  # [SUBSCRIBE]/[UNSUBSCRIBE] background, terpisah dari pindah/buat room
+    "history": (2, 10),
+    "file": (0.2, 3),
+    "other": (5, 15),
+}
+UPLOAD_BYTES_PER_SEC = 1024 * 1024       # Budget byte frame [FILE] per detik
+UPLOAD_BURST_BYTES = 10 * 1024 * 1024    # Frame [FILE] lebih besar dari ini ditolak dengan [ERROR] (5MB base64 ~ 7MB)
+
+# Room actor: tiap room punya mailbox yang diproses worker dari pool
+ROOM_WORKERS = 8          # Jumlah thread worker room
+ROOM_MAILBOX_BATCH = 64   # Pesan mailbox per giliran sebelum room lain mendapat worker
+ROOM_HISTORY_LIMIT = 50   # Jumlah pesan terakhir yang disimpan sebagai history per room
+
+# Batching fan-out room ramai: pesan yang datang berdekatan dikirim sebagai satu write per member
+# Window per room dihitung ulang tiap flush dari laju pesan (EWMA) dan durasi fan-out
+# None = tiap pesan langsung dikirim sendiri-sendiri
+FANOUT_BATCH = {
+    "max_delay": 0.010,  # Target latensi (detik): window + durasi fan-out tidak melebihi ini
+    "target_batch": 8,   # Jumlah pesan per flush yang ingin dicapai (window = target_batch / laju)
+    "min_batch": 2,      # Window hanya dipakai jika perkiraan pesan per batch minimal sebanyak ini
+    "alpha": 0.2,        # Bobot EWMA laju pesan dan durasi fan-out
+}
+
+# LRU room cache: room tanpa member di-page ke disk dan dimuat lagi saat dibutuhkan
+ROOM_STORE_DIR = os.path.join(DATA_DIR, "rooms")
+ROOM_IDLE_TIMEOUT = 600               # Detik tanpa aktivitas sebelum room kosong di-page keluar
+ROOM_MAX_RESIDENT = 1000              # Budget jumlah room di memori
+ROOM_MEMORY_BUDGET = 64 * 1024 * 1024 # Budget total byte history room di memori
+ROOM_SWEEP_INTERVAL = 30              # Detik antar pemeriksaan LRU
+
+# Profiler lock untuk debugging contention (nonaktif = threading.Lock biasa, tanpa overhead)
+LOCK_PROFILING = False
+LOCK_STALL_THRESHOLD = 2.0    # Detik sebuah lock dipegang sebelum stack semua thread di-dump
+LOCK_WATCHDOG_INTERVAL = 0.5  # Detik antar pemeriksaan watchdog
+LOCK_REPORT_FILE = os.path.join(LOG_DIR, "locks.log")
+LOCK_REPORT_INTERVAL = 60     # Detik antar laporan berkala ke LOCK_REPORT_FILE, None = nonaktif
+
+# File upload + thumbnail gambar (dibuat sekali per upload di process pool, butuh Pillow)
+UPLOAD_DIR = os.path.join(BASE_DIR, "..", "uploads")
+THUMBNAILS_ENABLED = True
+THUMBNAIL_MAX_WIDTH = 300
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = 2
+
+# Full-text search [SEARCH] (index per room, posting list di disk)
+SEARCH_INDEX_DIR = os.path.join(DATA_DIR, "index")
+SEARCH_FLUSH_DOCS = 512              # Pesan di tail memori per room sebelum ditulis sebagai segmen
+SEARCH_MAX_SEGMENT_DOCS = 65536      # Segmen sebesar ini tidak digabung lagi
+SEARCH_CACHE_TERMS = 1000000         # Budget total term kamus segmen di memori (semua room)
+SEARCH_MAX_RESULTS = 50
+OLDER_MAX_MESSAGES = 100             # Pesan maksimal per [GET_OLDER] (scrollback client, dibaca dari index)
+OLDER_MAX_SCAN = 5000                # Dokumen index maksimal yang diperiksa untuk menemukan msg_id
+READ_MAX_IDS = 100                   # msg_id maksimal per [READ] gabungan
+SYNC_MAX_ROOMS = 20                  # Room maksimal per [SYNC] login
+SUBSCRIBE_MAX_ROOMS = 50             # Room maksimal per [SUBSCRIBE] gabungan
+
+# Idempotency [SEND]key:teks: key yang sudah diproses diingat per user agar pesan yang
+# dikirim ulang client setelah reconnect tidak tampil dua kali
+SEND_DEDUP_KEYS = 256                # Key terakhir yang diingat per username
+SEND_DEDUP_TTL = 600                 # Detik key diingat
+SEND_KEY_MAX_LENGTH = 64
+
+# Event log terstruktur untuk replay/analitik (bench/events.py), terpisah dari chat.log
+EVENT_LOG_ENABLED = False
+EVENT_LOG_DIR = os.path.join(LOG_DIR, "events")
+EVENT_LOG_MAX_BYTES = 256 * 1024 * 1024  # Ukuran file .evl sebelum pindah ke file baru
+EVENT_LOG_INLINE_MAX = 4096              # Payload lebih besar (byte) disimpan di file .blob
+EVENT_LOG_INDEX_INTERVAL = 1.0           # Detik antar entri index waktu (.idx)
+
+# Antrean kirim per koneksi dengan lane prioritas: control/chat > presence > typing/receipt > bulk
+OUTBOX_LIMITS = {
+    "behind_bytes": 256 * 1024,      # Antrean melebihi ini: typing/read receipt baru dibuang
+    "max_bytes": 32 * 1024 * 1024,   # Antrean melebihi ini: koneksi ditutup (client terlalu lambat)
+    "ephemeral_max": 256,            # Jumlah typing/receipt antre maksimal per koneksi
+    "chunk_size": 16 * 1024,         # Panjang potongan [CHUNK] di lane bulk ([FILE_DATA]); chat dan
+                                     # [FILE_SHARED] tetap di lane control agar urutan room terjaga
+    "batch_bytes": 256 * 1024,       # Byte maksimal per vectored write thread writer
+    "sndbuf": 128 * 1024,            # SO_SNDBUF socket client: antrean tetap di outbox (bisa diprioritaskan)
+                                     # bukan di buffer kernel, None = autotuning OS
+}
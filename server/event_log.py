@@ -0,0 +1,290 @@
+import bisect
+import os
+import queue
+import struct
+import threading
+import time
+from rate_limiter import COMMAND_CLASSES
+
+# Event log terstruktur (opsional, EVENT_LOG_ENABLED di config.py)
+# Berbeda dengan chat.log (teks bebas), file ini bisa di-parse dan di-replay:
+#   events-<waktu>-<pid>.evl   MAGIC lalu record: !I panjang body + body
+#       body = RECORD_HEAD (timestamp, session id, jenis, flags, panjang command)
+#              + command (utf-8) + !B panjang room + room (utf-8) + payload
+#       payload inline (utf-8), atau flags & FLAG_BLOB: BLOB_REF (offset, panjang) ke file .blob
+#   events-....idx             entri INDEX_ENTRY (timestamp, offset record di .evl)
+#                              tiap index_interval detik, untuk seek berdasarkan waktu
+#   events-....blob            payload besar (mis. [FILE] upload) agar .evl tetap ringkas
+# Penulisan lewat satu thread writer: handler hanya memasukkan event ke queue
+
+MAGIC = b"TBEV\x01"
+RECORD_LENGTH = struct.Struct("!I")
+RECORD_HEAD = struct.Struct("!dIBBB")
+BLOB_REF = struct.Struct("!QI")
+INDEX_ENTRY = struct.Struct("!dQ")
+
+EVENT_CONNECT = 1     # payload: JSON {"username", "address", "hello"}
+EVENT_COMMAND = 2     # payload: pesan client tanpa command prefix
+EVENT_DISCONNECT = 3
+EVENT_NAMES = {EVENT_CONNECT: "connect", EVENT_COMMAND: "command", EVENT_DISCONNECT: "disconnect"}
+
+FLAG_BLOB = 1
+
+CHAT_COMMAND = "CHAT"  # Pesan chat biasa (tanpa prefix command protokol)
+
+# Hanya command protokol yang dipisah; "[café] halo" tetap dicatat utuh sebagai chat
+PROTOCOL_COMMANDS = frozenset([prefix for prefix, _ in COMMAND_CLASSES] + [
+    "[PING]", "[PONG]", "[DEBUG_ROOMS]", "[DEBUG_LOCKS]", "[DEBUG_OUTBOX]",
+])
+
+
+def split_command(message):
+    """
+    Pisahkan prefix command dan payload pesan client
+    Returns:
+        (command, payload), mis. ("[TYPING]", "") atau ("CHAT", "halo")
+    """
+    if message.startswith("["):
+        end = message.find("]")
+        if message[:end + 1] in PROTOCOL_COMMANDS:
+            return message[:end + 1], message[end + 1:]
+    return CHAT_COMMAND, message
+
+
+def join_command(command, payload):
+    """Kebalikan split_command: pesan asli yang dikirim client"""
+    return payload if command == CHAT_COMMAND else command + payload
+
+
+class Event:
+    """
+    Satu record event log
+    Payload besar tidak dibaca sampai payload() dipanggil
+    """
+    __slots__ = ("timestamp", "session", "kind", "command", "room", "inline", "blob_path", "blob_ref")
+
+    def __init__(self, timestamp, session, kind, command, room, inline, blob_path=None, blob_ref=None):
+        self.timestamp = timestamp
+        self.session = session
+        self.kind = kind
+        self.command = command
+        self.room = room
+        self.inline = inline
+        self.blob_path = blob_path
+        self.blob_ref = blob_ref
+
+    def payload(self):
+        if self.blob_ref is None:
+            return self.inline
+        offset, length = self.blob_ref
+        with open(self.blob_path, "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode("utf-8", errors="replace")
+
+    @property
+    def message(self):
+        """Pesan client asli (hanya untuk EVENT_COMMAND)"""
+        return join_command(self.command, self.payload())
+
+
+class EventLog:
+    """
+    Writer event log di thread terpisah
+    Args:
+        directory: Folder file event log
+        max_bytes: Ukuran .evl sebelum pindah ke file baru
+        inline_max: Payload lebih besar dari ini (byte) ditulis ke .blob
+        index_interval: Detik antar entri index waktu
+    """
+    def __init__(self, directory, max_bytes, inline_max, index_interval):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.inline_max = inline_max
+        self.index_interval = index_interval
+        self.queue = None  # None = event log nonaktif, record() tidak melakukan apa-apa
+        self.thread = None
+        self.files = None
+        self.next_index_at = 0.0
+        self.records = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return self.queue is not None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._open()
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self.thread.start()
+
+    def record(self, kind, session_id, room, message="", command=None):
+        """
+        Catat satu event (dipanggil thread handler, hanya memasukkan ke queue)
+        Args:
+            kind: EVENT_CONNECT / EVENT_COMMAND / EVENT_DISCONNECT
+            session_id: ID sesi (Session.id)
+            room: Room aktif sesi saat event terjadi
+            message: Pesan client (EVENT_COMMAND) atau payload event
+            command: Command eksplisit, None = dipisah dari message
+        """
+        q = self.queue
+        if q is None:
+            return
+        if command is None:
+            command, message = split_command(message)
+        q.put((time.time(), session_id, kind, command, room, message))
+
+    def close(self):
+        """Tulis semua event yang masih antre lalu tutup file (dipanggil saat handoff)"""
+        q = self.queue
+        if q is None:
+            return
+        self.queue = None
+        q.put(None)
+        self.thread.join(timeout=5)
+
+    def _open(self):
+        if self.files:
+            for f in self.files:
+                f.close()
+        base = os.path.join(self.directory, f"events-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        suffix = 0
+        while os.path.exists(base + (f"-{suffix}" if suffix else "") + ".evl"):
+            suffix += 1
+        if suffix:
+            base += f"-{suffix}"
+        log = open(base + ".evl", "wb")
+        log.write(MAGIC)
+        self.files = (log, open(base + ".idx", "wb"), open(base + ".blob", "wb"))
+        self.next_index_at = 0.0
+
+    def _run(self):
+        q = self.queue
+        while True:
+            item = q.get()
+            stop = False
+            # Tulis semua yang sudah antre sekaligus, flush sekali per batch
+            while item is not None:
+                try:
+                    self._write(*item)
+                except Exception as e:
+                    self.dropped += 1
+                    print(f"[ERROR] Event log: {e}")
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                stop = True
+            for f in self.files:
+                f.flush()
+            if stop:
+                for f in self.files:
+                    f.close()
+                return
+
+    def _write(self, timestamp, session_id, kind, command, room, payload):
+        log, index, blob = self.files
+        if log.tell() >= self.max_bytes:
+            self._open()
+            log, index, blob = self.files
+        offset = log.tell()
+        if timestamp >= self.next_index_at:
+            index.write(INDEX_ENTRY.pack(timestamp, offset))
+            self.next_index_at = timestamp + self.index_interval
+
+        command_bytes = command.encode()
+        room_bytes = (room or "").encode()[:255]
+        data = payload.encode("utf-8", errors="replace")
+        flags = 0
+        if len(data) > self.inline_max:
+            flags |= FLAG_BLOB
+            ref = BLOB_REF.pack(blob.tell(), len(data))
+            blob.write(data)
+            data = ref
+        body = b"".join((
+            RECORD_HEAD.pack(timestamp, session_id, kind, flags, len(command_bytes)),
+            command_bytes,
+            bytes((len(room_bytes),)),
+            room_bytes,
+            data,
+        ))
+        log.write(RECORD_LENGTH.pack(len(body)) + body)
+        self.records += 1
+
+
+# ---- Membaca ----
+
+def _file_order(path):
+    # events-<tanggal>-<jam>-<pid>[-<n>].evl: file rotasi di detik yang sama diberi
+    # akhiran -1, -2, ... jadi diurutkan sebagai angka sesudah file tanpa akhiran
+    parts = os.path.basename(path)[:-4].split("-")
+    suffix = parts[4] if len(parts) > 4 else "0"
+    return parts[:4], int(suffix) if suffix.isdigit() else 0
+
+
+def log_files(path):
+    """File .evl dari satu file atau folder event log, urut waktu"""
+    if os.path.isdir(path):
+        return sorted((os.path.join(path, name) for name in os.listdir(path) if name.endswith(".evl")),
+                      key=_file_order)
+    return [path]
+
+
+def seek_offset(evl_path, since):
+    """Offset record pertama yang mungkin >= since (dari file .idx), 0 jika tidak ada index"""
+    entries = []
+    try:
+        with open(evl_path[:-4] + ".idx", "rb") as f:
+            data = f.read()
+    except OSError:
+        return 0
+    for i in range(0, len(data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size):
+        entries.append(INDEX_ENTRY.unpack_from(data, i))
+    position = bisect.bisect_right([timestamp for timestamp, _ in entries], since) - 1
+    return entries[position][1] if position >= 0 else 0
+
+
+def read_events(path, since=None, until=None):
+    """
+    Baca event secara streaming (tidak memuat seluruh file)
+    Args:
+        path: File .evl atau folder event log
+        since, until: Batas timestamp (unix), None = tanpa batas
+    Yields:
+        Event urut waktu
+    """
+    for evl_path in log_files(path):
+        blob_path = evl_path[:-4] + ".blob"
+        with open(evl_path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{evl_path} bukan file event log")
+            if since is not None:
+                f.seek(max(len(MAGIC), seek_offset(evl_path, since)))
+            while True:
+                header = f.read(RECORD_LENGTH.size)
+                if len(header) < RECORD_LENGTH.size:
+                    break
+                (length,) = RECORD_LENGTH.unpack(header)
+                body = f.read(length)
+                if len(body) < length:
+                    break  # Record terakhir terpotong (server berhenti saat menulis)
+                timestamp, session, kind, flags, command_length = RECORD_HEAD.unpack_from(body)
+                if since is not None and timestamp < since:
+                    continue
+                if until is not None and timestamp > until:
+                    return
+                position = RECORD_HEAD.size
+                command = body[position:position + command_length].decode()
+                position += command_length
+                room_length = body[position]
+                room = body[position + 1:position + 1 + room_length].decode()
+                position += 1 + room_length
+                if flags & FLAG_BLOB:
+                    yield Event(timestamp, session, kind, command, room, None,
+                                blob_path, BLOB_REF.unpack_from(body, position))
+                else:
+                    yield Event(timestamp, session, kind, command, room,
+                                body[position:].decode("utf-8", errors="replace"))
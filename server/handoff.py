@@ -0,0 +1,140 @@
+import array
+import json
+import os
+import socket
+import threading
+
+# Handoff listening socket antar proses server (restart tanpa downtime)
+# Alur:
+#   1. Proses baru (server.py --takeover) connect ke HANDOFF_SOCKET dan kirim TAKEOVER
+#   2. Proses lama berhenti accept() lalu mengirim fd listening socket (SCM_RIGHTS)
+#   3. Proses lama men-drain sesi (hint [RECONNECT]) dan menyimpan state ke STATE_FILE
+#   4. Proses lama kirim READY, proses baru memuat state lalu mulai accept()
+
+TAKEOVER = b"TAKEOVER\n"
+READY = b"READY\n"
+
+
+def is_supported():
+    """fd passing hanya tersedia di Unix (AF_UNIX + SCM_RIGHTS)"""
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "SCM_RIGHTS")
+
+
+def send_fd(conn, fd):
+    """Kirim satu file descriptor lewat Unix socket"""
+    conn.sendmsg([b"L"], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", [fd]))])
+
+
+def recv_fd(conn):
+    """Terima satu file descriptor dari Unix socket"""
+    fds = array.array("i")
+    msg, ancdata, flags, addr = conn.recvmsg(1, socket.CMSG_LEN(fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+            return fds[0]
+    raise RuntimeError("Proses lama tidak mengirim listening socket")
+
+
+def save_state(path, state):
+    """Simpan state server secara atomik (tulis file sementara lalu rename)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def load_state(path):
+    """Baca state server, None jika file belum ada"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def take_over(path):
+    """
+    Ambil alih listening socket dari proses server yang sedang berjalan
+    Args:
+        path: Path Unix socket handoff
+    Returns:
+        Listening socket yang siap dipakai accept()
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(path)
+    try:
+        conn.sendall(TAKEOVER)
+        fd = recv_fd(conn)
+        listener = socket.socket(fileno=fd)
+
+        # Tunggu proses lama selesai drain + simpan state
+        buffer = b""
+        while not buffer.endswith(READY):
+            data = conn.recv(64)
+            if not data:
+                raise RuntimeError("Proses lama berhenti sebelum handoff selesai")
+            buffer += data
+        return listener
+    finally:
+        conn.close()
+
+
+class HandoffController:
+    """
+    Menunggu permintaan takeover dari proses server baru
+    Args:
+        path: Path Unix socket handoff
+        listener: Listening socket server saat ini
+        on_drain: fn() yang men-drain sesi dan menyimpan state sebelum READY
+    """
+    def __init__(self, path, listener, on_drain):
+        self.path = path
+        self.listener = listener
+        self.on_drain = on_drain
+        self.stop_accepting = threading.Event()
+        self.accept_stopped = threading.Event()
+        self.finished = threading.Event()
+        self.control = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.control.bind(self.path)
+        self.control.listen(1)
+        threading.Thread(target=self._serve, name="handoff", daemon=True).start()
+
+    def _serve(self):
+        while True:
+            conn, _ = self.control.accept()
+            try:
+                conn.settimeout(5)
+                if conn.recv(len(TAKEOVER)) != TAKEOVER:
+                    conn.close()
+                    continue
+                conn.settimeout(None)
+            except OSError:
+                conn.close()
+                continue
+            break
+
+        print("[HANDOFF] Permintaan takeover diterima, berhenti accept()")
+        self.stop_accepting.set()
+        self.accept_stopped.wait()
+
+        try:
+            send_fd(conn, self.listener.fileno())
+            self.on_drain()
+        finally:
+            self.control.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            try:
+                conn.sendall(READY)
+            except OSError:
+                pass
+            conn.close()
+            self.finished.set()
+        print("[HANDOFF] Listening socket dan state sudah diserahkan")
@@ -0,0 +1,191 @@
+import math
+import socket
+import threading
+import time
+
+
+def apply_keepalive(sock, idle, interval, count, user_timeout=None):
+    """
+    Aktifkan TCP keepalive pada socket client
+    Args:
+        sock: Socket client hasil accept()
+        idle: Detik idle sebelum probe pertama
+        interval: Detik antar probe
+        count: Jumlah probe gagal sebelum koneksi dianggap putus
+        user_timeout: Batas (detik) data tak ter-ACK sebelum koneksi ditutup OS (Linux)
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+    elif hasattr(socket, "TCP_KEEPALIVE"):
+        # macOS memakai nama TCP_KEEPALIVE untuk idle time
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+    if hasattr(socket, "TCP_KEEPCNT"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+    if hasattr(socket, "SIO_KEEPALIVE_VALS"):
+        # Windows: (on/off, idle ms, interval ms)
+        sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle * 1000, interval * 1000))
+    if user_timeout and hasattr(socket, "TCP_USER_TIMEOUT"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int(user_timeout * 1000))
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: semua timeout sesi disimpan di ring slot
+    dan dimajukan oleh satu thread, tanpa timer/thread per koneksi
+    """
+    def __init__(self, tick, slots=512):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # Tiap slot: {key: sisa putaran}
+        self.positions = {}  # key -> index slot
+        self.cursor = 0
+        self.lock = threading.Lock()
+
+    def schedule(self, key, delay):
+        """Jadwalkan (atau jadwalkan ulang) key agar expire setelah delay detik"""
+        ticks = max(1, int(math.ceil(delay / self.tick)))
+        with self.lock:
+            self._remove(key)
+            idx = (self.cursor + ticks) % len(self.slots)
+            self.slots[idx][key] = (ticks - 1) // len(self.slots)
+            self.positions[key] = idx
+
+    def cancel(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        idx = self.positions.pop(key, None)
+        if idx is not None:
+            self.slots[idx].pop(key, None)
+
+    def advance(self):
+        """Maju satu tick, kembalikan list key yang expire"""
+        with self.lock:
+            self.cursor = (self.cursor + 1) % len(self.slots)
+            slot = self.slots[self.cursor]
+            expired = []
+            for key, rounds in list(slot.items()):
+                if rounds > 0:
+                    slot[key] = rounds - 1
+                else:
+                    expired.append(key)
+                    del slot[key]
+                    del self.positions[key]
+            return expired
+
+
+class HeartbeatState:
+    """Waktu aktivitas satu sesi (diisi thread handler tanpa lock)"""
+    __slots__ = ("last_seen", "last_active", "ping_sent")
+
+    def __init__(self, now):
+        self.last_seen = now     # Byte apa pun terakhir diterima (termasuk [PONG])
+        self.last_active = now   # Command terakhir selain [PONG]
+        self.ping_sent = None    # Waktu [PING] dikirim dan belum dibalas
+
+
+class HeartbeatMonitor:
+    """
+    Ping/pong tingkat aplikasi + reaper sesi mati/idle
+    Satu thread memajukan TimerWheel; sesi yang expire diperiksa lalu
+    dijadwalkan ulang, di-ping, atau dikumpulkan untuk di-reap sekaligus
+    """
+    def __init__(self, interval, timeout, idle_timeout, tick):
+        self.interval = interval
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.wheel = TimerWheel(tick)
+        self.sessions = {}  # socket -> HeartbeatState
+        self.send_ping = None
+        self.on_reap = None
+        self.running = False
+
+    def start(self, send_ping, on_reap):
+        """
+        Jalankan thread reaper
+        Args:
+            send_ping: fn(socket) -> True jika [PING] masuk outbox sesi, False jika sesi sudah ditutup
+            on_reap: fn(list socket) dipanggil sekali per tick untuk semua sesi yang di-reap
+        """
+        self.send_ping = send_ping
+        self.on_reap = on_reap
+        self.running = True
+        threading.Thread(target=self._run, name="heartbeat-reaper", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def register(self, sock):
+        self.sessions[sock] = HeartbeatState(time.monotonic())
+        self.wheel.schedule(sock, self.interval)
+
+    def unregister(self, sock):
+        self.sessions.pop(sock, None)
+        self.wheel.cancel(sock)
+
+    def touch(self, sock, active=False):
+        """Catat aktivitas dari client (hot path: hanya assignment, tanpa lock)"""
+        state = self.sessions.get(sock)
+        if state is not None:
+            now = time.monotonic()
+            state.last_seen = now
+            if active:
+                state.last_active = now
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while self.running:
+            next_tick += self.wheel.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                reaped = []
+                for sock in self.wheel.advance():
+                    if self._check(sock):
+                        reaped.append(sock)
+                if reaped:
+                    for sock in reaped:
+                        self.unregister(sock)
+                    self.on_reap(reaped)
+            except Exception as e:
+                print(f"[ERROR] Heartbeat: {e}")
+
+    def _check(self, sock):
+        """Periksa satu sesi yang expire. Return True jika sesi harus di-reap"""
+        state = self.sessions.get(sock)
+        if state is None:
+            return False
+        now = time.monotonic()
+
+        if self.idle_timeout and now - state.last_active >= self.idle_timeout:
+            return True
+
+        if state.ping_sent is not None:
+            if state.last_seen >= state.ping_sent:
+                # Pong (atau data lain) sudah diterima sejak ping terakhir
+                state.ping_sent = None
+            elif now - state.ping_sent >= self.timeout:
+                return True
+            else:
+                self._reschedule(sock, state, now, self.timeout - (now - state.ping_sent))
+                return False
+
+        silent = now - state.last_seen
+        if silent < self.interval:
+            self._reschedule(sock, state, now, self.interval - silent)
+            return False
+
+        if not self.send_ping(sock):
+            return True
+        state.ping_sent = now
+        self._reschedule(sock, state, now, self.timeout)
+        return False
+
+    def _reschedule(self, sock, state, now, delay):
+        if self.idle_timeout:
+            delay = min(delay, self.idle_timeout - (now - state.last_active))
+        self.wheel.schedule(sock, delay)
@@ -0,0 +1,206 @@
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+
+# Profiler lock opsional (LOCK_PROFILING di config.py)
+# - new_lock(name) mengembalikan threading.Lock biasa saat profiling nonaktif,
+#   jadi overhead saat nonaktif nol (tidak ada wrapper sama sekali)
+# - Saat aktif: ProfiledLock mencatat waktu tunggu, waktu pegang dan call site
+#   pemegang lock ke histogram per nama lock
+# - Watchdog men-dump stack semua thread jika ada lock dipegang melewati threshold
+
+# Batas atas bucket histogram (mikrodetik), bucket terakhir = di atas batas terakhir
+BUCKETS_US = (10, 100, 1000, 10000, 100000, 1000000)
+
+enabled = False
+stall_threshold = 2.0
+report_file = None
+live_locks = weakref.WeakSet()
+stats = {}  # nama lock -> LockStats
+stats_lock = threading.Lock()  # Lock internal (tidak diinstrumentasi)
+
+
+def _bucket(seconds):
+    us = seconds * 1000000
+    for i, limit in enumerate(BUCKETS_US):
+        if us < limit:
+            return i
+    return len(BUCKETS_US)
+
+
+def _call_site(depth):
+    frame = sys._getframe(depth)
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+
+
+class LockStats:
+    """Histogram wait/hold dan call site untuk semua lock dengan nama yang sama"""
+    def __init__(self, name):
+        self.name = name
+        self.acquired = 0
+        self.contended = 0  # Acquire yang harus menunggu (lock sedang dipegang)
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+        self.wait_hist = [0] * (len(BUCKETS_US) + 1)
+        self.hold_hist = [0] * (len(BUCKETS_US) + 1)
+        self.sites = {}  # call site -> [jumlah, total hold, max hold]
+
+    def record(self, wait, hold, contended, site):
+        with stats_lock:
+            self.acquired += 1
+            if contended:
+                self.contended += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.hold_total += hold
+            self.hold_max = max(self.hold_max, hold)
+            self.wait_hist[_bucket(wait)] += 1
+            self.hold_hist[_bucket(hold)] += 1
+            site_stats = self.sites.get(site)
+            if site_stats is None:
+                site_stats = self.sites[site] = [0, 0.0, 0.0]
+            site_stats[0] += 1
+            site_stats[1] += hold
+            site_stats[2] = max(site_stats[2], hold)
+
+
+class ProfiledLock:
+    """
+    Pengganti threading.Lock yang mencatat wait/hold time dan call site pemegang
+    Args:
+        name: Nama lock di laporan (lock per koneksi memakai nama yang sama)
+    """
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        with stats_lock:
+            self.stats = stats.get(name) or stats.setdefault(name, LockStats(name))
+        self.holder = None       # (nama thread, call site) pemegang saat ini
+        self.acquired_at = 0.0
+        self.wait = 0.0
+        self.contended = False
+        self.stall_reported = False
+        live_locks.add(self)
+
+    def acquire(self, blocking=True, timeout=-1):
+        return self._acquire(blocking, timeout, 3)
+
+    def _acquire(self, blocking, timeout, depth):
+        start = time.perf_counter()
+        contended = self.lock.locked()
+        if not self.lock.acquire(blocking, timeout):
+            return False
+        now = time.perf_counter()
+        self.holder = (threading.current_thread().name, _call_site(depth))
+        self.acquired_at = now
+        self.wait = now - start
+        self.contended = contended
+        self.stall_reported = False
+        return True
+
+    def release(self):
+        hold = time.perf_counter() - self.acquired_at
+        holder, wait, contended = self.holder, self.wait, self.contended
+        self.holder = None
+        self.lock.release()
+        self.stats.record(wait, hold, contended, holder[1] if holder else "?")
+
+    def locked(self):
+        return self.lock.locked()
+
+    def __enter__(self):
+        self._acquire(True, -1, 3)
+        return True
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def new_lock(name):
+    """Buat lock untuk client_handler: ProfiledLock jika profiling aktif, selain itu threading.Lock"""
+    if enabled:
+        return ProfiledLock(name)
+    return threading.Lock()
+
+
+def configure(enable, threshold, path):
+    """Aktifkan profiling (dipanggil dari config sebelum lock pertama dibuat)"""
+    global enabled, stall_threshold, report_file
+    enabled = enable
+    stall_threshold = threshold
+    report_file = path
+
+
+def dump_stacks(reason):
+    """Tulis stack semua thread ke report file (dan stdout)"""
+    names = {t.ident: t.name for t in threading.enumerate()}
+    lines = [f"===== STALL {time.strftime('%Y-%m-%d %H:%M:%S')}: {reason}"]
+    for ident, frame in sys._current_frames().items():
+        lines.append(f"--- Thread {names.get(ident, ident)}")
+        lines.extend(line.rstrip() for line in traceback.format_stack(frame))
+    text = "\n".join(lines) + "\n"
+    print(f"[LOCKPROF] {reason}")
+    if report_file:
+        with open(report_file, "a", encoding="utf-8") as f:
+            f.write(text)
+
+
+def report():
+    """
+    Ringkasan statistik semua lock
+    Returns:
+        List baris teks, lock dengan total hold terbesar di atas
+    """
+    bucket_names = [f"<{b}us" for b in BUCKETS_US] + [f">={BUCKETS_US[-1]}us"]
+    lines = [f"Lock report {time.strftime('%Y-%m-%d %H:%M:%S')} (bucket: {' '.join(bucket_names)})"]
+    with stats_lock:
+        ordered = sorted(stats.values(), key=lambda s: s.hold_total, reverse=True)
+        for s in ordered:
+            if not s.acquired:
+                continue
+            lines.append(
+                f"{s.name}: acquired={s.acquired} contended={s.contended} "
+                f"wait avg={s.wait_total / s.acquired * 1000:.3f}ms max={s.wait_max * 1000:.3f}ms "
+                f"hold avg={s.hold_total / s.acquired * 1000:.3f}ms max={s.hold_max * 1000:.3f}ms"
+            )
+            lines.append(f"  wait {s.wait_hist}")
+            lines.append(f"  hold {s.hold_hist}")
+            top_sites = sorted(s.sites.items(), key=lambda item: item[1][1], reverse=True)[:5]
+            for site, (count, total, longest) in top_sites:
+                lines.append(f"  {site}: n={count} hold total={total * 1000:.1f}ms max={longest * 1000:.3f}ms")
+    return lines
+
+
+def _watchdog(interval):
+    while True:
+        time.sleep(interval)
+        now = time.perf_counter()
+        for lock in list(live_locks):
+            holder = lock.holder
+            if holder is None or lock.stall_reported:
+                continue
+            held = now - lock.acquired_at
+            if held >= stall_threshold:
+                lock.stall_reported = True
+                dump_stacks(f"{lock.name} dipegang {held:.1f}s oleh {holder[0]} di {holder[1]}")
+
+
+def _reporter(interval):
+    while True:
+        time.sleep(interval)
+        with open(report_file, "a", encoding="utf-8") as f:
+            f.write("\n".join(report()) + "\n\n")
+
+
+def start(watchdog_interval, report_interval):
+    """Jalankan watchdog stall dan penulisan laporan berkala (hanya jika profiling aktif)"""
+    if not enabled:
+        return
+    threading.Thread(target=_watchdog, args=(watchdog_interval,), name="lock-watchdog", daemon=True).start()
+    if report_file and report_interval:
+        threading.Thread(target=_reporter, args=(report_interval,), name="lock-report", daemon=True).start()
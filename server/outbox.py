@@ -0,0 +1,403 @@
+import collections
+import itertools
+import socket
+import threading
+import time
+from compression import BroadcastFrame, send_frames
+
+# Antrean kirim per koneksi dengan lane prioritas
+# Semua pengirim (room worker, handler, reaper) hanya memasukkan pesan ke outbox;
+# satu thread writer per koneksi yang meng-encode dan menulis ke socket,
+# jadi client lambat tidak pernah menahan room worker
+#
+# Lane (prioritas tertinggi dulu):
+#   control    chat, [DELIVERED], [ROOM_*], [INFO], history, ... (tidak pernah dibuang)
+#   presence   [USERS], [ROOM_LIST], [UNREAD]: snapshot, yang lama diganti yang baru
+#   ephemeral  [TYPING], [STOP_TYPING], [READ]: typing digabung per user,
+#              dibuang saat koneksi tertinggal (antrean > behind_bytes)
+#   bulk       [FILE_DATA] (balasan [GET_FILE]), dipecah jadi [CHUNK] (jika client mendukung)
+#              supaya lane lain bisa menyela di antara potongan
+#
+# Urutan: pesan dalam satu lane terkirim sesuai urutan antre. Lane dipilih dari command,
+# bukan ukuran: traffic room yang berurutan (chat, [FILE_SHARED] beserta preview-nya,
+# history) selalu di lane control, jadi client melihat urutan yang sama dengan history
+# room dan [SYNC] walaupun pesannya besar. Hanya pesan di luar urutan room yang boleh
+# disusul pesan yang diantrekan belakangan (presence, typing/receipt, [FILE_DATA])
+
+CLASS_CONTROL = 0
+CLASS_PRESENCE = 1
+CLASS_EPHEMERAL = 2
+CLASS_BULK = 3
+CLASS_NAMES = ("control", "presence", "ephemeral", "bulk")
+
+COMMAND_CLASSES = (
+    ("[USERS]", CLASS_PRESENCE),
+    ("[ROOM_LIST]", CLASS_PRESENCE),
+    ("[UNREAD]", CLASS_PRESENCE),
+    ("[TYPING]", CLASS_EPHEMERAL),
+    ("[STOP_TYPING]", CLASS_EPHEMERAL),
+    ("[READ]", CLASS_EPHEMERAL),
+    ("[FILE_DATA]", CLASS_BULK),
+)
+
+# Batas atas bucket histogram delay antrean (milidetik), bucket terakhir = di atas batas terakhir
+DELAY_BUCKETS_MS = (1, 10, 100, 1000)
+
+chunk_ids = itertools.count(1)
+
+
+def classify(message):
+    """Lane untuk satu pesan server -> client (ukuran pesan tidak berpengaruh, lihat urutan di atas)"""
+    if message.startswith("["):
+        for prefix, message_class in COMMAND_CLASSES:
+            if message.startswith(prefix):
+                return message_class
+    return CLASS_CONTROL
+
+
+def coalesce_key(message):
+    """Key pesan yang cukup dikirim versi terakhirnya, None jika tidak bisa digabung"""
+    if message.startswith(("[USERS]", "[ROOM_LIST]")):
+        return message[:message.index("]") + 1]
+    if message.startswith("[UNREAD]"):
+        return message.partition(":")[0]  # [UNREAD]room
+    if message.startswith("[TYPING]"):
+        return "typing:" + message[8:]
+    if message.startswith("[STOP_TYPING]"):
+        return "typing:" + message[13:]
+    return None
+
+
+def split_chunks(message, frame, size):
+    """
+    Pecah pesan besar jadi frame [CHUNK]id:index:count:potongan
+    Hasilnya disimpan di BroadcastFrame agar broadcast hanya memecah (dan meng-encode) sekali
+    """
+    if frame is not None and frame.chunks is not None:
+        return frame.chunks
+    chunk_id = next(chunk_ids)
+    count = (len(message) + size - 1) // size
+    chunks = [BroadcastFrame(f"[CHUNK]{chunk_id}:{i}:{count}:{message[i * size:(i + 1) * size]}")
+              for i in range(count)]
+    if frame is not None:
+        frame.chunks = chunks
+    return chunks
+
+
+def _bucket(ms):
+    for i, limit in enumerate(DELAY_BUCKETS_MS):
+        if ms < limit:
+            return i
+    return len(DELAY_BUCKETS_MS)
+
+
+class LaneCounters:
+    """Counter per lane milik satu outbox (tanpa lock global di jalur kirim)"""
+    def __init__(self):
+        self.queued = [0] * len(CLASS_NAMES)
+        self.sent = [0] * len(CLASS_NAMES)
+        self.dropped = [0] * len(CLASS_NAMES)
+        self.coalesced = [0] * len(CLASS_NAMES)
+        self.delay_total = [0.0] * len(CLASS_NAMES)
+        self.delay_max = [0.0] * len(CLASS_NAMES)
+        self.delay_hist = [[0] * (len(DELAY_BUCKETS_MS) + 1) for _ in CLASS_NAMES]
+        self.writes = 0  # Jumlah vectored write ke socket (semua lane)
+
+    def record_sent(self, items, now):
+        self.writes += 1
+        for item in items:
+            delay = (now - item.enqueued_at) * 1000
+            self.sent[item.message_class] += 1
+            self.delay_total[item.message_class] += delay
+            self.delay_max[item.message_class] = max(self.delay_max[item.message_class], delay)
+            self.delay_hist[item.message_class][_bucket(delay)] += 1
+
+    def add(self, other):
+        self.writes += other.writes
+        for i in range(len(CLASS_NAMES)):
+            self.queued[i] += other.queued[i]
+            self.sent[i] += other.sent[i]
+            self.dropped[i] += other.dropped[i]
+            self.coalesced[i] += other.coalesced[i]
+            self.delay_total[i] += other.delay_total[i]
+            self.delay_max[i] = max(self.delay_max[i], other.delay_max[i])
+            self.delay_hist[i] = [a + b for a, b in zip(self.delay_hist[i], other.delay_hist[i])]
+
+
+class OutboxStats:
+    """
+    Metrik antrean kirim per lane (dibaca lewat [DEBUG_OUTBOX])
+    Counter koneksi yang sudah tutup digabung ke sini, koneksi aktif dijumlah saat laporan dibuat
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.closed = LaneCounters()
+        self.overflows = 0  # Koneksi ditutup karena antrean melebihi batas
+
+    def merge(self, counters):
+        with self.lock:
+            self.closed.add(counters)
+
+    def report(self, outboxes):
+        """
+        Args:
+            outboxes: Outbox yang masih aktif
+        Returns:
+            List baris teks, satu per lane
+        """
+        total = LaneCounters()
+        with self.lock:
+            total.add(self.closed)
+        for outbox in outboxes:
+            total.add(outbox.counters)  # Dibaca tanpa lock, cukup untuk laporan
+        bucket_names = [f"<{b}ms" for b in DELAY_BUCKETS_MS] + [f">={DELAY_BUCKETS_MS[-1]}ms"]
+        sent = sum(total.sent)
+        lines = [f"Outbox (delay antrean, bucket: {' '.join(bucket_names)}) overflow={self.overflows} "
+                 f"writes={total.writes} pesan/write={sent / total.writes if total.writes else 0:.2f}"]
+        for i, name in enumerate(CLASS_NAMES):
+            avg = total.delay_total[i] / total.sent[i] if total.sent[i] else 0
+            lines.append(
+                f"{name}: queued={total.queued[i]} sent={total.sent[i]} coalesced={total.coalesced[i]} "
+                f"dropped={total.dropped[i]} delay avg={avg:.2f}ms max={total.delay_max[i]:.2f}ms "
+                f"{total.delay_hist[i]}"
+            )
+        return lines
+
+
+class Pending:
+    """Satu pesan (atau kumpulan frame history) yang menunggu dikirim"""
+    __slots__ = ("message_class", "message", "frame", "frames", "nbytes", "key", "enqueued_at")
+
+    def __init__(self, message_class, message, frame, frames, nbytes, key, enqueued_at):
+        self.message_class = message_class
+        self.message = message
+        self.frame = frame
+        self.frames = frames  # Frame yang sudah di-encode (history), message None
+        self.nbytes = nbytes
+        self.key = key
+        self.enqueued_at = enqueued_at
+
+
+class Outbox:
+    """
+    Antrean kirim satu koneksi + thread writer-nya
+    Args:
+        sock: Socket client
+        codec: Codec hasil negosiasi (encode unicast dilakukan di thread writer, urut)
+        stats: OutboxStats bersama
+        limits: Dictionary batas (lihat OUTBOX_* di config.py)
+        chunks: Client mendukung [CHUNK] (diumumkan di [HELLO])
+    """
+    def __init__(self, sock, codec, stats, limits, chunks=False):
+        self.sock = sock
+        self.codec = codec
+        self.stats = stats
+        self.counters = LaneCounters()
+        self.behind_bytes = limits["behind_bytes"]
+        self.max_bytes = limits["max_bytes"]
+        self.ephemeral_max = limits["ephemeral_max"]
+        self.chunk_size = limits["chunk_size"]
+        self.batch_bytes = limits["batch_bytes"]
+        self.sndbuf = limits.get("sndbuf")
+        self.chunks = chunks
+        self.lanes = tuple(collections.deque() for _ in CLASS_NAMES)
+        self.keys = {}  # coalesce key -> Pending yang masih antre
+        self.queued_bytes = 0
+        self.closed = False  # Tidak menerima pesan baru; writer berhenti setelah antrean kosong
+        self.cond = threading.Condition(threading.Lock())
+        self.thread = None
+
+    def start(self, name):
+        if self.sndbuf:
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+            except OSError:
+                pass
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    # ---- Dipanggil pengirim (thread mana pun) ----
+
+    def put(self, message, frame=None):
+        """
+        Antrekan satu pesan
+        Args:
+            message: Pesan teks (tanpa newline)
+            frame: BroadcastFrame opsional agar hasil encode dipakai ulang
+        Returns:
+            False jika outbox sudah ditutup
+        """
+        message_class = classify(message)
+        key = coalesce_key(message) if message_class in (CLASS_PRESENCE, CLASS_EPHEMERAL) else None
+        with self.cond:
+            if not self._put(message_class, key, message, frame, time.monotonic()):
+                return False
+            self.cond.notify()
+        return True
+
+    def put_many(self, items):
+        """
+        Antrekan beberapa pesan sekaligus (batch fan-out room): satu lock dan satu
+        wakeup writer, jadi biasanya terkirim dalam satu write
+        Args:
+            items: List (message, frame)
+        Returns:
+            False jika outbox sudah ditutup
+        """
+        prepared = []
+        for message, frame in items:
+            message_class = classify(message)
+            key = coalesce_key(message) if message_class in (CLASS_PRESENCE, CLASS_EPHEMERAL) else None
+            prepared.append((message_class, key, message, frame))
+        with self.cond:
+            now = time.monotonic()
+            for message_class, key, message, frame in prepared:
+                if not self._put(message_class, key, message, frame, now):
+                    return False
+            self.cond.notify()
+        return True
+
+    def put_frames(self, frames):
+        """Antrekan frame yang sudah di-encode (history) di lane control"""
+        with self.cond:
+            if self.closed:
+                return False
+            self._append(Pending(CLASS_CONTROL, None, None, frames, sum(len(f) for f in frames),
+                                 None, time.monotonic()))
+            self.cond.notify()
+        return True
+
+    def close(self, flush=True):
+        """
+        Tutup outbox (tidak menunggu)
+        Args:
+            flush: True = writer mengirim sisa antrean dulu (drain), False = antrean dibuang
+        """
+        with self.cond:
+            self.closed = True
+            if not flush:
+                self._clear()
+            self.cond.notify()
+
+    def wait(self, timeout):
+        """Tunggu writer selesai mengirim sisa antrean setelah close()"""
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    # ---- Internal (memegang cond) ----
+
+    def _put(self, message_class, key, message, frame, now):
+        # False = outbox tutup (atau baru saja ditutup karena overflow)
+        if self.closed:
+            return False
+        counters = self.counters
+        if key is not None:
+            pending = self.keys.get(key)
+            if pending is not None:
+                # Versi lama belum terkirim: ganti isinya, posisi antre tetap
+                self.queued_bytes += len(message) - pending.nbytes
+                pending.message, pending.frame, pending.nbytes = message, frame, len(message)
+                counters.coalesced[message_class] += 1
+                return True
+        if (message_class == CLASS_EPHEMERAL and self.queued_bytes > self.behind_bytes
+                and not message.startswith("[STOP_TYPING]")):
+            # Koneksi tertinggal: typing/receipt baru tidak ada gunanya lagi
+            counters.dropped[message_class] += 1
+            return True
+
+        if message_class == CLASS_BULK and self.chunks and len(message) > self.chunk_size:
+            for chunk in split_chunks(message, frame, self.chunk_size):
+                self._append(Pending(message_class, chunk.message, chunk, None,
+                                     len(chunk.message), None, now))
+        else:
+            self._append(Pending(message_class, message, frame, None, len(message), key, now))
+
+        lane = self.lanes[CLASS_EPHEMERAL]
+        while len(lane) > self.ephemeral_max:
+            self._forget(lane.popleft())
+            counters.dropped[CLASS_EPHEMERAL] += 1
+        if self.queued_bytes > self.max_bytes:
+            self._abort()
+            with self.stats.lock:
+                self.stats.overflows += 1
+            return False
+        return True
+
+    def _append(self, pending):
+        self.lanes[pending.message_class].append(pending)
+        self.queued_bytes += pending.nbytes
+        self.counters.queued[pending.message_class] += 1
+        if pending.key is not None:
+            self.keys[pending.key] = pending
+
+    def _forget(self, pending):
+        self.queued_bytes -= pending.nbytes
+        if pending.key is not None and self.keys.get(pending.key) is pending:
+            del self.keys[pending.key]
+
+    def _clear(self):
+        for lane in self.lanes:
+            lane.clear()
+        self.keys.clear()
+        self.queued_bytes = 0
+
+    def _abort(self):
+        # Client terlalu lambat / socket error: buang antrean dan lepaskan recv() thread handler
+        self.closed = True
+        self._clear()
+        self.cond.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _take(self):
+        # Lane tinggi dulu; bulk hanya satu potongan per giliran agar pesan baru bisa menyela
+        batch = []
+        size = 0
+        for lane in self.lanes[:CLASS_BULK]:
+            while lane and size < self.batch_bytes:
+                pending = lane.popleft()
+                self._forget(pending)
+                batch.append(pending)
+                size += pending.nbytes
+        if not batch and self.lanes[CLASS_BULK]:
+            pending = self.lanes[CLASS_BULK].popleft()
+            self._forget(pending)
+            batch.append(pending)
+        return batch
+
+    # ---- Thread writer ----
+
+    def _run(self):
+        try:
+            self._write_loop()
+        finally:
+            self.stats.merge(self.counters)
+
+    def _write_loop(self):
+        codec = self.codec
+        while True:
+            with self.cond:
+                batch = self._take()
+                while not batch and not self.closed:
+                    self.cond.wait()
+                    batch = self._take()
+                if not batch:
+                    return
+            try:
+                with codec.send_lock:
+                    data = []
+                    for pending in batch:
+                        if pending.frames is not None:
+                            data.extend(pending.frames)
+                        elif pending.frame is not None:
+                            data.append(pending.frame.for_codec(codec))
+                        else:
+                            data.append(codec.encode(pending.message))
+                    self.counters.record_sent(batch, time.monotonic())
+                    send_frames(self.sock, data)
+            except OSError:
+                with self.cond:
+                    self._abort()
+                return
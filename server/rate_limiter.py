@@ -0,0 +1,109 @@
+import time
+
+# Prefix command -> kelas rate limit
+COMMAND_CLASSES = (
+    ("[TYPING]", "typing"),
+    ("[STOP_TYPING]", "typing"),
+    ("[REACTION]", "reaction"),
+    ("[READ]", "read"),
+    ("[SEND]", "chat"),
+    ("[FILE]", "file"),
+    ("[GET_HISTORY]", "history"),
+    ("[GET_FILE]", "history"),
+    ("[SEARCH]", "history"),
+    ("[GET_OLDER]", "history"),
+    ("[SYNC]", "history"),
+    ("[CREATE_ROOM]", "room"),
+    ("[DELETE_ROOM]", "room"),
+    ("[JOIN_ROOM]", "room"),
+    ("[SWITCH_ROOM]", "room"),
+    ("[SUBSCRIBE]", "subscribe"),
+    ("[UNSUBSCRIBE]", "subscribe"),
+)
+
+
+def classify(message):
+    """
+    Tentukan kelas rate limit dari sebuah pesan client
+    Returns:
+        Nama kelas: "chat" untuk pesan biasa, "other" untuk command tak dikenal
+    """
+    if not message.startswith("["):
+        return "chat"
+    for prefix, command_class in COMMAND_CLASSES:
+        if message.startswith(prefix):
+            return command_class
+    return "other"
+
+
+class TokenBucket:
+    """
+    Token bucket sederhana
+    Args:
+        rate: Token yang diisi ulang per detik
+        capacity: Jumlah token maksimal (burst)
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self, amount, now):
+        """
+        Ambil token dari bucket
+        Returns:
+            0 jika diizinkan, atau detik yang harus ditunggu sebelum mencoba lagi
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0
+        return (min(amount, self.capacity) - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Rate limiter per sesi: satu bucket per kelas command + bucket byte upload
+    Hanya dipakai oleh thread handler milik sesi itu, jadi tanpa lock
+    Args:
+        limits: {kelas: (rate per detik, burst)}
+        upload_rate: Byte upload per detik
+        upload_burst: Burst byte upload
+    """
+    def __init__(self, limits, upload_rate, upload_burst):
+        self.buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in limits.items()}
+        self.upload_bytes = TokenBucket(upload_rate, upload_burst)
+        self.notified_until = {}  # kelas -> waktu, agar [RATE_LIMITED] tidak ikut membanjiri
+
+    def check(self, message):
+        """
+        Periksa satu pesan
+        Returns:
+            (kelas, retry_after detik); retry_after 0 berarti pesan boleh diproses,
+            None berarti pesan tidak akan pernah lolos (frame [FILE] melebihi burst byte upload)
+        """
+        command_class = classify(message)
+        bucket = self.buckets.get(command_class)
+        if bucket is None:
+            return command_class, 0
+        if command_class == "file" and len(message) > self.upload_bytes.capacity:
+            return command_class, None
+        now = time.monotonic()
+        retry_after = bucket.consume(1, now)
+        if not retry_after and command_class == "file":
+            retry_after = self.upload_bytes.consume(len(message), now)
+            if retry_after:
+                bucket.tokens += 1  # Kembalikan token command, yang kurang budget byte-nya
+        return command_class, retry_after
+
+    def should_notify(self, command_class, retry_after):
+        """True jika client belum diberi tahu untuk periode throttle ini"""
+        now = time.monotonic()
+        if now < self.notified_until.get(command_class, 0):
+            return False
+        self.notified_until[command_class] = now + retry_after
+        return True
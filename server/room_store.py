@@ -0,0 +1,69 @@
+import json
+import os
+
+# Penyimpanan room yang di-page keluar dari memori
+# Satu file JSON per room: <ROOM_STORE_DIR>/<hex nama room>.json
+# (nama di-hex agar karakter apa pun aman sebagai nama file)
+
+
+class RoomStore:
+    """
+    Args:
+        directory: Folder file room
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, name.encode().hex() + ".json")
+
+    def save(self, name, state):
+        """Simpan snapshot room secara atomik (file sementara lalu rename)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def load(self, name):
+        """Baca snapshot room, None jika tidak ada/rusak"""
+        try:
+            with open(self.path(name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def delete(self, name):
+        try:
+            os.unlink(self.path(name))
+        except OSError:
+            pass
+
+    def names(self):
+        """Nama semua room yang tersimpan di disk"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                try:
+                    names.append(bytes.fromhex(filename[:-5]).decode())
+                except ValueError:
+                    pass
+        return names
+
+
+class RoomCacheStats:
+    """Counter LRU room cache (dibaca lewat [DEBUG_ROOMS])"""
+    def __init__(self):
+        self.evictions = 0
+        self.page_ins = 0
+        self.page_in_time = 0.0  # Total detik untuk memuat room dari disk
+        self.sweeps = 0
+
+    def summary(self, resident, paged, resident_bytes):
+        avg_ms = self.page_in_time / self.page_ins * 1000 if self.page_ins else 0
+        return (f"rooms resident={resident} paged={paged} history_bytes={resident_bytes} "
+                f"evictions={self.evictions} page_ins={self.page_ins} page_in_avg={avg_ms:.2f}ms "
+                f"sweeps={self.sweeps}")
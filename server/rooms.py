@@ -0,0 +1,718 @@
+import collections
+import heapq
+import itertools
+import json
+import queue
+import threading
+import time
+from config import ROOM_HISTORY_LIMIT, OLDER_MAX_SCAN
+from compression import BroadcastFrame
+
+# Room sebagai actor:
+# - State room (member, history, typing, reactions) hanya disentuh oleh
+#   worker yang sedang memproses mailbox room itu, jadi tanpa lock global
+# - Thread handler mengirim pekerjaan lewat room.tell(fn, *args)
+# - Satu room diproses paling banyak oleh satu worker pada satu waktu;
+#   room lain tetap jalan di worker lain
+# - Fan-out pesan chat dikumpulkan dulu (lihat FanoutWindow): pesan yang masuk
+#   berdekatan dikirim sebagai satu batch per penerima
+
+
+class RoomMember:
+    """
+    Subscription satu sesi di sebuah room
+    active=True berarti room ini room aktif client (terima pesan penuh),
+    selain itu background (hanya counter [UNREAD])
+    """
+    __slots__ = ("sock", "username", "active", "mode", "delivered_seq", "unread", "mentions")
+
+    def __init__(self, sock, username, seq, mode="unread"):
+        self.sock = sock
+        self.username = username
+        self.active = False
+        self.mode = mode
+        self.delivered_seq = seq  # Semua pesan dengan seq <= nilai ini sudah diterima client
+        self.unread = 0
+        self.mentions = 0
+
+
+class HistorySnapshot:
+    """
+    History room yang immutable: pesan + hasil encode per setting codec
+    Room mengganti snapshot dengan objek baru setiap ada pesan (copy-on-write),
+    jadi referensinya aman dibaca dan dikirim tanpa lock
+    Args:
+        seq: Nomor urut pesan terakhir di snapshot
+        messages: Tuple pesan history
+        encoded: {settings_key codec: tuple frame} yang sudah di-encode
+        nbytes: Total panjang pesan (untuk budget memori room cache)
+    """
+    __slots__ = ("seq", "messages", "encoded", "nbytes")
+
+    def __init__(self, seq, messages=(), encoded=None, nbytes=None):
+        self.seq = seq
+        self.messages = messages
+        self.encoded = encoded or {}
+        self.nbytes = nbytes if nbytes is not None else sum(len(msg) for msg in messages)
+
+    def frames(self, codec, since_seq=None):
+        """
+        Frame siap kirim untuk codec ini (di-encode sekali per setting codec)
+        Args:
+            since_seq: Hanya pesan dengan seq > since_seq (None = seluruh history)
+        """
+        frames = self.encoded.get(codec.settings_key)
+        if frames is None:
+            frames = tuple(codec.encode_shared(msg) for msg in self.messages)
+            self.encoded[codec.settings_key] = frames
+        if since_seq is None:
+            return frames
+        missing = self.seq - since_seq
+        if missing <= 0:
+            return ()
+        return frames[-missing:]
+
+    def append(self, message, frame, limit):
+        """
+        Snapshot baru dengan satu pesan tambahan
+        Frame lama dipakai ulang, frame pesan baru diambil dari hasil encode broadcast
+        Args:
+            message: Pesan baru
+            frame: BroadcastFrame pesan itu
+            limit: Jumlah pesan maksimal di history
+        """
+        messages = self.messages + (message,)
+        drop = max(0, len(messages) - limit)
+        nbytes = self.nbytes + len(message) - sum(len(msg) for msg in messages[:drop])
+        encoded = {}
+        for key, frames in self.encoded.items():
+            data = frame.cached(key)
+            # Setting yang tidak ada penerima live-nya di-encode ulang saat dibutuhkan
+            if data is not None:
+                encoded[key] = (frames + (data,))[drop:]
+        return HistorySnapshot(self.seq + 1, messages[drop:], encoded, nbytes)
+
+
+class FanoutWindow:
+    """
+    Window batching fan-out satu room yang menyesuaikan diri dari laju pesan
+    Room sepi: window 0, pesan dikirim di akhir giliran mailbox (tanpa delay tambahan)
+    Room ramai: pesan pertama menunggu window detik agar pesan berikutnya ikut
+    dalam write yang sama ke tiap member
+    Args:
+        limits: Dictionary FANOUT_BATCH di config.py
+    """
+    __slots__ = ("max_delay", "min_batch", "target_batch", "alpha", "interval", "cost",
+                 "last_at", "window", "flushes", "messages", "delay_total", "delay_max")
+
+    def __init__(self, limits):
+        self.max_delay = limits["max_delay"]
+        self.min_batch = limits["min_batch"]
+        self.target_batch = limits["target_batch"]
+        self.alpha = limits["alpha"]
+        self.interval = None  # EWMA jarak antar pesan (detik)
+        self.cost = 0.0       # EWMA durasi satu flush fan-out (detik)
+        self.last_at = None
+        self.window = 0.0
+        # Metrik untuk [DEBUG_ROOMS] dan bench/fanout_bench.py
+        self.flushes = 0
+        self.messages = 0
+        self.delay_total = 0.0  # Total delay pesan dari post sampai masuk outbox
+        self.delay_max = 0.0
+
+    @property
+    def rate(self):
+        """Perkiraan pesan per detik"""
+        return 1 / self.interval if self.interval else 0.0
+
+    def observe(self, now):
+        """Catat satu pesan masuk (dipanggil dari Room.post)"""
+        if self.last_at is not None:
+            gap = now - self.last_at
+            self.interval = gap if self.interval is None else self.interval + self.alpha * (gap - self.interval)
+        self.last_at = now
+
+    def flushed(self, count, cost, delay_total, delay_max):
+        """
+        Catat satu flush lalu hitung ulang window
+        Args:
+            count: Jumlah pesan di batch
+            cost: Durasi fan-out batch (detik)
+            delay_total, delay_max: Delay pesan batch sejak post (detik)
+        """
+        self.flushes += 1
+        self.messages += count
+        self.delay_total += delay_total
+        self.delay_max = max(self.delay_max, delay_max)
+        self.cost += self.alpha * (cost - self.cost)
+        # Target latensi mencakup waktu fan-out itu sendiri
+        rate = self.rate
+        budget = self.max_delay - self.cost
+        window = min(self.target_batch / rate, budget) if rate else 0.0
+        # Window hanya dipakai jika rata-rata batch-nya cukup besar untuk menghemat write
+        self.window = window if window > 0 and 1 + rate * window >= self.min_batch else 0.0
+
+    def summary(self):
+        avg_batch = self.messages / self.flushes if self.flushes else 0
+        avg_delay = self.delay_total / self.messages * 1000 if self.messages else 0
+        return (f"rate={self.rate:.1f}/s window={self.window * 1000:.1f}ms batch={avg_batch:.2f} "
+                f"flushes={self.flushes} delay avg={avg_delay:.2f}ms max={self.delay_max * 1000:.2f}ms "
+                f"fanout={self.cost * 1000:.2f}ms")
+
+
+class Room:
+    """
+    Actor satu room
+    Args:
+        name: Nama room
+        hub: RoomHub yang menjalankan mailbox
+        created_by: Username pembuat room
+        messages: History awal (mis. dari state proses sebelumnya)
+        seq: Nomor urut pesan terakhir
+        reactions: {message_id: {emoji: [usernames]}}
+        incarnation: Id unik room ini, membedakan room baru dari room lama bernama sama
+            (folder index pencarian), None untuk room lama/general
+    """
+    def __init__(self, name, hub, created_by=None, messages=None, seq=0, reactions=None, incarnation=None):
+        self.name = name
+        self.hub = hub
+        self.created_by = created_by
+        self.incarnation = incarnation
+        self.history = HistorySnapshot(seq, tuple(messages or ()))
+        self.reactions = reactions or {}
+        self.members = {}  # socket -> RoomMember
+        self.typing = set()  # Socket member yang sedang mengetik
+        self.closed = False
+        self.evicted = False  # True setelah room di-page ke disk (objek ini tidak dipakai lagi)
+        self.last_active = time.monotonic()
+        self.index = None  # RoomIndex pencarian, dibuat saat pertama dipakai
+
+        # Batch fan-out: pesan yang sudah masuk history tapi belum dikirim ke member
+        self.fanout = FanoutWindow(hub.fanout) if hub.fanout else None
+        self.pending = []           # (message, frame, waktu post)
+        self.pending_unread = {}    # socket -> RoomMember background yang counter-nya berubah
+        self.pending_delivered = [] # (socket pengirim, msg_id)
+        self.flush_armed = False    # Timer flush window sudah dijadwalkan
+
+        self.mailbox = collections.deque()
+        self.scheduled = False
+        self.schedule_lock = hub.lock_factory("room_schedule_lock")  # Hanya melindungi flag scheduled room ini
+
+    # ---- Mailbox ----
+
+    def tell(self, fn, *args):
+        """Masukkan pekerjaan ke mailbox room (tidak menunggu hasil)"""
+        self.mailbox.append((fn, args))
+        with self.schedule_lock:
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.hub.schedule(self)
+
+    def ask(self, fn, *args, timeout=5):
+        """Jalankan fn di mailbox room lalu tunggu hasilnya (dipakai untuk snapshot)"""
+        done = threading.Event()
+        result = []
+
+        def call():
+            try:
+                result.append(fn(*args))
+            finally:
+                done.set()
+
+        self.tell(call)
+        done.wait(timeout)
+        return result[0] if result else None
+
+    def process(self, batch):
+        """Proses maksimal batch pesan mailbox (dipanggil worker hub)"""
+        self.last_active = time.monotonic()
+        for _ in range(batch):
+            try:
+                fn, args = self.mailbox.popleft()
+            except IndexError:
+                break
+            try:
+                if self.pending and getattr(fn, "__func__", None) is not Room.post:
+                    # Operasi lain (join, typing, reaction, snapshot, ...) selalu melihat
+                    # semua pesan sebelumnya sudah terkirim, urutan ke client tetap sama
+                    self.flush_fanout()
+                if self.evicted:
+                    # Pesan yang masuk tepat saat room di-page keluar: teruskan ke instance baru
+                    self.hub.forward(self, fn, args)
+                else:
+                    fn(*args)
+            except Exception as e:
+                print(f"[ERROR] Room {self.name}: {e}")
+        if self.pending and not self.flush_armed:
+            # Semua post yang antre di giliran ini dikirim sebagai satu batch
+            try:
+                self.flush_fanout()
+            except Exception as e:
+                print(f"[ERROR] Room {self.name}: {e}")
+        with self.schedule_lock:
+            if not self.mailbox:
+                self.scheduled = False
+                return
+        # Masih ada pesan: antre lagi di belakang room lain agar adil
+        self.hub.schedule(self)
+
+    # ---- Helper (hanya dipanggil dari dalam mailbox) ----
+
+    def _send(self, sock, message, frame=None):
+        try:
+            self.hub.send(sock, message, frame)
+            return True
+        except:
+            return False
+
+    def _send_batch(self, sock, items):
+        try:
+            self.hub.send_batch(sock, items)
+            return True
+        except:
+            return False
+
+    def _send_active(self, message):
+        frame = BroadcastFrame(message)
+        for member in list(self.members.values()):
+            if member.active:
+                self._send(member.sock, message, frame)
+
+    def _send_history(self, sock, since_seq=None):
+        try:
+            self.hub.send_history(sock, self.history, since_seq)
+        except:
+            pass
+
+    @property
+    def seq(self):
+        return self.history.seq
+
+    @property
+    def nbytes(self):
+        """Perkiraan byte room di memori (history + tail index) untuk budget room cache"""
+        index = self.index
+        return self.history.nbytes + (index.nbytes if index is not None else 0)
+
+    @property
+    def pinned(self):
+        """True jika ada member aktif; room yang hanya punya subscriber background boleh di-page keluar"""
+        return any(member.active for member in self.members.values())
+
+    def _search_index(self):
+        # Pertama dipakai: susulkan pesan history yang belum terindeks (mis. tail hilang saat crash)
+        if self.index is None and self.hub.new_index is not None:
+            self.index = self.hub.new_index(self)
+            self.index.catch_up(self.seq, self.history.messages)
+        return self.index
+
+    def _evict(self, message):
+        # Reaction ikut dibuang saat pesannya keluar dari history
+        if message.startswith("[MSG_ID:"):
+            self.reactions.pop(message[8:message.find("]")], None)
+
+    # ---- Pesan mailbox ----
+
+    def activate(self, sock, username, want_delta=False, resume_id=None):
+        """
+        Jadikan room ini room aktif sesi
+        Args:
+            want_delta: Client sudah punya display room ini, kirim pesan yang terlewat saja
+            resume_id: msg_id terakhir yang dimiliki client yang reconnect, kirim pesan sesudahnya
+        """
+        member = self.members.get(sock)
+        if member is None:
+            member = RoomMember(sock, username, self.seq)
+            self.members[sock] = member
+            if resume_id:
+                self._send_history(sock, self.seq_of(resume_id))
+            elif want_delta:
+                # Subscription tidak dikenal (mis. setelah restart): kirim history penuh
+                self._send_history(sock)
+        elif want_delta and not member.active:
+            self._send_history(sock, member.delivered_seq)
+        # Room yang pernah dibuka user selalu memakai mode unread
+        member.active = True
+        member.mode = "unread"
+        member.delivered_seq = self.seq
+        member.unread = 0
+        member.mentions = 0
+
+    def seq_of(self, msg_id):
+        """Seq pesan msg_id (atau file_id) di history, None jika sudah tidak ada (kirim history penuh)"""
+        markers = (f"[MSG_ID:{msg_id}]", f"[FILE_SHARED]{self.name}:{msg_id}:")
+        messages = self.history.messages
+        for back, message in enumerate(reversed(messages)):
+            if message.startswith(markers):
+                return self.history.seq - back
+        return None
+
+    def deactivate(self, sock):
+        """Room aktif sesi pindah, room ini tetap di-subscribe sebagai background"""
+        member = self.members.get(sock)
+        if member is None:
+            return
+        member.active = False
+        member.delivered_seq = self.seq
+        if sock in self.typing:
+            self.set_typing(sock, False)
+
+    def subscribe(self, sock, username, mode):
+        member = self.members.get(sock)
+        if member is None:
+            self.members[sock] = RoomMember(sock, username, self.seq, mode)
+        else:
+            member.mode = mode
+
+    def unsubscribe(self, sock):
+        """Hentikan subscription background (room aktif tetap menerima pesan)"""
+        member = self.members.get(sock)
+        if member is not None and not member.active:
+            del self.members[sock]
+
+    def leave(self, sock, notify=True):
+        """Sesi disconnect: hapus dari member dan reset typing"""
+        member = self.members.pop(sock, None)
+        if member is not None and sock in self.typing:
+            self.typing.discard(sock)
+            if notify:
+                self._send_active(f"[STOP_TYPING]{member.username}")
+
+    def post(self, message, sender=None, msg_id=None):
+        """
+        Simpan pesan ke history lalu kirim ke member
+        Member aktif menerima pesan penuh, member background hanya
+        counter [UNREAD]room:unread:mentions
+        Pengiriman dikumpulkan di pending dan dikirim oleh flush_fanout
+        (akhir giliran mailbox, atau setelah window FanoutWindow di room ramai)
+        Args:
+            message: Pesan lengkap (chat atau [FILE_SHARED])
+            sender: Socket pengirim, menerima [DELIVERED]msg_id setelah pesan terkirim
+            msg_id: ID pesan chat
+        """
+        seq = self.history.seq + 1
+        frame = BroadcastFrame(message)
+        message_lower = message.lower()
+        for member in self.members.values():
+            if member.active:
+                continue
+            # Room background: pesan diambil nanti sebagai delta saat switch
+            member.unread += 1
+            mentioned = f"@{member.username.lower()}" in message_lower
+            if mentioned:
+                member.mentions += 1
+            if member.mode == "unread" or mentioned:
+                self.pending_unread[member.sock] = member
+
+        # Snapshot history baru memakai ulang hasil encode broadcast
+        if len(self.history.messages) >= ROOM_HISTORY_LIMIT:
+            self._evict(self.history.messages[0])
+        self.history = self.history.append(message, frame, ROOM_HISTORY_LIMIT)
+        if not self.closed:
+            index = self._search_index()
+            if index is not None:
+                try:
+                    index.add_message(seq, message)
+                except OSError as e:
+                    print(f"[ERROR] Index room {self.name}: {e}")
+
+        now = time.monotonic()
+        self.pending.append((message, frame, now))
+        if sender is not None and msg_id:
+            self.pending_delivered.append((sender, msg_id))
+        self.hub.log(f"[{self.name}] {message}")
+
+        fanout = self.fanout
+        if fanout is None:
+            self.flush_fanout()
+            return
+        fanout.observe(now)
+        if len(self.pending) == 1 and fanout.window > 0 and not self.flush_armed:
+            self.flush_armed = True
+            self.hub.call_later(fanout.window, self)
+
+    def flush_fanout(self):
+        """
+        Kirim semua pesan pending: satu batch per member aktif (satu write di outbox),
+        satu [UNREAD] terakhir per member background, lalu [DELIVERED] ke pengirim
+        """
+        self.flush_armed = False
+        pending = self.pending
+        if not pending:
+            return
+        self.pending = []
+        started = time.monotonic()
+        items = [(message, frame) for message, frame, _ in pending]
+        seq = self.seq
+        for member in list(self.members.values()):
+            if member.active:
+                self._send_batch(member.sock, items)
+                member.delivered_seq = seq
+        unread, self.pending_unread = self.pending_unread, {}
+        for member in unread.values():
+            self._send(member.sock, f"[UNREAD]{self.name}:{member.unread}:{member.mentions}")
+        delivered, self.pending_delivered = self.pending_delivered, []
+        for sender, msg_id in delivered:
+            self._send(sender, f"[DELIVERED]{msg_id}")
+
+        if self.fanout is not None:
+            finished = time.monotonic()
+            delays = [finished - posted_at for _, _, posted_at in pending]
+            self.fanout.flushed(len(pending), finished - started, sum(delays), max(delays))
+
+    def send_history(self, sock, since_id=None):
+        """
+        Kirim history room ke satu client (snapshot pre-encoded, satu vectored write)
+        Args:
+            since_id: Item terakhir di cache client, hanya pesan sesudahnya yang dikirim
+                (None atau sudah keluar dari history = seluruh history)
+        """
+        self._send_history(sock, self.seq_of(since_id) if since_id else None)
+        member = self.members.get(sock)
+        if member is not None:
+            member.delivered_seq = self.seq
+
+    def sync(self, sock, since_id, rest):
+        """
+        Bagian room ini dari [SYNC] login: kirim [SYNC_ROOM]{json} lalu lanjut ke room berikutnya
+        Room dikerjakan berantai (tell ke room berikutnya setelah selesai) agar urutan
+        ke client sama dengan urutan permintaan
+        Args:
+            since_id: Item terakhir di cache client (None atau sudah keluar dari history = seluruh history)
+            rest: [(room, since_id)] yang belum dikirim
+        """
+        try:
+            messages = self.history.messages
+            since_seq = self.seq_of(since_id) if since_id else None
+            if since_seq is not None:
+                missing = self.seq - since_seq
+                messages = messages[len(messages) - missing:] if missing > 0 else ()
+            self._send(sock, "[SYNC_ROOM]" + json.dumps({
+                "room": self.name,
+                "messages": list(messages),
+                "reactions": {msg_id: emojis for msg_id, emojis in self.reactions.items() if emojis},
+            }, ensure_ascii=False))
+            member = self.members.get(sock)
+            if member is not None:
+                member.delivered_seq = self.seq
+        finally:
+            if rest:
+                room, next_id = rest[0]
+                room.tell(room.sync, sock, next_id, rest[1:])
+            else:
+                self._send(sock, "[SYNC_DONE]")
+
+    def search(self, sock, query, limit):
+        """
+        Cari pesan/nama file di room ini, balas [SEARCH_RESULTS]{json}
+        Args:
+            query: Kata yang dicari (semua kata harus ada)
+            limit: Jumlah hasil maksimal
+        """
+        start = time.perf_counter()
+        index = self._search_index()
+        results = index.search(query, limit) if index is not None else []
+        self._send(sock, "[SEARCH_RESULTS]" + json.dumps({
+            "room": self.name,
+            "query": query,
+            "results": results,
+            "took_ms": round((time.perf_counter() - start) * 1000, 2),
+        }, ensure_ascii=False))
+
+    def older(self, sock, before_id, limit):
+        """
+        Pesan sebelum before_id untuk scrollback client yang sudah dipotong, balas [OLDER]{json}
+        History di memori hanya ROOM_HISTORY_LIMIT pesan terakhir, jadi pesan lama
+        dibaca dari dokumen index pencarian
+        Args:
+            before_id: msg_id (atau file_id) pesan tertua yang masih tampil di client
+            limit: Jumlah pesan maksimal
+        """
+        index = self._search_index()
+        messages = []
+        more = False
+        seq = index.find_seq(before_id, OLDER_MAX_SCAN) if index is not None else None
+        if seq is not None:
+            first = max(1, seq - limit)
+            for doc_seq, doc in index.documents_range(first, seq - 1):
+                msg_id, sender, time_str, text, doc_type = doc
+                messages.append({"seq": doc_seq, "id": msg_id, "sender": sender,
+                                 "time": time_str, "type": doc_type, "text": text})
+            more = first > 1
+        self._send(sock, "[OLDER]" + json.dumps({
+            "room": self.name,
+            "before": before_id,
+            "messages": messages,
+            "more": more,
+        }, ensure_ascii=False))
+
+    def set_typing(self, sock, is_typing):
+        member = self.members.get(sock)
+        if member is None:
+            return
+        if is_typing:
+            self.typing.add(sock)
+            self._send_active(f"[TYPING]{member.username}")
+        else:
+            self.typing.discard(sock)
+            self._send_active(f"[STOP_TYPING]{member.username}")
+
+    def toggle_reaction(self, message_id, emoji, username):
+        """Toggle reaction: jika sudah ada, hapus; jika belum ada, tambahkan"""
+        emojis = self.reactions.setdefault(message_id, {})
+        users = emojis.setdefault(emoji, [])
+        if username in users:
+            users.remove(username)
+            # Hapus emoji jika tidak ada yang react lagi
+            if not users:
+                del emojis[emoji]
+        else:
+            users.append(username)
+        msg = f"[REACTION]{message_id}:{emoji}:{username}"
+        self._send_active(msg)
+        self.hub.log(msg)
+
+    def read_receipt(self, message_ids, username):
+        """Satu [READ]id1,id2,...:username untuk semua pesan yang dibaca sekaligus"""
+        msg = f"[READ]{','.join(message_ids)}:{username}"
+        self._send_active(msg)
+        self.hub.log(msg)
+
+    def close(self, fallback_room):
+        """Room dihapus: client yang sedang membuka room ini diarahkan ke fallback_room"""
+        self.closed = True
+        for member in self.members.values():
+            if member.active:
+                self._send(member.sock, f"[ROOM_JOINED]{fallback_room}")
+        self.members.clear()
+        self.typing.clear()
+        # Satu-satunya tempat index room dihapus; folder per incarnation, jadi room baru
+        # bernama sama tidak ikut terhapus
+        index = self.index
+        if index is None and self.hub.new_index is not None:
+            index = self.hub.new_index(self)  # Index di disk (room yang di-page keluar)
+        if index is not None:
+            index.destroy()
+
+    def page_out(self):
+        """
+        Simpan room ke disk lalu lepas dari memori (batal jika ada member aktif lagi)
+        Member background dibawa registry room (hub.page_out) dan dipasang lagi saat page-in
+        """
+        if self.pinned or self.closed or self.evicted:
+            return
+        if self.index is not None:
+            self.index.flush()
+        if self.hub.page_out(self):
+            self.evicted = True
+            if self.index is not None:
+                self.index.close()
+
+    def checkpoint(self):
+        """Flush index ke disk lalu ambil snapshot (handoff ke proses baru)"""
+        if self.index is not None:
+            self.index.flush()
+        return self.snapshot()
+
+    def snapshot(self):
+        """State room yang dibawa ke proses server berikutnya"""
+        return {
+            "messages": list(self.history.messages),
+            "seq": self.seq,
+            "created_by": self.created_by,
+            "incarnation": self.incarnation,
+            "reactions": {
+                msg_id: {emoji: list(users) for emoji, users in emojis.items()}
+                for msg_id, emojis in self.reactions.items()
+            }
+        }
+
+
+class RoomHub:
+    """
+    Pool worker untuk semua room actor
+    Args:
+        workers: Jumlah thread worker
+        batch: Pesan mailbox yang diproses per giliran room
+        lock_factory: fn(nama) -> lock, untuk lock milik room (default threading.Lock)
+        fanout: Dictionary FANOUT_BATCH (window batching adaptif), None = tiap pesan langsung dikirim
+    """
+    def __init__(self, workers, batch, lock_factory=None, fanout=None):
+        self.workers = workers
+        self.batch = batch
+        self.lock_factory = lock_factory or (lambda name: threading.Lock())
+        self.fanout = fanout
+        self.run_queue = queue.SimpleQueue()  # Room yang mailbox-nya menunggu diproses
+        self.timers = []  # Heap (waktu, urutan, room) flush window yang dijadwalkan
+        self.timer_order = itertools.count()
+        self.timer_cond = threading.Condition(threading.Lock())
+        self.send = None
+        self.send_batch = None
+        self.send_history = None
+        self.log = None
+        self.resolve = None
+        self.page_out = None
+        self.new_index = None
+
+    def start(self, send, send_history, log, resolve=None, page_out=None, new_index=None, send_batch=None):
+        """
+        Jalankan thread worker
+        Args:
+            send: fn(socket, message, frame) untuk mengirim ke client
+            send_history: fn(socket, HistorySnapshot, since_seq) untuk mengirim history
+            log: fn(text) untuk menulis ke file log
+            resolve: fn(nama) -> Room aktif di registry (memuat dari disk jika perlu)
+            page_out: fn(room) -> True jika room berhasil disimpan dan dilepas dari registry
+            new_index: fn(room) -> RoomIndex pencarian room, None = pencarian nonaktif
+            send_batch: fn(socket, [(message, frame)]) untuk mengirim batch fan-out sekaligus,
+                None = dikirim satu per satu lewat send
+        """
+        self.send = send
+        self.send_batch = send_batch or (lambda sock, items: [send(sock, m, f) for m, f in items])
+        self.send_history = send_history
+        self.log = log
+        self.resolve = resolve
+        self.page_out = page_out
+        self.new_index = new_index
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f"room-worker-{i}", daemon=True).start()
+        if self.fanout:
+            threading.Thread(target=self._run_timers, name="room-fanout-timer", daemon=True).start()
+
+    def schedule(self, room):
+        self.run_queue.put(room)
+
+    def call_later(self, delay, room):
+        """Jadwalkan room.flush_fanout lewat mailbox room setelah delay detik"""
+        with self.timer_cond:
+            heapq.heappush(self.timers, (time.monotonic() + delay, next(self.timer_order), room))
+            self.timer_cond.notify()
+
+    def forward(self, room, fn, args):
+        """Teruskan pesan mailbox room yang sudah di-page keluar ke instance yang dimuat ulang"""
+        target = self.resolve(room.name) if self.resolve else None
+        name = getattr(fn, "__name__", None)
+        if target is not None and target is not room and getattr(fn, "__self__", None) is room:
+            target.tell(getattr(target, name), *args)
+        else:
+            fn(*args)
+
+    def _run(self):
+        while True:
+            room = self.run_queue.get()
+            room.process(self.batch)
+
+    def _run_timers(self):
+        while True:
+            with self.timer_cond:
+                while True:
+                    if self.timers:
+                        delay = self.timers[0][0] - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self.timer_cond.wait(delay)
+                    else:
+                        self.timer_cond.wait()
+                _, _, room = heapq.heappop(self.timers)
+            room.tell(room.flush_fanout)
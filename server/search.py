@@ -0,0 +1,537 @@
+import array
+import collections
+import json
+import math
+import os
+import re
+import shutil
+import struct
+import threading
+from bisect import bisect_left
+
+# Index full-text per room untuk [SEARCH]
+# - Token kata (unicode \w), case-folded, dari teks chat dan nama file
+# - Dokumen = satu pesan history, dikenali dari seq room (naik terus)
+# - Pesan baru masuk ke tail di memori; tiap flush_docs dokumen tail ditulis
+#   sebagai segmen immutable di disk:
+#     <id>.terms  "token jumlah" per baris, urut token (kamus)
+#     <id>.post   posting list uint32 (seq naik) berurutan sesuai .terms
+#     <id>.docs   satu dokumen JSON per baris (untuk snippet)
+#     <id>.offs   pasangan uint64 (seq, offset baris di .docs)
+# - Segmen kecil digabung (MERGE_FACTOR sekaligus) agar jumlah segmen logaritmik
+# - Kamus segmen dimuat saat dipakai ke TermCache (LRU global dengan budget jumlah term),
+#   posting list selalu dibaca dari disk, jadi room dingin tidak memakan memori
+
+TOKEN_RE = re.compile(r"\w+")
+MAX_TOKEN_LENGTH = 32
+MERGE_FACTOR = 8
+CANDIDATE_FACTOR = 4   # Kandidat yang diranking per hasil yang diminta
+SNIPPET_CONTEXT = 40   # Karakter di kiri/kanan kata yang cocok
+OFFSET_ENTRY = struct.Struct("QQ")  # Satu entri .offs: (seq, offset), sama dengan array("Q")
+
+
+def tokenize(text):
+    """Token kata case-folded (token yang sangat panjang dipotong)"""
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall(text.casefold())]
+
+
+def parse_document(message):
+    """
+    Bagian pesan history yang diindeks
+    Returns:
+        [id, sender, waktu, teks, jenis] (jenis "msg" atau "file"), None jika tidak diindeks
+    """
+    try:
+        if message.startswith("[MSG_ID:"):
+            # [MSG_ID:id][HH:MM:SS] user: teks
+            end = message.index("]")
+            msg_id = message[8:end]
+            rest = message[end + 1:]
+            end = rest.index("]")
+            time_str = rest[1:end]
+            sender, _, text = rest[end + 2:].partition(": ")
+            return [msg_id, sender, time_str, text, "msg"]
+        if message.startswith("[FILE_SHARED]"):
+            # [FILE_SHARED]room:file_id:filename:sender:size:preview
+            _, file_id, filename, sender, _ = message[13:].split(":", 4)
+            return [file_id, sender, "", filename, "file"]
+    except ValueError:
+        pass
+    return None
+
+
+def snippet(text, terms):
+    """Potongan teks di sekitar kata pertama yang cocok"""
+    match = None
+    for term in terms:
+        match = re.search(re.escape(term), text, re.IGNORECASE)
+        if match:
+            break
+    if match is None:
+        return text[:SNIPPET_CONTEXT * 2]
+    start = max(0, match.start() - SNIPPET_CONTEXT)
+    end = min(len(text), match.end() + SNIPPET_CONTEXT)
+    return ("…" if start else "") + text[start:end] + ("…" if end < len(text) else "")
+
+
+class TermCache:
+    """
+    LRU kamus segmen yang sedang di memori, dibagi semua room
+    Args:
+        max_terms: Budget total term yang dimuat
+    """
+    def __init__(self, max_terms):
+        self.max_terms = max_terms
+        self.entries = collections.OrderedDict()  # path -> (terms {token: index}, starts array)
+        self.total = 0
+        self.lock = threading.Lock()  # Room berbeda mencari dari worker berbeda
+        self.loads = 0
+
+    def get(self, path):
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                self.entries.move_to_end(path)
+                return entry
+        entry = self._load(path)
+        with self.lock:
+            if path not in self.entries:
+                self.entries[path] = entry
+                self.total += len(entry[0])
+                self.loads += 1
+            # Entry terbaru selalu disimpan walau sendirian melebihi budget
+            while self.total > self.max_terms and len(self.entries) > 1:
+                _, (terms, _) = self.entries.popitem(last=False)
+                self.total -= len(terms)
+        return entry
+
+    def discard(self, path):
+        with self.lock:
+            entry = self.entries.pop(path, None)
+            if entry is not None:
+                self.total -= len(entry[0])
+
+    @staticmethod
+    def _load(path):
+        terms = {}
+        starts = array.array("Q", [0])
+        with open(path, encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                token, _, count = line.rstrip("\n").rpartition(" ")
+                terms[token] = i
+                starts.append(starts[-1] + int(count))
+        return terms, starts
+
+
+class Segment:
+    """
+    Segmen index immutable di disk
+    Args:
+        base: Path tanpa ekstensi (<index dir>/<id>)
+        first_seq, last_seq: Rentang seq dokumen di segmen
+        ndocs: Jumlah dokumen
+    """
+    __slots__ = ("id", "base", "first_seq", "last_seq", "ndocs", "cache")
+
+    def __init__(self, segment_id, directory, first_seq, last_seq, ndocs, cache):
+        self.id = segment_id
+        self.base = os.path.join(directory, f"{segment_id:08d}")
+        self.first_seq = first_seq
+        self.last_seq = last_seq
+        self.ndocs = ndocs
+        self.cache = cache
+
+    def _lookup(self, term):
+        terms, starts = self.cache.get(self.base + ".terms")
+        index = terms.get(term)
+        if index is None:
+            return 0, 0
+        return starts[index], starts[index + 1] - starts[index]
+
+    def count(self, term):
+        return self._lookup(term)[1]
+
+    def postings(self, term):
+        start, count = self._lookup(term)
+        postings = array.array("I")
+        if count:
+            with open(self.base + ".post", "rb") as f:
+                f.seek(start * postings.itemsize)
+                postings.frombytes(f.read(count * postings.itemsize))
+        return postings
+
+    def documents(self, seqs):
+        """{seq: dokumen} untuk seq di segmen ini"""
+        docs = {}
+        with open(self.base + ".offs", "rb") as offs, open(self.base + ".docs", "rb") as data:
+            for seq in seqs:
+                offset = self._offset(offs, seq)
+                if offset is None:
+                    continue
+                data.seek(offset)
+                docs[seq] = json.loads(data.readline())
+        return docs
+
+    def _offset(self, offs, seq):
+        def read(position):
+            offs.seek(position * OFFSET_ENTRY.size)
+            return OFFSET_ENTRY.unpack(offs.read(OFFSET_ENTRY.size))
+
+        # Seq biasanya rapat (satu dokumen per seq), cek posisi langsung dulu
+        found, offset = read(min(seq - self.first_seq, self.ndocs - 1))
+        if found == seq:
+            return offset
+        low, high = 0, self.ndocs
+        while low < high:
+            middle = (low + high) // 2
+            found, offset = read(middle)
+            if found == seq:
+                return offset
+            if found < seq:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def documents_reversed(self):
+        """(seq, dokumen) dari yang terbaru ke yang terlama (dibaca sesuai kebutuhan)"""
+        with open(self.base + ".offs", "rb") as offs, open(self.base + ".docs", "rb") as data:
+            for position in range(self.ndocs - 1, -1, -1):
+                offs.seek(position * OFFSET_ENTRY.size)
+                seq, offset = OFFSET_ENTRY.unpack(offs.read(OFFSET_ENTRY.size))
+                data.seek(offset)
+                yield seq, json.loads(data.readline())
+
+    def files(self):
+        return [self.base + ext for ext in (".terms", ".post", ".docs", ".offs")]
+
+
+class RoomIndex:
+    """
+    Index full-text satu room (hanya dipakai dari mailbox room itu, tanpa lock)
+    Args:
+        directory: Folder index room
+        cache: TermCache bersama
+        flush_docs: Dokumen di tail memori sebelum ditulis sebagai segmen
+        max_segment_docs: Segmen sebesar ini tidak digabung lagi
+    """
+    def __init__(self, directory, cache, flush_docs, max_segment_docs):
+        self.directory = directory
+        self.cache = cache
+        self.flush_docs = flush_docs
+        self.max_segment_docs = max_segment_docs
+        self.loaded = False
+        self.segments = []
+        self.next_id = 1
+        self.flushed_seq = 0     # Seq terakhir yang sudah ada di segmen disk
+        self.indexed_seq = 0     # Seq terakhir yang sudah diindeks (disk atau tail)
+        self.tail_docs = {}      # seq -> dokumen yang belum di-flush
+        self.tail_postings = {}  # token -> array seq (naik)
+        self.nbytes = 0          # Perkiraan byte teks di tail (untuk budget memori room)
+
+    def _load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            with open(os.path.join(self.directory, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.next_id = meta.get("next_id", 1)
+        self.flushed_seq = self.indexed_seq = meta.get("last_seq", 0)
+        self.segments = [Segment(segment_id, self.directory, first, last, ndocs, self.cache)
+                         for segment_id, first, last, ndocs in meta.get("segments", [])]
+
+    def _save_meta(self):
+        path = os.path.join(self.directory, "meta.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "version": 1,
+                "next_id": self.next_id,
+                "last_seq": self.flushed_seq,
+                "segments": [[s.id, s.first_seq, s.last_seq, s.ndocs] for s in self.segments],
+            }, f)
+        os.replace(path + ".tmp", path)
+
+    # ---- Menulis ----
+
+    def add_message(self, seq, message):
+        """Indeks satu pesan history dengan seq room-nya"""
+        doc = parse_document(message)
+        if doc is None:
+            return
+        self._load()
+        if seq <= self.indexed_seq:
+            return  # Sudah terindeks (mis. catch-up setelah restart)
+        self.indexed_seq = seq
+        self.tail_docs[seq] = doc
+        self.nbytes += len(doc[3]) + len(doc[0]) + len(doc[1])
+        for token in set(tokenize(doc[3])):
+            postings = self.tail_postings.get(token)
+            if postings is None:
+                postings = self.tail_postings[token] = array.array("I")
+            postings.append(seq)
+        if len(self.tail_docs) >= self.flush_docs:
+            self.flush()
+
+    def catch_up(self, seq, messages):
+        """
+        Indeks pesan history yang belum masuk index (tail yang hilang saat crash, room lama)
+        Args:
+            seq: Seq pesan terakhir room
+            messages: Pesan history, pesan terakhir ber-seq seq
+        """
+        first = seq - len(messages) + 1
+        for i, message in enumerate(messages):
+            self.add_message(first + i, message)
+
+    def flush(self):
+        """Tulis tail sebagai segmen baru lalu gabungkan segmen kecil"""
+        self._load()
+        if not self.tail_docs:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        segment = self._new_segment(min(self.tail_docs), max(self.tail_docs), len(self.tail_docs))
+        tokens = sorted(self.tail_postings)
+        with open(segment.base + ".terms", "w", encoding="utf-8") as f:
+            f.writelines(f"{token} {len(self.tail_postings[token])}\n" for token in tokens)
+        with open(segment.base + ".post", "wb") as f:
+            for token in tokens:
+                self.tail_postings[token].tofile(f)
+        offsets = array.array("Q")
+        with open(segment.base + ".docs", "wb") as f:
+            for seq in sorted(self.tail_docs):
+                offsets.extend((seq, f.tell()))
+                f.write(json.dumps(self.tail_docs[seq], ensure_ascii=False).encode() + b"\n")
+        with open(segment.base + ".offs", "wb") as f:
+            offsets.tofile(f)
+
+        self.segments.append(segment)
+        self.flushed_seq = segment.last_seq
+        self.tail_docs = {}
+        self.tail_postings = {}
+        self.nbytes = 0
+        self._merge()
+        self._save_meta()
+
+    def _new_segment(self, first_seq, last_seq, ndocs):
+        segment = Segment(self.next_id, self.directory, first_seq, last_seq, ndocs, self.cache)
+        self.next_id += 1
+        return segment
+
+    def _tier(self, segment):
+        return int(math.log(max(segment.ndocs, self.flush_docs) / self.flush_docs, MERGE_FACTOR))
+
+    def _merge(self):
+        # Gabungkan MERGE_FACTOR segmen terakhir selama tier-nya sama (seperti LSM/Lucene)
+        while len(self.segments) >= MERGE_FACTOR:
+            group = self.segments[-MERGE_FACTOR:]
+            tier = self._tier(group[-1])
+            if any(self._tier(s) != tier for s in group):
+                break
+            if sum(s.ndocs for s in group) > self.max_segment_docs:
+                break
+            merged = self._merge_segments(group)
+            self.segments[-MERGE_FACTOR:] = [merged]
+            # Meta baru harus tersimpan sebelum file segmen lama dihapus
+            self._save_meta()
+            for s in group:
+                self.cache.discard(s.base + ".terms")
+                for path in s.files():
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+
+    def _merge_segments(self, group):
+        merged = self._new_segment(group[0].first_seq, group[-1].last_seq, sum(s.ndocs for s in group))
+        dictionaries = [self.cache.get(s.base + ".terms") for s in group]
+        tokens = sorted(set().union(*(terms for terms, _ in dictionaries)))
+        post_files = [open(s.base + ".post", "rb") for s in group]
+        try:
+            with open(merged.base + ".terms", "w", encoding="utf-8") as terms_out, \
+                    open(merged.base + ".post", "wb") as post_out:
+                # Posting tiap segmen urut token, jadi tiap file dibaca berurutan
+                for token in tokens:
+                    total = 0
+                    for (terms, starts), f in zip(dictionaries, post_files):
+                        index = terms.get(token)
+                        if index is None:
+                            continue
+                        count = starts[index + 1] - starts[index]
+                        f.seek(starts[index] * 4)
+                        post_out.write(f.read(count * 4))
+                        total += count
+                    terms_out.write(f"{token} {total}\n")
+        finally:
+            for f in post_files:
+                f.close()
+
+        offsets = array.array("Q")
+        with open(merged.base + ".docs", "wb") as docs_out:
+            for s in group:
+                base_offset = docs_out.tell()
+                with open(s.base + ".docs", "rb") as f:
+                    shutil.copyfileobj(f, docs_out)
+                part = array.array("Q")
+                with open(s.base + ".offs", "rb") as f:
+                    part.frombytes(f.read())
+                for i in range(1, len(part), 2):
+                    part[i] += base_offset
+                offsets.extend(part)
+        with open(merged.base + ".offs", "wb") as f:
+            offsets.tofile(f)
+        return merged
+
+    def close(self):
+        """Flush tail lalu lepas kamus dari cache (room di-page keluar)"""
+        self.flush()
+        for s in self.segments:
+            self.cache.discard(s.base + ".terms")
+
+    def destroy(self):
+        """Hapus seluruh index (room dihapus)"""
+        for s in self.segments:
+            self.cache.discard(s.base + ".terms")
+        remove_index(self.directory)
+        self.segments = []
+        self.tail_docs = {}
+        self.tail_postings = {}
+        self.nbytes = 0
+        self.flushed_seq = self.indexed_seq = 0
+
+    # ---- Pesan lama (scrollback client) ----
+
+    def find_seq(self, doc_id, max_scan):
+        """
+        Seq dokumen dengan id ini (msg_id / file_id), dicari dari yang terbaru
+        Args:
+            max_scan: Dokumen maksimal yang diperiksa; yang dicari client biasanya
+                dekat ujung karena scrollback client terbatas
+        Returns:
+            seq atau None
+        """
+        self._load()
+        scanned = 0
+        for seq in sorted(self.tail_docs, reverse=True):
+            if self.tail_docs[seq][0] == doc_id:
+                return seq
+            scanned += 1
+            if scanned >= max_scan:
+                return None
+        for segment in reversed(self.segments):
+            for seq, doc in segment.documents_reversed():
+                if doc[0] == doc_id:
+                    return seq
+                scanned += 1
+                if scanned >= max_scan:
+                    return None
+        return None
+
+    def documents_range(self, first_seq, last_seq):
+        """
+        Dokumen dengan first_seq <= seq <= last_seq
+        Returns:
+            List (seq, dokumen) urut seq
+        """
+        self._load()
+        docs = {}
+        for segment in self.segments:
+            if segment.last_seq >= first_seq and segment.first_seq <= last_seq:
+                docs.update(segment.documents(range(max(first_seq, segment.first_seq),
+                                                    min(last_seq, segment.last_seq) + 1)))
+        docs.update((seq, doc) for seq, doc in self.tail_docs.items() if first_seq <= seq <= last_seq)
+        return sorted(docs.items())
+
+    # ---- Mencari ----
+
+    def search(self, query, limit):
+        """
+        Cari dokumen yang memuat semua kata query
+        Ranking: frasa persis > jumlah kemunculan kata query > pesan terbaru
+        Returns:
+            List dict {id, seq, sender, time, type, snippet}
+        """
+        self._load()
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+
+        # Segmen dari yang terbaru; tail memori diperlakukan sebagai segmen paling baru
+        sources = [None] + self.segments[::-1]
+        wanted = limit * CANDIDATE_FACTOR
+        candidates = []  # (seq, source)
+        for source in sources:
+            counts = [(self._count(source, term), term) for term in terms]
+            if any(count == 0 for count, _ in counts):
+                continue
+            counts.sort()
+            # Iterasi posting term paling jarang, cek term lain dengan binary search
+            shortest = self._postings(source, counts[0][1])
+            others = [self._postings(source, term) for _, term in counts[1:]]
+            for seq in reversed(shortest):
+                if all(_contains(postings, seq) for postings in others):
+                    candidates.append((seq, source))
+                    if len(candidates) >= wanted:
+                        break
+            if len(candidates) >= wanted:
+                break
+
+        docs = {}
+        by_source = {}
+        for seq, source in candidates:
+            by_source.setdefault(source, []).append(seq)
+        for source, seqs in by_source.items():
+            if source is None:
+                docs.update((seq, self.tail_docs[seq]) for seq in seqs)
+            else:
+                docs.update(source.documents(seqs))
+
+        phrase = " ".join(terms)
+        ranked = []
+        for seq, doc in docs.items():
+            tokens = tokenize(doc[3])
+            hits = sum(1 for token in tokens if token in terms)
+            ranked.append((phrase in " ".join(tokens), hits, seq, doc))
+        ranked.sort(key=lambda item: item[:3], reverse=True)
+        return [{
+            "id": doc[0],
+            "seq": seq,
+            "sender": doc[1],
+            "time": doc[2],
+            "type": doc[4],
+            "snippet": snippet(doc[3], terms),
+        } for _, _, seq, doc in ranked[:limit]]
+
+    def _count(self, source, term):
+        if source is None:
+            postings = self.tail_postings.get(term)
+            return len(postings) if postings else 0
+        return source.count(term)
+
+    def _postings(self, source, term):
+        if source is None:
+            return self.tail_postings.get(term, ())
+        return source.postings(term)
+
+
+def _contains(postings, seq):
+    i = bisect_left(postings, seq)
+    return i < len(postings) and postings[i] == seq
+
+
+def index_directory(root, room_name, incarnation=None):
+    """
+    Folder index room (nama di-hex seperti RoomStore)
+    Room yang punya incarnation memakai folder sendiri, agar index room lama yang
+    dihapus tidak bisa menimpa atau menghapus index room baru bernama sama
+    """
+    name = room_name.encode().hex()
+    if incarnation:
+        name = f"{name}-{incarnation}"
+    return os.path.join(root, name)
+
+
+def remove_index(directory):
+    shutil.rmtree(directory, ignore_errors=True)
@@ -1,23 +1,77 @@
 import socket
+import sys
 import threading
 from config import HOST, PORT, LOG_FILE
-from client_handler import handle_client
+from config import TCP_KEEPALIVE, TCP_KEEPIDLE, TCP_KEEPINTVL, TCP_KEEPCNT, TCP_USER_TIMEOUT
+from config import HANDOFF_SOCKET, STATE_FILE
+from heartbeat import apply_keepalive
+import handoff
+
+# client_handler sengaja di-import di dalam fungsi: process pool thumbnail (spawn)
+# mengeksekusi ulang top-level modul ini, dan state modul client_handler (room, sesi,
+# hub, direktori data) tidak boleh ikut dibuat di proses worker
+
+def drain_and_save():
+    """Drain semua sesi lalu simpan state untuk proses server berikutnya"""
+    from client_handler import drain_sessions, export_state, stop_event_log
+    drain_sessions()
+    handoff.save_state(STATE_FILE, export_state())
+    stop_event_log()
 
 def start_server():
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.bind((HOST, PORT))
-    server.listen()
+    from client_handler import handle_client, start_heartbeat, start_rooms, start_lock_profiler, start_thumbnails, start_event_log, import_state
+    if "--takeover" in sys.argv:
+        # Restart tanpa downtime: ambil listening socket dari proses lama
+        print(f"[HANDOFF] Mengambil alih server lewat {HANDOFF_SOCKET}")
+        server = handoff.take_over(HANDOFF_SOCKET)
+        state = handoff.load_state(STATE_FILE)
+        if state:
+            import_state(state)
+    else:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((HOST, PORT))
+        server.listen()
 
+    # Timeout agar loop accept bisa berhenti saat handoff
+    server.settimeout(1.0)
     print(f"[SERVER] Aktif di {HOST}:{PORT}")
+    start_lock_profiler()
+    start_event_log()
+    start_rooms(LOG_FILE)
+    start_thumbnails()
+    start_heartbeat(LOG_FILE)
+
+    controller = None
+    if handoff.is_supported():
+        controller = handoff.HandoffController(HANDOFF_SOCKET, server, drain_and_save)
+        controller.start()
 
-    while True:
-        client_socket, address = server.accept()
+    while not (controller and controller.stop_accepting.is_set()):
+        try:
+            client_socket, address = server.accept()
+        except socket.timeout:
+            continue
         print(f"[KONEKSI] {address} terhubung")
 
+        if TCP_KEEPALIVE:
+            try:
+                apply_keepalive(client_socket, TCP_KEEPIDLE, TCP_KEEPINTVL, TCP_KEEPCNT, TCP_USER_TIMEOUT)
+            except OSError as e:
+                print(f"[WARN] Gagal mengaktifkan TCP keepalive: {e}")
+
         thread = threading.Thread(
             target=handle_client,
             args=(client_socket, address, LOG_FILE)
         )
         thread.start()
 
-start_server()
+    # Listening socket sudah diserahkan, tunggu drain selesai lalu keluar
+    controller.accept_stopped.set()
+    controller.finished.wait()
+    server.close()
+    print("[SERVER] Proses lama selesai")
+
+# Guard wajib: process pool thumbnail (spawn) meng-import ulang modul ini
+if __name__ == "__main__":
+    start_server()
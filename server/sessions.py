@@ -0,0 +1,130 @@
+import collections
+import itertools
+import threading
+import time
+
+# Satu tabel untuk semua state per koneksi, menggantikan dict paralel
+# (clients, client_codecs, user_active_room, reaped_sockets)
+# Lookup per socket + snapshot tuple untuk iterasi broadcast
+
+
+class Session:
+    """
+    State satu koneksi client
+    Memakai __slots__ agar ringkas: <= 128 byte per objek Session
+    (CPython 64-bit, di luar objek yang direferensikan; dicek tests/test_sessions.py)
+    """
+    __slots__ = ("id", "sock", "username", "address", "codec", "outbox",
+                 "active_room", "rooms", "reaped", "connected_at")
+
+    def __init__(self, session_id, sock, address, username, codec, outbox=None):
+        self.id = session_id
+        self.sock = sock
+        self.username = username
+        self.address = address
+        self.codec = codec
+        self.outbox = outbox  # Antrean kirim prioritas (outbox.Outbox)
+        self.active_room = None  # Room aktif (diubah thread handler sesi ini, atau delete_room)
+        self.rooms = set()       # Nama room yang punya membership sesi ini (aktif + background)
+        self.reaped = False      # True jika sesi ditutup reaper heartbeat
+        self.connected_at = time.time()
+
+    @property
+    def active_room_name(self):
+        room = self.active_room
+        return room.name if room is not None else "general"
+
+
+class RecentSends:
+    """
+    Key idempotency [SEND] yang sudah diproses: (username, key) -> msg_id
+    Dibatasi jumlah key per user dan umur key; dipakai semua thread handler
+    """
+    def __init__(self, per_user, ttl, lock=None):
+        self.per_user = per_user
+        self.ttl = ttl
+        self.lock = lock or threading.Lock()
+        self.by_username = {}  # username -> OrderedDict key -> (msg_id, waktu)
+        self.swept_at = time.monotonic()
+
+    def claim(self, username, key, msg_id):
+        """
+        Catat key untuk msg_id baru
+        Returns:
+            None jika key baru (pesan harus di-post), msg_id lama jika key duplikat
+        """
+        now = time.monotonic()
+        with self.lock:
+            if now - self.swept_at > self.ttl:
+                self._sweep(now)
+            keys = self.by_username.get(username)
+            if keys is None:
+                keys = self.by_username[username] = collections.OrderedDict()
+            # Buang key kedaluwarsa / kelebihan (paling lama di depan)
+            while keys:
+                oldest = next(iter(keys.values()))
+                if now - oldest[1] <= self.ttl and len(keys) < self.per_user:
+                    break
+                keys.popitem(last=False)
+            entry = keys.get(key)
+            if entry is not None:
+                return entry[0]
+            keys[key] = (msg_id, now)
+            return None
+
+    def _sweep(self, now):
+        """Lepas user yang semua key-nya sudah kedaluwarsa (dipanggil dengan lock)"""
+        self.swept_at = now
+        for username, keys in list(self.by_username.items()):
+            if not keys or now - next(reversed(keys.values()))[1] > self.ttl:
+                del self.by_username[username]
+
+
+class SessionTable:
+    """
+    Tabel sesi tanpa lock untuk pembaca
+    Lookup per socket (get) membaca dict yang diubah in-place per key (atomik di CPython),
+    iterasi (broadcast) memakai snapshot tuple yang diganti objek baru setiap connect/disconnect;
+    penulis (connect/disconnect/reap) memegang lock
+    """
+    def __init__(self, lock=None):
+        self.lock = lock or threading.Lock()
+        self.ids = itertools.count(1)
+        self.by_socket = {}
+        self.snapshot = ()  # Tuple semua Session, untuk iterasi broadcast
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def __iter__(self):
+        return iter(self.snapshot)
+
+    def get(self, sock):
+        return self.by_socket.get(sock)
+
+    def add(self, sock, address, username, codec, outbox=None):
+        """
+        Daftarkan koneksi baru
+        Returns:
+            Session yang dibuat
+        """
+        with self.lock:
+            session = Session(next(self.ids), sock, address, username, codec, outbox)
+            self.by_socket[sock] = session
+            self.snapshot = self.snapshot + (session,)
+        return session
+
+    def remove(self, sock):
+        """
+        Hapus sesi milik socket
+        Returns:
+            Session yang dihapus, atau None jika sudah dihapus sebelumnya (mis. oleh reaper)
+        """
+        with self.lock:
+            session = self.by_socket.pop(sock, None)
+            if session is None:
+                return None
+            snapshot = self.snapshot
+            i = snapshot.index(session)
+            self.snapshot = snapshot[:i] + snapshot[i + 1:]
+        return session
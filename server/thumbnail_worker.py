@@ -0,0 +1,60 @@
+import os
+
+# Modul proses worker ThumbnailPool: sengaja hanya meng-import Pillow agar proses spawn
+# tidak memuat client_handler (room, sesi, hub, direktori data, file log)
+
+# Pillow opsional: tanpa Pillow server mengirim gambar asli sebagai preview (perilaku lama)
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Varian thumbnail yang di-cache di samping file asli: uploads/<file_id>.thumb.<ext>
+VARIANTS = {
+    "jpeg": ".thumb.jpg",
+    "webp": ".thumb.webp",  # Format ringkas, dilewati jika Pillow dibangun tanpa libwebp
+}
+
+
+def thumbnail_path(base, variant):
+    return base + VARIANTS[variant]
+
+
+def make_thumbnails(source, base, max_width, quality):
+    """
+    Buat thumbnail JPEG + WebP dari satu gambar (dijalankan di process pool)
+    Thumbnail yang sudah ada di disk dipakai ulang
+    Args:
+        source: Path gambar asli
+        base: Path tanpa ekstensi untuk file thumbnail (uploads/<file_id>)
+        max_width: Lebar maksimal thumbnail (px)
+        quality: Kualitas kompresi JPEG/WebP
+    Returns:
+        {varian: path} untuk thumbnail yang berhasil dibuat
+    """
+    targets = {variant: thumbnail_path(base, variant) for variant in VARIANTS}
+    missing = {variant: path for variant, path in targets.items() if not os.path.exists(path)}
+    if missing:
+        resample = getattr(Image, "Resampling", Image).LANCZOS
+        with Image.open(source) as image:
+            image.thumbnail((max_width, max_width * 10), resample)
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                # JPEG tidak punya alpha: tempel di atas background putih
+                flat = Image.new("RGB", image.size, (255, 255, 255))
+                flat.paste(image, mask=image.split()[-1])
+            else:
+                image = image.convert("RGB")
+                flat = image
+            for variant, path in missing.items():
+                tmp_path = path + ".tmp"
+                try:
+                    if variant == "jpeg":
+                        flat.save(tmp_path, "JPEG", quality=quality, optimize=True)
+                    else:
+                        image.save(tmp_path, "WEBP", quality=quality, method=4)
+                    os.replace(tmp_path, path)
+                except (OSError, KeyError, ValueError):
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+    return {variant: path for variant, path in targets.items() if os.path.exists(path)}
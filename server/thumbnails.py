@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Fungsi yang dijalankan proses worker ada di thumbnail_worker.py (hanya import Pillow),
+# agar proses spawn tidak ikut memuat state server
+from thumbnail_worker import Image, VARIANTS, thumbnail_path, make_thumbnails
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif")
+
+
+def is_image(filename):
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def smallest(paths):
+    """Path thumbnail terkecil (biasanya WebP), None jika tidak ada"""
+    if not paths:
+        return None
+    return min(paths.values(), key=os.path.getsize)
+
+
+class ThumbnailPool:
+    """
+    Process pool untuk decode + resize gambar upload, di luar thread handler
+    Args:
+        workers: Jumlah proses worker
+        max_width: Lebar maksimal thumbnail (px)
+        quality: Kualitas kompresi JPEG/WebP
+    """
+    def __init__(self, workers, max_width, quality):
+        self.workers = workers
+        self.max_width = max_width
+        self.quality = quality
+        self.executor = None
+
+    @property
+    def enabled(self):
+        return self.executor is not None
+
+    def start(self):
+        if Image is None:
+            print("[WARN] Pillow tidak terpasang, thumbnail server nonaktif")
+            return
+        # spawn: jangan fork proses server yang punya banyak thread
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, source, base, callback):
+        """
+        Buat thumbnail di background
+        Args:
+            callback: fn({varian: path}) dipanggil setelah selesai ({} jika gagal)
+        """
+        future = self.executor.submit(make_thumbnails, source, base, self.max_width, self.quality)
+
+        def done(f):
+            try:
+                paths = f.result()
+            except Exception as e:
+                print(f"[ERROR] Thumbnail gagal dibuat: {e}")
+                paths = {}
+            callback(paths)
+
+        future.add_done_callback(done)
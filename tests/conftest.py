@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Modul server dan client di-import flat, sama seperti saat dijalankan dari foldernya
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("server", "client"):
+    path = os.path.join(ROOT, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
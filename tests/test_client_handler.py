@@ -0,0 +1,114 @@
+import socket
+
+import pytest
+
+import client_handler
+from compression import LineCodec
+from room_store import RoomCacheStats, RoomStore
+from rooms import Room
+from sessions import SessionTable
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    """Registry room, tabel sesi dan room store baru per test (worker hub tidak dijalankan)"""
+    monkeypatch.setattr(client_handler, "rooms", {"general": Room("general", client_handler.room_hub)})
+    monkeypatch.setattr(client_handler, "sessions", SessionTable())
+    monkeypatch.setattr(client_handler, "room_store", RoomStore(str(tmp_path / "rooms")))
+    monkeypatch.setattr(client_handler, "room_cache_stats", RoomCacheStats())
+    monkeypatch.setattr(client_handler, "paged_members", {})
+    sockets = []
+    yield sockets
+    for sock in sockets:
+        sock.close()
+
+
+def connect(sockets, username):
+    sock, peer = socket.socketpair()
+    sockets.extend((sock, peer))
+    return client_handler.sessions.add(sock, ("127.0.0.1", 0), username, LineCodec())
+
+
+# ---- Delete room ----
+
+def test_delete_room_moves_active_sessions_to_general(server):
+    client_handler.create_room("dev", "alice")
+    dev = client_handler.get_room("dev")
+    general = client_handler.get_room("general")
+    alice = connect(server, "alice")
+    bob = connect(server, "bob")
+    client_handler.set_active_room(alice, dev)
+    client_handler.set_active_room(bob, general)
+    client_handler.set_active_room(bob, dev)
+    client_handler.set_active_room(bob, general)  # dev tetap background untuk bob
+
+    ok, _ = client_handler.delete_room("dev")
+
+    assert ok
+    assert client_handler.get_room("dev") is None
+    assert alice.active_room is general and alice.active_room_name == "general"
+    assert bob.active_room is general
+    assert "dev" not in alice.rooms and "dev" not in bob.rooms
+    assert "general" in alice.rooms
+
+
+def test_delete_room_rejects_general(server):
+    alice = connect(server, "alice")
+    general = client_handler.get_room("general")
+    client_handler.set_active_room(alice, general)
+    ok, _ = client_handler.delete_room("general")
+    assert not ok
+    assert alice.active_room is general
+
+
+# ---- Subscription background room yang di-page ke disk ----
+
+def page_out(name):
+    room = client_handler.get_room(name)
+    assert client_handler.page_out_room(room)
+    return room
+
+
+def test_subscribe_does_not_page_room_in(server):
+    client_handler.rooms["arsip"] = None
+    client_handler.room_store.save("arsip", {"messages": ["[MSG_ID:m1][10:00:00] alice: halo"], "seq": 1})
+    bob = connect(server, "bob")
+
+    assert client_handler.subscribe_room(bob, "arsip", "mentions")
+    assert not client_handler.subscribe_room(bob, "tidak-ada", "mentions")
+
+    assert client_handler.rooms["arsip"] is None
+    assert client_handler.room_cache_stats.page_ins == 0
+    assert "arsip" in bob.rooms
+    # Saat room dimuat ulang (mis. ada pesan baru) subscription sudah terpasang
+    room = client_handler.get_room("arsip")
+    member = room.members[bob.sock]
+    assert member.mode == "mentions" and not member.active
+    assert member.delivered_seq == room.seq == 1
+
+
+def test_background_members_survive_page_out(server):
+    client_handler.create_room("arsip", "alice")
+    room = client_handler.get_room("arsip")
+    bob = connect(server, "bob")
+    client_handler.subscribe_room(bob, "arsip", "unread")
+    room.subscribe(bob.sock, "bob", "unread")  # Mailbox tidak dijalankan di test ini
+    room.members[bob.sock].unread, room.members[bob.sock].mentions = 3, 1
+
+    page_out("arsip")
+
+    member = client_handler.get_room("arsip").members[bob.sock]
+    assert (member.unread, member.mentions) == (3, 1)
+
+
+def test_release_paged_member_keeps_room_on_disk(server):
+    client_handler.create_room("arsip", "alice")
+    page_out("arsip")
+    bob = connect(server, "bob")
+    client_handler.subscribe_room(bob, "arsip", "mentions")
+
+    assert client_handler.release_paged_member("arsip", bob.sock) is None
+    assert client_handler.paged_members == {}
+    assert client_handler.rooms["arsip"] is None
+    # Room resident dikembalikan agar pemanggil memakai mailbox-nya
+    assert client_handler.release_paged_member("general", bob.sock) is client_handler.get_room("general")
@@ -0,0 +1,162 @@
+import json
+import zlib
+
+import pytest
+
+import compression
+import protocol
+from compression import FRAME_RAW, FRAME_SHARED, FRAME_STREAM, FRAME_HEADER
+from compression import BroadcastFrame, DeflateCodec, FrameReader, LineCodec, negotiate_codec
+
+MESSAGES = [
+    "[MSG_ID:abc][10:00:00] alice: halo",
+    "[USERS]" + '{"alice": "general", "bob": "general", "carol": "gaming"}',
+    "[FILE_SHARED]general:1234:foto.png:alice:2048:iVBORw0KGgoAAAANSUhEUgAA" + "A" * 300,
+    "[INFO] bob bergabung dari ('127.0.0.1', 50000)" * 3,
+    "ünïcödé 🎉 " * 20,
+]
+
+
+def frame_types(data):
+    types = []
+    while data:
+        frame_type, length = FRAME_HEADER.unpack_from(data)
+        types.append(frame_type)
+        data = data[FRAME_HEADER.size + length:]
+    return types
+
+
+def decode_all(reader, data, step=7):
+    # Diumpankan sedikit-sedikit agar frame terpotong di tengah header/payload
+    messages = []
+    for i in range(0, len(data), step):
+        reader.feed(data[i:i + step])
+        while True:
+            message = reader.next_message()
+            if message is None:
+                break
+            messages.append(message)
+    return messages
+
+
+def test_preset_dictionary_matches_client():
+    assert compression.PRESET_DICTIONARY == protocol.PRESET_DICTIONARY
+    assert compression.DICTIONARY_VERSION == protocol.DICTIONARY_VERSION
+    assert compression.DICTIONARY_CHECKSUM == protocol.DICTIONARY_CHECKSUM
+    assert (compression.FRAME_RAW, compression.FRAME_STREAM, compression.FRAME_SHARED) == \
+        (protocol.FRAME_RAW, protocol.FRAME_STREAM, protocol.FRAME_SHARED)
+
+
+def test_server_stream_frames_decode_on_client():
+    server = DeflateCodec(6, 32)
+    data = b"".join(server.encode(message) for message in MESSAGES)
+    assert FRAME_STREAM in frame_types(data)
+
+    reader = protocol.FrameReader()
+    reader.codec = protocol.DeflateCodec(32)
+    assert decode_all(reader, data) == MESSAGES
+
+
+def test_shared_frames_decode_on_client_between_stream_frames():
+    server = DeflateCodec(6, 32)
+    frames = []
+    for i, message in enumerate(MESSAGES):
+        # Broadcast (shared) diselipkan di antara frame stream tanpa merusak konteks stream
+        frames.append(BroadcastFrame(message).for_codec(server) if i % 2 else server.encode(message))
+    data = b"".join(frames)
+    assert FRAME_SHARED in frame_types(data) and FRAME_STREAM in frame_types(data)
+
+    reader = protocol.FrameReader()
+    reader.codec = protocol.DeflateCodec(32)
+    assert decode_all(reader, data) == MESSAGES
+
+
+def test_small_frames_stay_raw():
+    server = DeflateCodec(6, 256)
+    data = server.encode("[TYPING]alice")
+    assert frame_types(data) == [FRAME_RAW]
+    assert data[FRAME_HEADER.size:] == b"[TYPING]alice"
+
+
+def test_client_frames_decode_on_server():
+    client = protocol.DeflateCodec(32)
+    data = b"".join(client.encode(message) for message in MESSAGES)
+    reader = FrameReader()
+    reader.codec = DeflateCodec(6, 32)
+    assert decode_all(reader, data) == MESSAGES
+
+
+def test_shared_frame_uses_preset_dictionary():
+    message = "[ROOM_LIST][\"general\", \"gaming\"][ROOM_JOINED][STOP_TYPING]" * 2
+    server = DeflateCodec(6, 16)
+    frame = server.encode_shared(message)
+    payload = frame[FRAME_HEADER.size:]
+    assert zlib.decompressobj(-15, zdict=protocol.PRESET_DICTIONARY).decompress(payload).decode() == message
+    plain = zlib.compressobj(6, zlib.DEFLATED, -15)
+    assert len(payload) < len(plain.compress(message.encode()) + plain.flush())
+
+
+def test_broadcast_frame_encodes_once_per_setting():
+    frame = BroadcastFrame("[INFO] " + "x" * 500)
+    first, second = DeflateCodec(6, 16), DeflateCodec(6, 16)
+    assert frame.for_codec(first) is frame.for_codec(second)
+    assert frame.cached(first.settings_key) is not None
+    assert frame.cached(LineCodec().settings_key) is None
+
+
+def test_line_mode_round_trip():
+    data = b"".join(LineCodec().encode(message) for message in MESSAGES)
+    assert decode_all(FrameReader(), data) == MESSAGES
+
+
+def test_negotiate_codec():
+    offer = {"compression": ["deflate"], "dict": protocol.DICTIONARY_VERSION,
+             "dict_checksum": protocol.DICTIONARY_CHECKSUM}
+    assert isinstance(negotiate_codec(offer, True, 6, 256), DeflateCodec)
+    assert isinstance(negotiate_codec(offer, False, 6, 256), LineCodec)
+    assert isinstance(negotiate_codec({"compression": []}, True, 6, 256), LineCodec)
+    assert isinstance(negotiate_codec(dict(offer, dict=99), True, 6, 256), LineCodec)
+    # Client lama tanpa checksum tetap boleh, checksum berbeda tidak
+    legacy = {"compression": ["deflate"], "dict": protocol.DICTIONARY_VERSION}
+    assert isinstance(negotiate_codec(legacy, True, 6, 256), DeflateCodec)
+    assert isinstance(negotiate_codec(dict(offer, dict_checksum=1), True, 6, 256), LineCodec)
+
+
+def test_client_hello_offers_dictionary_checksum():
+    hello = protocol.hello_line({"username": "alice"})
+    offer = json.loads(hello.decode()[7:])
+    assert offer["dict_checksum"] == compression.DICTIONARY_CHECKSUM
+    assert isinstance(negotiate_codec(offer, True, 6, 256), DeflateCodec)
+
+
+def test_decompressed_frame_size_is_limited():
+    reader = FrameReader()
+    reader.codec = DeflateCodec(6, 32, max_frame=1000)
+    client = protocol.DeflateCodec(32)
+    reader.feed(client.encode("x" * 1000))
+    assert reader.next_message() == "x" * 1000
+
+    # Payload terkompresi kecil yang mengembang melebihi batas
+    bomb = client.encode("y" * 100000)
+    assert len(bomb) < 1000
+    reader.feed(bomb)
+    with pytest.raises(ValueError):
+        reader.next_message()
+
+
+def test_shared_frame_size_is_limited():
+    reader = FrameReader()
+    reader.codec = DeflateCodec(6, 32, max_frame=1000)
+    reader.feed(DeflateCodec(6, 32).encode_shared("z" * 100000))
+    with pytest.raises(ValueError):
+        reader.next_message()
+
+
+def test_oversized_frame_header_is_rejected_before_payload():
+    reader = FrameReader()
+    reader.codec = DeflateCodec(6, 32, max_frame=1000)
+    reader.feed(FRAME_HEADER.pack(FRAME_RAW, 1 << 30))
+    with pytest.raises(ValueError):
+        reader.next_message()
+    assert negotiate_codec({"compression": ["deflate"], "dict": protocol.DICTIONARY_VERSION},
+                           True, 6, 256, 1000).max_frame == 1000
@@ -0,0 +1,102 @@
+import json
+import os
+
+import pytest
+
+from event_log import (CHAT_COMMAND, EVENT_COMMAND, EVENT_CONNECT, EVENT_DISCONNECT, EventLog,
+                       log_files, read_events, split_command)
+
+MESSAGES = [
+    "halo semua",
+    "[café] hi",
+    "[TYPING]",
+    "[SEND]k1:pesan dengan id",
+    "[JOIN_ROOM]gaming",
+    "ünïcödé 🎉",
+]
+
+
+def write_events(directory, events, max_bytes=1 << 20, inline_max=64):
+    log = EventLog(str(directory), max_bytes, inline_max, index_interval=0)
+    log.start()
+    for event in events:
+        log.record(*event)
+    log.close()
+    return log
+
+
+def test_split_command_only_splits_protocol_commands():
+    assert split_command("[TYPING]") == ("[TYPING]", "")
+    assert split_command("[SEND]k1:halo") == ("[SEND]", "k1:halo")
+    assert split_command("[café] hi") == (CHAT_COMMAND, "[café] hi")
+    assert split_command("[belum ditutup") == (CHAT_COMMAND, "[belum ditutup")
+
+
+def test_write_then_replay(tmp_path):
+    log = write_events(tmp_path, [(EVENT_COMMAND, 7, "general", message) for message in MESSAGES])
+    assert log.records == len(MESSAGES) and log.dropped == 0
+
+    events = list(read_events(str(tmp_path)))
+    assert [event.message for event in events] == MESSAGES
+    assert all(event.kind == EVENT_COMMAND and event.session == 7 for event in events)
+    assert [event.command for event in events][:3] == [CHAT_COMMAND, CHAT_COMMAND, "[TYPING]"]
+    assert events[0].room == "general"
+    assert [event.timestamp for event in events] == sorted(event.timestamp for event in events)
+
+
+def test_large_payload_goes_to_blob(tmp_path):
+    upload = "[FILE]general:foto.png:3000:" + "QUJD" * 750
+    write_events(tmp_path, [(EVENT_COMMAND, 1, "general", "kecil"), (EVENT_COMMAND, 1, "general", upload)])
+    small, large = read_events(str(tmp_path))
+    assert small.blob_ref is None
+    assert large.blob_ref is not None and large.inline is None
+    assert large.command == "[FILE]"
+    assert large.message == upload
+    # .evl hanya memuat referensi, bukan isi upload
+    evl, = log_files(str(tmp_path))
+    assert os.path.getsize(evl) < 200
+
+
+def test_connect_and_disconnect_events(tmp_path):
+    hello = json.dumps({"username": "alice", "address": "127.0.0.1:5000", "hello": {}})
+    write_events(tmp_path, [
+        (EVENT_CONNECT, 3, "general", hello, ""),
+        (EVENT_DISCONNECT, 3, "gaming", "", ""),
+    ])
+    connect, disconnect = read_events(str(tmp_path))
+    assert connect.kind == EVENT_CONNECT and connect.command == ""
+    assert json.loads(connect.payload())["username"] == "alice"
+    assert disconnect.kind == EVENT_DISCONNECT and disconnect.room == "gaming"
+
+
+def test_since_until_filter(tmp_path):
+    write_events(tmp_path, [(EVENT_COMMAND, 1, "general", f"pesan {i}") for i in range(20)])
+    events = list(read_events(str(tmp_path)))
+    middle = events[10].timestamp
+    assert all(event.timestamp >= middle for event in read_events(str(tmp_path), since=middle))
+    assert [event.message for event in read_events(str(tmp_path), since=middle)] == \
+        [event.message for event in events if event.timestamp >= middle]
+    assert [event.message for event in read_events(str(tmp_path), until=middle)] == \
+        [event.message for event in events if event.timestamp <= middle]
+
+
+def test_rotation_keeps_order(tmp_path):
+    messages = [f"pesan nomor {i}" for i in range(30)]
+    write_events(tmp_path, [(EVENT_COMMAND, 1, "general", message) for message in messages], max_bytes=200)
+    assert len(log_files(str(tmp_path))) > 3
+    assert [event.message for event in read_events(str(tmp_path))] == messages
+
+
+def test_truncated_last_record_is_ignored(tmp_path):
+    write_events(tmp_path, [(EVENT_COMMAND, 1, "general", message) for message in MESSAGES])
+    evl, = log_files(str(tmp_path))
+    with open(evl, "r+b") as f:
+        f.truncate(os.path.getsize(evl) - 3)
+    assert [event.message for event in read_events(evl)] == MESSAGES[:-1]
+
+
+def test_not_an_event_log(tmp_path):
+    path = tmp_path / "lain.evl"
+    path.write_bytes(b"bukan event log")
+    with pytest.raises(ValueError):
+        list(read_events(str(path)))
@@ -0,0 +1,192 @@
+import socket
+import threading
+
+import protocol
+from compression import DeflateCodec, LineCodec
+from outbox import CLASS_BULK, CLASS_CONTROL, CLASS_EPHEMERAL, CLASS_PRESENCE, Outbox, OutboxStats, classify
+
+LIMITS = {
+    "behind_bytes": 1 << 20,
+    "max_bytes": 1 << 24,
+    "ephemeral_max": 16,
+    "chunk_size": 100,
+    "batch_bytes": 1 << 20,
+    "sndbuf": None,
+}
+
+
+class Peer:
+    """Sisi client dari socketpair: dibaca terus di thread sendiri agar buffer socket tidak penuh"""
+    def __init__(self, sock, codec=None):
+        self.sock = sock
+        self.reader = protocol.FrameReader()
+        self.reader.codec = codec
+        self.messages = []
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            data = self.sock.recv(65536)
+            if not data:
+                return
+            self.reader.feed(data)
+            while True:
+                message = self.reader.next_message()
+                if message is None:
+                    break
+                self.messages.append(message)
+
+    def received(self, timeout=5):
+        self.thread.join(timeout)
+        return self.messages
+
+
+def open_outbox(codec=None, client_codec=None, **limits):
+    server_sock, client_sock = socket.socketpair()
+    outbox = Outbox(server_sock, codec or LineCodec(), OutboxStats(), dict(LIMITS, **limits), chunks=True)
+    return outbox, server_sock, Peer(client_sock, client_codec)
+
+
+def finish(outbox, server_sock, peer):
+    """Kirim sisa antrean, tutup koneksi, lalu semua pesan yang diterima client"""
+    outbox.close()
+    outbox.wait(5)
+    server_sock.close()
+    return peer.received()
+
+
+def reassemble(messages):
+    assembler = protocol.ChunkAssembler()
+    result = []
+    for message in messages:
+        event = protocol.parse_event(message)
+        if event.kind == "chunk":
+            message = assembler.add(*event.data)
+            if message is None:
+                continue
+        result.append(message)
+    return result
+
+
+def test_classify_by_command_only():
+    assert classify("halo") == CLASS_CONTROL
+    assert classify("[FILE_SHARED]general:f:a.png:alice:10:" + "A" * 100000) == CLASS_CONTROL
+    assert classify("[USERS]{}") == classify("[UNREAD]general:1:0") == CLASS_PRESENCE
+    assert classify("[TYPING]bob") == classify("[READ]m1:bob") == CLASS_EPHEMERAL
+    assert classify("[FILE_DATA]f:a.png:AAAA") == CLASS_BULK
+
+
+def test_lanes_are_sent_by_priority():
+    outbox, server_sock, peer = open_outbox()
+    # Diantrekan sebelum writer jalan: satu batch, diurutkan per lane
+    for message in ("[FILE_DATA]f1:a.bin:QUJD", "[TYPING]bob", "[USERS]{}", "chat 1", "[ROOM_LIST][]", "chat 2"):
+        assert outbox.put(message)
+    outbox.start("test-outbox")
+    assert finish(outbox, server_sock, peer) == [
+        "chat 1", "chat 2", "[USERS]{}", "[ROOM_LIST][]", "[TYPING]bob", "[FILE_DATA]f1:a.bin:QUJD",
+    ]
+
+
+def test_presence_and_typing_are_coalesced():
+    outbox, server_sock, peer = open_outbox()
+    outbox.put('[USERS]{"alice": "general"}')
+    outbox.put("[TYPING]bob")
+    outbox.put("[TYPING]carol")
+    outbox.put('[USERS]{"alice": "general", "bob": "general"}')
+    outbox.put("[STOP_TYPING]bob")
+    outbox.put("[UNREAD]gaming:1:0")
+    outbox.put("[UNREAD]gaming:2:1")
+    outbox.start("test-outbox")
+    assert finish(outbox, server_sock, peer) == [
+        '[USERS]{"alice": "general", "bob": "general"}', "[UNREAD]gaming:2:1",
+        "[STOP_TYPING]bob", "[TYPING]carol",
+    ]
+    assert outbox.counters.coalesced[CLASS_PRESENCE] == 2
+    assert outbox.counters.coalesced[CLASS_EPHEMERAL] == 1
+
+
+def test_typing_dropped_when_connection_is_behind():
+    outbox, server_sock, peer = open_outbox(behind_bytes=50)
+    outbox.put("x" * 100)
+    outbox.put("[TYPING]bob")
+    outbox.put("[READ]m1:bob")
+    outbox.put("[STOP_TYPING]bob")  # Tidak pernah dibuang: typing indicator harus bisa berhenti
+    outbox.start("test-outbox")
+    assert finish(outbox, server_sock, peer) == ["x" * 100, "[STOP_TYPING]bob"]
+    assert outbox.counters.dropped[CLASS_EPHEMERAL] == 2
+
+
+def test_file_data_is_chunked_and_reassembled():
+    file_data = "[FILE_DATA]f1:foto.png:" + "QUJD" * 300
+    outbox, server_sock, peer = open_outbox(DeflateCodec(6, 64), protocol.DeflateCodec(64))
+    outbox.put(file_data)
+    outbox.put("chat sesudah upload")
+    outbox.start("test-outbox")
+    messages = finish(outbox, server_sock, peer)
+    assert messages[0] == "chat sesudah upload"
+    assert all(message.startswith("[CHUNK]") for message in messages[1:])
+    assert len(messages) - 1 == (len(file_data) + 99) // 100
+    assert reassemble(messages) == ["chat sesudah upload", file_data]
+
+
+def test_control_message_overtakes_remaining_chunks():
+    outbox, server_sock, peer = open_outbox()
+    outbox.put("[FILE_DATA]f1:a.bin:" + "A" * 380)
+    with outbox.cond:
+        first = outbox._take()
+    outbox.put("chat baru")
+    with outbox.cond:
+        second = outbox._take()
+    # Bulk hanya satu potongan per giliran, chat yang datang belakangan langsung menyusul
+    assert [pending.message_class for pending in first] == [CLASS_BULK]
+    assert [pending.message for pending in second] == ["chat baru"]
+    server_sock.close()
+    assert peer.received() == []
+
+
+def test_large_file_shared_keeps_room_order():
+    shared = "[FILE_SHARED]general:f1:foto.png:alice:5000:" + "iVBO" * 2000
+    outbox, server_sock, peer = open_outbox()
+    outbox.start("test-outbox")
+    outbox.put_many([("[MSG_ID:m1][10:00:00] alice: sebelum", None), (shared, None),
+                     ("[MSG_ID:m2][10:00:01] alice: sesudah", None)])
+    assert finish(outbox, server_sock, peer) == [
+        "[MSG_ID:m1][10:00:00] alice: sebelum", shared, "[MSG_ID:m2][10:00:01] alice: sesudah",
+    ]
+
+
+def test_history_frames_keep_their_place_in_control_lane():
+    outbox, server_sock, peer = open_outbox()
+    outbox.put("[USERS]{}")
+    outbox.put("sebelum history")
+    outbox.put_frames([b"history 1\n", b"history 2\n"])
+    outbox.put("sesudah history")
+    outbox.start("test-outbox")
+    assert finish(outbox, server_sock, peer) == [
+        "sebelum history", "history 1", "history 2", "sesudah history", "[USERS]{}",
+    ]
+
+
+def test_put_after_close_is_rejected():
+    outbox, server_sock, peer = open_outbox()
+    outbox.start("test-outbox")
+    outbox.put("terakhir")
+    outbox.close()
+    assert not outbox.put("terlambat")
+    assert not outbox.put_many([("terlambat", None)])
+    assert not outbox.put_frames([b"terlambat\n"])
+    outbox.wait(5)
+    server_sock.close()
+    assert peer.received() == ["terakhir"]
+
+
+def test_overflow_aborts_connection():
+    outbox, server_sock, peer = open_outbox(max_bytes=1000)
+    assert outbox.put("a" * 600)
+    assert not outbox.put("b" * 600)
+    assert outbox.closed and outbox.queued_bytes == 0
+    assert outbox.stats.overflows == 1
+    # Socket di-shutdown: client melihat EOF tanpa menerima apa pun
+    assert peer.received() == []
+    server_sock.close()
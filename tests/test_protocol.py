@@ -0,0 +1,227 @@
+import asyncio
+import json
+import zlib
+
+import pytest
+
+import compression
+import protocol
+from outbox import split_chunks
+from protocol import AsyncClient, ChatMessage, ChunkAssembler, SharedFile, item_id_of, kind_of, parse_event
+
+
+def test_parse_chat_event():
+    event = parse_event("[MSG_ID:m1][10:00:00] alice: halo: apa kabar")
+    assert event.kind == "chat"
+    assert event.data == ChatMessage("m1", "10:00:00", "alice", "halo: apa kabar")
+    # Format lama tanpa MSG_ID dan baris tanpa pengirim
+    assert parse_event("[10:00:00] bob: hai").data == ChatMessage(None, "10:00:00", "bob", "hai")
+    assert parse_event("[10:00:00] tanpa pengirim").data.sender == "Unknown"
+    assert parse_event("teks bebas").data is None
+
+
+def test_parse_command_events():
+    assert parse_event("[USERS]" + json.dumps({"alice": "general"})).data == {"alice": "general"}
+    assert parse_event("[REACTION]m1:👍:bob").data == ("m1", "👍", "bob")
+    assert parse_event("[READ]m1,m2:bob").data == (["m1", "m2"], "bob")
+    assert parse_event("[UNREAD]room:dengan:titik:3:1").data == ("room:dengan:titik", 3, 1)
+    assert parse_event("[RATE_LIMITED]chat:1500").data == ("chat", 1500)
+    assert parse_event("[RECONNECT]" + json.dumps({"delay_ms": 250})).data == 250
+    assert parse_event("[RECONNECT]bukan json").data is None
+    assert parse_event("[INFO]  bob bergabung ").data == "bob bergabung"
+    assert parse_event("[ERROR]file terlalu besar").data == "file terlalu besar"
+    assert parse_event("[SENT]k1:m1").data == ("k1", "m1")
+    assert parse_event("[SYNC_DONE]").data is None
+    assert parse_event("[CHUNK]7:0:3:a:b").data == ("7", 0, 3, "a:b")
+
+
+def test_parse_file_shared():
+    event = parse_event("[FILE_SHARED]general:f1:foto.png:alice:2048:iVBO")
+    assert event.data == SharedFile("general", "f1", "foto.png", "alice", "2048", "iVBO")
+    assert item_id_of(event.raw) == "f1"
+    assert item_id_of("[MSG_ID:m9][10:00:00] a: b") == "m9"
+    assert item_id_of("[INFO] x") is None
+
+
+def test_malformed_command_is_invalid():
+    for raw in ("[FILE_SHARED]general:f1", "[USERS]{rusak", "[RATE_LIMITED]chat:abc", "[READ]tanpa-reader"):
+        assert parse_event(raw).kind == "invalid"
+        assert parse_event(raw).raw == raw
+
+
+def test_kind_of_does_not_parse_payload():
+    assert kind_of("[USERS]{rusak") == "users"
+    assert kind_of("[TIDAK_DIKENAL]x") == "chat"
+    assert kind_of("halo") == "chat"
+
+
+def test_chunk_assembler_out_of_order():
+    message = "[FILE_DATA]f1:foto.png:" + "QUJD" * 100
+    chunks = [protocol.parse_event(chunk.message).data for chunk in split_chunks(message, None, 64)]
+    assembler = ChunkAssembler()
+    results = [assembler.add(*chunk) for chunk in reversed(chunks)]
+    assert results[:-1] == [None] * (len(chunks) - 1)
+    assert results[-1] == message
+    assert assembler.pending == {}
+
+
+def test_chunk_assembler_drops_bad_index():
+    assembler = ChunkAssembler()
+    assert assembler.add("1", 5, 2, "x") is None
+    assert assembler.add("1", 0, 2, "a") is None
+    assert assembler.add("1", 1, 2, "b") == "ab"
+
+
+def test_negotiated_codec():
+    assert protocol.negotiated_codec('[HELLO_OK]{"compression": null}') is None
+    codec = protocol.negotiated_codec('[HELLO_OK]{"compression": "deflate", "threshold": 64, "dict": 1}')
+    assert isinstance(codec, protocol.DeflateCodec) and codec.threshold == 64
+
+
+def test_corrupt_frame_raises_frame_error():
+    reader = protocol.FrameReader()
+    reader.codec = protocol.DeflateCodec(32)
+    reader.feed(protocol.FRAME_HEADER.pack(protocol.FRAME_STREAM, 4) + b"\xff\xff\xff\xff")
+    with pytest.raises(protocol.FRAME_ERRORS):
+        reader.next_message()
+    assert zlib.error in protocol.FRAME_ERRORS
+
+
+# ---- AsyncClient terhadap server palsu (framing dan kompresi dari server/compression.py) ----
+
+class FakeServer:
+    """Server minimal: handshake [HELLO], [PING] awal, ack [SEND], [GET_FILE] dibalas [CHUNK],
+    [GARBAGE] dibalas frame bertipe tidak dikenal"""
+    def __init__(self, ack=True):
+        self.ack = ack
+        self.received = []
+        self.pong = asyncio.Event()
+        self.writer = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        self.writer = writer
+        hello = json.loads((await reader.readline())[7:])
+        codec = compression.negotiate_codec(hello, True, 6, 32)
+        ack = {"compression": codec.name, "threshold": 32, "dict": hello.get("dict")}
+        # Frame pertama ikut dalam write yang sama dengan [HELLO_OK]
+        writer.write(f"[HELLO_OK]{json.dumps(ack)}\n".encode() + codec.encode("[PING]"))
+        frames = compression.FrameReader()
+        frames.codec = codec
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            frames.feed(data)
+            while (msg := frames.next_message()) is not None:
+                self.received.append(msg)
+                if msg == "[PONG]":
+                    self.pong.set()
+                elif msg.startswith("[SEND]") and self.ack:
+                    key, _, text = msg[6:].partition(":")
+                    writer.write(codec.encode(f"[SENT]{key}:m1")
+                                 + codec.encode(f"[MSG_ID:m1][10:00:00] {hello['username']}: {text}"))
+                elif msg.startswith("[GET_FILE]"):
+                    data = f"[FILE_DATA]{msg[10:]}:full:" + "QUJD" * 200
+                    writer.write(b"".join(chunk.for_codec(codec) for chunk in split_chunks(data, None, 100)))
+                elif msg == "[GARBAGE]":
+                    writer.write(protocol.FRAME_HEADER.pack(9, 1) + b"x")
+        writer.close()
+
+    async def disconnect(self):
+        self.writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+
+def test_async_client_session():
+    async def scenario():
+        server = FakeServer()
+        port = await server.start()
+        client = AsyncClient("bot")
+        await client.connect("127.0.0.1", port)
+        assert isinstance(client.codec, protocol.DeflateCodec)
+        # [PING] yang datang bersama [HELLO_OK] dibalas tanpa menunggu data berikutnya
+        await asyncio.wait_for(server.pong.wait(), 2)
+
+        chats = []
+
+        async def collect():
+            async for event in client.events("chat"):
+                chats.append(event.data)
+        collector = asyncio.ensure_future(collect())
+        await asyncio.sleep(0)
+
+        assert await client.send_chat("halo semua") == "m1"
+        client.send("[GET_FILE]f1")
+        event = await client.wait_for("file_data", timeout=2)
+        assert event.data == ("f1", "full", "QUJD" * 200)
+
+        await server.disconnect()
+        await asyncio.wait_for(collector, 2)  # Iterator berhenti saat koneksi ditutup
+        assert client.closed
+        assert chats == [ChatMessage("m1", "10:00:00", "bot", "halo semua")]
+        assert server.received[0] == "[PONG]"
+        assert server.received[1].startswith("[SEND]") and server.received[1].endswith(":halo semua")
+        await client.close()
+    run(scenario())
+
+
+def test_send_chat_fails_when_connection_closes():
+    async def scenario():
+        server = FakeServer(ack=False)
+        port = await server.start()
+        client = AsyncClient("bot", compression=False)
+        await client.connect("127.0.0.1", port)
+        assert client.codec is None
+        pending = asyncio.ensure_future(client.send_chat("tidak di-ack"))
+        await asyncio.sleep(0.05)
+        await server.disconnect()
+        with pytest.raises(ConnectionError):
+            await pending
+        with pytest.raises(ConnectionError):
+            client.send("sesudah tutup")
+        await client.close()
+    run(scenario())
+
+
+def test_callback_errors_do_not_end_session(capsys):
+    async def scenario():
+        server = FakeServer()
+        port = await server.start()
+        client = AsyncClient("bot")
+        await client.connect("127.0.0.1", port)
+        seen = []
+
+        def broken(event):
+            return int(event.data.text)  # ValueError dari bug aplikasi, bukan dari protokol
+        client.on("chat", broken)
+        client.on("chat", lambda event: seen.append(event.data.text))
+
+        assert await client.send_chat("satu") == "m1"
+        assert await client.send_chat("dua") == "m1"
+        for _ in range(100):
+            if len(seen) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert seen == ["satu", "dua"]
+        assert not client.closed
+
+        # Frame rusak dari server tetap menutup sesi
+        client.send("[GARBAGE]")
+        for _ in range(100):
+            if client.closed:
+                break
+            await asyncio.sleep(0.01)
+        assert client.closed
+        await server.disconnect()
+        await client.close()
+    run(scenario())
+    assert "Callback error: ValueError" in capsys.readouterr().out
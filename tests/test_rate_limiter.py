@@ -0,0 +1,95 @@
+import pytest
+
+import rate_limiter
+from config import RATE_LIMITS
+from rate_limiter import RateLimiter, TokenBucket, classify
+
+
+def test_bucket_allows_burst_then_rejects():
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.updated
+    assert [bucket.consume(1, now) for _ in range(3)] == [0, 0, 0]
+    # Kosong: satu token butuh 1/rate detik
+    assert bucket.consume(1, now) == pytest.approx(0.5)
+
+
+def test_bucket_refills_with_time_up_to_capacity():
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.updated
+    for _ in range(3):
+        bucket.consume(1, now)
+    assert bucket.consume(1, now + 0.25) == pytest.approx(0.25)  # Baru terisi setengah token
+    assert bucket.consume(1, now + 0.5) == 0
+    # Lama diam tidak menambah token melebihi burst
+    assert [bucket.consume(1, now + 100) for _ in range(3)] == [0, 0, 0]
+    assert bucket.consume(1, now + 100) > 0
+
+
+def test_rejected_consume_keeps_tokens():
+    bucket = TokenBucket(rate=1, capacity=5)
+    now = bucket.updated
+    assert bucket.consume(4, now) == 0
+    assert bucket.consume(3, now) == pytest.approx(2)
+    assert bucket.consume(1, now) == 0
+
+
+def test_classify():
+    assert classify("halo") == "chat"
+    assert classify("[SEND]k:halo") == "chat"
+    assert classify("[TYPING]") == classify("[STOP_TYPING]") == "typing"
+    assert classify("[FILE]general:a.png:3:AAAA") == "file"
+    assert classify("[SYNC]{}") == "history"
+    assert classify("[SWITCH_ROOM]dev") == "room"
+    assert classify("[SUBSCRIBE]dev,ops:mentions") == classify("[UNSUBSCRIBE]dev") == "subscribe"
+    assert classify("[UNKNOWN]x") == "other"
+
+
+def make_limiter(**limits):
+    return RateLimiter(limits or {"chat": (1, 2), "file": (1, 2)}, upload_rate=100, upload_burst=1000)
+
+
+def test_limiter_rejects_per_class():
+    limiter = make_limiter()
+    assert limiter.check("satu") == ("chat", 0)
+    assert limiter.check("dua") == ("chat", 0)
+    command_class, retry_after = limiter.check("tiga")
+    assert command_class == "chat" and retry_after > 0
+    # Kelas lain punya bucket sendiri, kelas tanpa limit selalu lolos
+    assert limiter.check("[FILE]general:a:1:" + "A" * 10) == ("file", 0)
+    assert limiter.check("[TYPING]") == ("typing", 0)
+
+
+def test_subscriptions_do_not_share_the_room_bucket():
+    # Pindah room berkali-kali tidak boleh menghabiskan token subscription background login
+    limiter = RateLimiter(RATE_LIMITS, upload_rate=100, upload_burst=1000)
+    while not limiter.check("[SWITCH_ROOM]dev")[1]:
+        pass
+    assert limiter.check("[SUBSCRIBE]dev,ops,random:mentions") == ("subscribe", 0)
+
+
+def test_upload_bytes_limit_returns_command_token():
+    limiter = make_limiter()
+    frame = "[FILE]general:a:1:" + "A" * 700
+    assert limiter.check(frame) == ("file", 0)
+    command_class, retry_after = limiter.check(frame)
+    assert command_class == "file" and retry_after > 0
+    # Token command dikembalikan: yang kurang hanya budget byte
+    assert limiter.buckets["file"].tokens == pytest.approx(1, abs=0.01)
+
+
+def test_file_larger_than_upload_burst_is_never_retried():
+    limiter = make_limiter()
+    assert limiter.check("[FILE]general:a:1:" + "A" * 2000) == ("file", None)
+    # Tidak memakan token, upload normal sesudahnya tetap lolos
+    assert limiter.check("[FILE]general:a:1:" + "A" * 10) == ("file", 0)
+
+
+def test_notify_once_per_throttle_period(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    limiter = make_limiter()
+    assert limiter.should_notify("chat", 2.0)
+    assert not limiter.should_notify("chat", 2.0)
+    assert limiter.should_notify("file", 2.0)
+    now[0] += 2.5
+    assert limiter.should_notify("chat", 2.0)
@@ -0,0 +1,110 @@
+from room_store import RoomCacheStats, RoomStore
+from rooms import Room, RoomHub
+
+
+def chat(msg_id, text):
+    return f"[MSG_ID:{msg_id}][10:00:00] alice: {text}"
+
+
+def test_store_round_trip_and_names(tmp_path):
+    store = RoomStore(str(tmp_path / "rooms"))
+    assert store.names() == []
+    assert store.load("kosong") is None
+    # Nama di-hex: karakter apa pun aman sebagai nama file
+    for name in ("gaming", "kafé/../x", "🎮"):
+        store.save(name, {"seq": 1, "messages": [name]})
+    assert sorted(store.names()) == sorted(["gaming", "kafé/../x", "🎮"])
+    assert store.load("kafé/../x") == {"seq": 1, "messages": ["kafé/../x"]}
+    store.delete("gaming")
+    store.delete("gaming")  # Sudah tidak ada: diam saja
+    assert "gaming" not in store.names()
+
+
+def test_corrupt_file_loads_as_none(tmp_path):
+    store = RoomStore(str(tmp_path))
+    store.save("rusak", {"seq": 1})
+    with open(store.path("rusak"), "w") as f:
+        f.write("{bukan json")
+    assert store.load("rusak") is None
+
+
+class Registry:
+    """Registry room minimal seperti di client_handler: nama -> Room, None = di-page ke disk"""
+    def __init__(self, store):
+        self.store = store
+        self.rooms = {}
+        self.hub = RoomHub(2, 64)
+        self.hub.start(lambda sock, message, frame=None: None, lambda sock, history, since=None: None,
+                       lambda text: None, resolve=self.get, page_out=self.page_out)
+
+    def page_out(self, room):
+        self.store.save(room.name, room.snapshot())
+        if self.rooms.get(room.name) is not room:
+            return False
+        self.rooms[room.name] = None
+        return True
+
+    def get(self, name):
+        room = self.rooms.get(name)
+        if room is None and name in self.rooms:
+            state = self.store.load(name) or {}
+            room = Room(name, self.hub, created_by=state.get("created_by"), messages=state.get("messages"),
+                        seq=state.get("seq", 0), reactions=state.get("reactions"),
+                        incarnation=state.get("incarnation"))
+            self.rooms[name] = room
+        return room
+
+
+def test_page_out_then_page_in_restores_room(tmp_path):
+    registry = Registry(RoomStore(str(tmp_path)))
+    room = Room("arsip", registry.hub, created_by="alice", incarnation="i1")
+    registry.rooms["arsip"] = room
+    for i in range(3):
+        room.tell(room.post, chat(f"m{i}", f"pesan {i}"))
+    room.tell(room.toggle_reaction, "m1", "🔥", "bob")
+    room.tell(room.page_out)
+    room.ask(lambda: None)  # Room sudah evicted: forward memanggil resolve, room dimuat ulang dari disk
+    assert room.evicted
+    assert registry.store.load("arsip")["seq"] == 3
+
+    loaded = registry.get("arsip")
+    assert loaded is not room
+    assert loaded.seq == 3
+    assert loaded.history.messages == tuple(chat(f"m{i}", f"pesan {i}") for i in range(3))
+    assert loaded.reactions == {"m1": {"🔥": ["bob"]}}
+    assert loaded.created_by == "alice" and loaded.incarnation == "i1"
+
+
+def test_page_out_skipped_while_room_has_members(tmp_path):
+    registry = Registry(RoomStore(str(tmp_path)))
+    room = Room("ramai", registry.hub)
+    registry.rooms["ramai"] = room
+    room.tell(room.activate, "a", "alice")
+    room.tell(room.page_out)
+    room.ask(lambda: None)
+    assert not room.evicted
+    assert registry.rooms["ramai"] is room
+
+
+def test_mailbox_of_paged_out_room_is_forwarded(tmp_path):
+    registry = Registry(RoomStore(str(tmp_path)))
+    room = Room("lanjut", registry.hub)
+    registry.rooms["lanjut"] = room
+    room.tell(room.post, chat("m1", "sebelum"))
+    room.tell(room.page_out)
+    # Thread handler yang masih memegang referensi lama
+    room.tell(room.post, chat("m2", "sesudah"))
+    room.ask(lambda: None)
+
+    loaded = registry.get("lanjut")
+    loaded.ask(lambda: None)
+    assert loaded.history.messages == (chat("m1", "sebelum"), chat("m2", "sesudah"))
+    assert room.history.messages == (chat("m1", "sebelum"),)
+
+
+def test_cache_stats_summary():
+    stats = RoomCacheStats()
+    stats.page_ins, stats.page_in_time, stats.evictions = 2, 0.004, 3
+    summary = stats.summary(resident=5, paged=7, resident_bytes=1024)
+    assert "resident=5" in summary and "paged=7" in summary
+    assert "evictions=3" in summary and "page_in_avg=2.00ms" in summary
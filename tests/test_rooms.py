@@ -0,0 +1,296 @@
+import threading
+import time
+
+import pytest
+
+from compression import BroadcastFrame, DeflateCodec, LineCodec
+from config import FANOUT_BATCH, ROOM_HISTORY_LIMIT
+from rooms import FanoutWindow, HistorySnapshot, Room, RoomHub
+
+
+class Recorder:
+    """Pengganti send/send_batch/send_history hub: mencatat semua kiriman per socket"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = []     # (sock, message)
+        self.batches = []  # (sock, [message])
+        self.history = []  # (sock, HistorySnapshot, since_seq)
+
+    def send(self, sock, message, frame=None):
+        with self.lock:
+            self.sent.append((sock, message))
+
+    def send_batch(self, sock, items):
+        with self.lock:
+            self.batches.append((sock, [message for message, _ in items]))
+
+    def send_history(self, sock, history, since_seq=None):
+        with self.lock:
+            self.history.append((sock, history, since_seq))
+
+    def to(self, sock):
+        with self.lock:
+            return [message for target, message in self.sent if target == sock]
+
+
+def make_hub(recorder, workers=4, batch=64, fanout=None, **kwargs):
+    hub = RoomHub(workers, batch, fanout=fanout)
+    hub.start(recorder.send, recorder.send_history, lambda text: None,
+              send_batch=recorder.send_batch, **kwargs)
+    return hub
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+def chat(msg_id, text, sender="alice"):
+    return f"[MSG_ID:{msg_id}][10:00:00] {sender}: {text}"
+
+
+# ---- Mailbox ----
+
+def test_mailbox_runs_in_tell_order(recorder):
+    # batch kecil: room berkali-kali antre ulang di belakang room lain
+    hub = make_hub(recorder, workers=4, batch=3)
+    room = Room("order", hub)
+    seen = []
+    for i in range(200):
+        room.tell(seen.append, i)
+    room.ask(lambda: None)
+    assert seen == list(range(200))
+
+
+def test_mailbox_never_runs_one_room_on_two_workers(recorder):
+    hub = make_hub(recorder, workers=8, batch=2)
+    room = Room("serial", hub)
+    state = {"inside": 0, "max": 0}
+
+    def work():
+        state["inside"] += 1
+        state["max"] = max(state["max"], state["inside"])
+        time.sleep(0.0005)
+        state["inside"] -= 1
+
+    threads = [threading.Thread(target=lambda: [room.tell(work) for _ in range(25)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    room.ask(lambda: None)
+    assert state["max"] == 1
+
+
+def test_ask_sees_all_earlier_tells(recorder):
+    hub = make_hub(recorder)
+    room = Room("ask", hub)
+    for i in range(5):
+        room.tell(room.post, chat(f"m{i}", f"pesan {i}"))
+    assert room.ask(lambda: room.seq) == 5
+
+
+def test_failing_message_does_not_stop_mailbox(recorder):
+    hub = make_hub(recorder)
+    room = Room("errors", hub)
+    seen = []
+    room.tell(lambda: 1 / 0)
+    room.tell(seen.append, "after")
+    room.ask(lambda: None)
+    assert seen == ["after"]
+
+
+# ---- HistorySnapshot ----
+
+def test_snapshot_append_is_copy_on_write():
+    first = HistorySnapshot(0)
+    second = first.append("a", BroadcastFrame("a"), 3)
+    assert first.seq == 0 and first.messages == ()
+    assert second.seq == 1 and second.messages == ("a",)
+
+
+def test_snapshot_drops_oldest_beyond_limit():
+    snapshot = HistorySnapshot(0)
+    for message in ("aa", "bbb", "c", "dddd"):
+        snapshot = snapshot.append(message, BroadcastFrame(message), 3)
+    assert snapshot.seq == 4
+    assert snapshot.messages == ("bbb", "c", "dddd")
+    assert snapshot.nbytes == len("bbbcdddd")
+
+
+def test_snapshot_reuses_broadcast_encoding():
+    codec = DeflateCodec(6, 16)
+    snapshot = HistorySnapshot(0)
+    snapshot = snapshot.append(chat("m1", "x" * 40), BroadcastFrame(chat("m1", "x" * 40)), 10)
+    old_frames = snapshot.frames(codec)
+
+    message = chat("m2", "y" * 40)
+    frame = BroadcastFrame(message)
+    live = frame.for_codec(codec)  # Sudah di-encode saat fan-out ke penerima live
+    snapshot = snapshot.append(message, frame, 10)
+    assert snapshot.encoded[codec.settings_key] == old_frames + (live,)
+
+
+def test_snapshot_frames_since_seq():
+    codec = LineCodec()
+    snapshot = HistorySnapshot(0)
+    for i in range(5):
+        snapshot = snapshot.append(f"m{i}", BroadcastFrame(f"m{i}"), 3)
+    assert snapshot.frames(codec, since_seq=3) == (b"m3\n", b"m4\n")
+    assert snapshot.frames(codec, since_seq=5) == ()
+    assert len(snapshot.frames(codec)) == 3
+
+
+def test_room_snapshot_keeps_state(recorder):
+    hub = make_hub(recorder)
+    room = Room("snap", hub, created_by="alice", incarnation="abc")
+    room.tell(room.post, chat("m1", "halo"))
+    room.tell(room.toggle_reaction, "m1", "👍", "bob")
+    snapshot = room.ask(room.snapshot)
+    assert snapshot["messages"] == [chat("m1", "halo")]
+    assert snapshot["seq"] == 1
+    assert snapshot["created_by"] == "alice"
+    assert snapshot["incarnation"] == "abc"
+    assert snapshot["reactions"] == {"m1": {"👍": ["bob"]}}
+
+
+def test_history_limit_evicts_reactions(recorder):
+    hub = make_hub(recorder)
+    room = Room("evict", hub)
+    room.tell(room.post, chat("old", "pertama"))
+    room.tell(room.toggle_reaction, "old", "👍", "bob")
+    for i in range(ROOM_HISTORY_LIMIT):
+        room.tell(room.post, chat(f"m{i}", "isi"))
+    snapshot = room.ask(room.snapshot)
+    assert len(snapshot["messages"]) == ROOM_HISTORY_LIMIT
+    assert "old" not in snapshot["reactions"]
+
+
+# ---- Fan-out ----
+
+def test_fanout_window_stays_zero_for_quiet_room():
+    window = FanoutWindow(FANOUT_BATCH)
+    now = 100.0
+    for _ in range(10):
+        window.observe(now)
+        window.flushed(1, 0.0001, 0.0, 0.0)
+        now += 2.0  # 0.5 pesan/detik
+    assert window.window == 0.0
+
+
+def test_fanout_window_opens_for_busy_room_within_latency_budget():
+    window = FanoutWindow(FANOUT_BATCH)
+    now = 100.0
+    for _ in range(50):
+        window.observe(now)
+        window.flushed(1, 0.0005, 0.0, 0.0)
+        now += 0.001  # 1000 pesan/detik
+    assert window.window > 0
+    assert window.window + window.cost <= FANOUT_BATCH["max_delay"] + 1e-9
+    assert window.rate == pytest.approx(1000, rel=0.01)
+
+
+def test_posts_in_one_turn_go_out_as_one_batch(recorder):
+    hub = make_hub(recorder, fanout=FANOUT_BATCH)
+    room = Room("batch", hub)
+    room.tell(room.activate, "a", "alice")
+    room.tell(room.activate, "b", "bob")
+    room.ask(lambda: None)
+
+    # Tahan mailbox agar ketiga post diproses dalam satu giliran
+    gate = threading.Event()
+    room.tell(gate.wait, 5)
+    for i in range(3):
+        room.tell(room.post, chat(f"m{i}", f"pesan {i}"), "a", f"m{i}")
+    gate.set()
+    room.ask(lambda: None)
+
+    expected = [chat(f"m{i}", f"pesan {i}") for i in range(3)]
+    assert sorted(recorder.batches) == [("a", expected), ("b", expected)]
+    assert recorder.to("a") == ["[DELIVERED]m0", "[DELIVERED]m1", "[DELIVERED]m2"]
+
+
+def test_other_mailbox_work_flushes_pending_posts_first(recorder):
+    hub = make_hub(recorder, fanout=FANOUT_BATCH)
+    room = Room("flush", hub)
+    room.tell(room.activate, "a", "alice")
+    room.ask(lambda: None)
+
+    gate = threading.Event()
+    room.tell(gate.wait, 5)
+    room.tell(room.post, chat("m1", "sebelum typing"))
+    room.tell(room.set_typing, "a", True)
+    room.tell(room.post, chat("m2", "sesudah typing"))
+    gate.set()
+    room.ask(lambda: None)
+
+    assert recorder.batches == [("a", [chat("m1", "sebelum typing")]), ("a", [chat("m2", "sesudah typing")])]
+
+
+def test_background_member_gets_unread_counter_with_mentions(recorder):
+    hub = make_hub(recorder)
+    room = Room("bg", hub)
+    room.tell(room.subscribe, "b", "bob", "unread")
+    room.tell(room.post, chat("m1", "halo semua"))
+    room.tell(room.post, chat("m2", "@Bob lihat ini"))
+    room.ask(lambda: None)
+    assert recorder.to("b")[-1] == "[UNREAD]bg:2:1"
+    assert not [sock for sock, _ in recorder.batches if sock == "b"]
+
+
+def test_mentions_mode_ignores_plain_messages(recorder):
+    hub = make_hub(recorder)
+    room = Room("mentions", hub)
+    room.tell(room.subscribe, "b", "bob", "mentions")
+    room.tell(room.post, chat("m1", "halo semua"))
+    room.ask(lambda: None)
+    assert recorder.to("b") == []
+    room.tell(room.post, chat("m2", "@bob"))
+    room.ask(lambda: None)
+    assert recorder.to("b") == ["[UNREAD]mentions:2:1"]
+
+
+def test_switch_back_sends_only_missed_history(recorder):
+    hub = make_hub(recorder)
+    room = Room("delta", hub)
+    room.tell(room.activate, "a", "alice")
+    room.tell(room.post, chat("m1", "satu"))
+    room.tell(room.deactivate, "a")
+    room.tell(room.post, chat("m2", "dua"))
+    room.tell(room.post, chat("m3", "tiga"))
+    room.tell(room.activate, "a", "alice", True)
+    room.ask(lambda: None)
+    (sock, history, since_seq), = recorder.history
+    assert sock == "a" and since_seq == 1
+    assert history.frames(LineCodec(), since_seq) == (f"{chat('m2', 'dua')}\n".encode(),
+                                                      f"{chat('m3', 'tiga')}\n".encode())
+
+
+def test_close_sends_active_members_to_fallback(recorder):
+    hub = make_hub(recorder)
+    room = Room("hapus", hub)
+    room.tell(room.activate, "a", "alice")
+    room.tell(room.subscribe, "b", "bob", "unread")
+    room.tell(room.close, "general")
+    room.ask(lambda: None)
+    assert room.closed and room.members == {}
+    assert recorder.to("a") == ["[ROOM_JOINED]general"]
+    assert recorder.to("b") == []
+
+
+def test_only_active_members_pin_room_in_memory(recorder):
+    paged = []
+    hub = make_hub(recorder, page_out=lambda room: paged.append(room.name) or True)
+    room = Room("pin", hub)
+    room.tell(room.activate, "a", "alice")
+    room.tell(room.subscribe, "b", "bob", "mentions")
+    assert room.ask(lambda: room.pinned)
+    room.tell(room.page_out)
+    room.ask(lambda: None)
+    assert paged == [] and not room.evicted
+    # Tinggal subscriber background: room boleh di-page keluar
+    room.tell(room.deactivate, "a")
+    assert not room.ask(lambda: room.pinned)
+    room.tell(room.page_out)
+    room.ask(lambda: None)
+    assert paged == ["pin"] and room.evicted
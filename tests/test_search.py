@@ -0,0 +1,117 @@
+import os
+
+from search import MERGE_FACTOR, RoomIndex, TermCache, index_directory, parse_document, tokenize
+
+
+def chat(msg_id, text, sender="alice"):
+    return f"[MSG_ID:{msg_id}][10:00:00] {sender}: {text}"
+
+
+def make_index(path, flush_docs=2, cache=None):
+    return RoomIndex(str(path), cache or TermCache(1000), flush_docs, 10000)
+
+
+def fill(index, texts, first_seq=1):
+    for i, text in enumerate(texts):
+        index.add_message(first_seq + i, chat(f"m{first_seq + i}", text))
+
+
+def test_tokenize_and_parse_document():
+    assert tokenize("Halo, DUNIA! kafé_2") == ["halo", "dunia", "kafé_2"]
+    assert parse_document(chat("x1", "apa kabar")) == ["x1", "alice", "10:00:00", "apa kabar", "msg"]
+    assert parse_document("[FILE_SHARED]general:f1:foto.png:bob:10:AAAA") == ["f1", "bob", "", "foto.png", "file"]
+    assert parse_document("[INFO] bob bergabung") is None
+
+
+def test_segments_merge_and_stay_searchable(tmp_path):
+    index = make_index(tmp_path)
+    # MERGE_FACTOR segmen berukuran flush_docs digabung jadi satu
+    fill(index, [f"pesan nomor{i} umum" for i in range(2 * MERGE_FACTOR)])
+    assert len(index.segments) == 1
+    assert index.segments[0].ndocs == 2 * MERGE_FACTOR
+    fill(index, ["pesan baru umum", "lagi umum", "tail umum"], first_seq=2 * MERGE_FACTOR + 1)
+    assert len(index.segments) == 2 and len(index.tail_docs) == 1
+    # Hanya file segmen yang masih dipakai yang tersisa di disk
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".terms")]) == 2
+
+    results = index.search("umum", 100)
+    assert sorted(result["seq"] for result in results) == list(range(1, 2 * MERGE_FACTOR + 4))
+    assert [result["id"] for result in index.search("nomor3", 10)] == ["m4"]
+    assert [result["id"] for result in index.search("tail", 10)] == ["m19"]
+    assert index.search("tidakada", 10) == []
+
+
+def test_search_requires_all_terms_and_prefers_newest(tmp_path):
+    index = make_index(tmp_path, flush_docs=3)
+    fill(index, ["kopi pagi", "teh pagi", "kopi sore", "kopi pagi lagi"])
+    assert [result["seq"] for result in index.search("pagi kopi", 10)] == [4, 1]
+    assert [result["seq"] for result in index.search("kopi", 2)] == [4, 3]
+
+
+def test_exact_phrase_ranks_first(tmp_path):
+    index = make_index(tmp_path)
+    fill(index, ["kopi susu enak", "susu dan kopi, kopi lagi", "es kopi susu"])
+    results = index.search("kopi susu", 10)
+    # Frasa persis menang dari kemunculan lebih banyak, lalu yang terbaru dulu
+    assert [result["seq"] for result in results] == [3, 1, 2]
+    assert results[0]["snippet"] == "es kopi susu"
+    assert results[0]["sender"] == "alice" and results[0]["type"] == "msg"
+
+
+def test_index_reloads_from_disk(tmp_path):
+    index = make_index(tmp_path)
+    fill(index, ["satu", "dua", "tiga"])
+    index.close()
+
+    reloaded = make_index(tmp_path)
+    assert [result["id"] for result in reloaded.search("tiga", 10)] == ["m3"]
+    # Catch-up setelah restart tidak mengindeks ulang seq lama
+    reloaded.catch_up(4, [chat("m1", "satu"), chat("m2", "dua"), chat("m3", "tiga"), chat("m4", "empat")])
+    assert list(reloaded.tail_docs) == [4]
+    assert len(reloaded.search("satu", 10)) == 1
+
+
+def test_find_seq_and_documents_range(tmp_path):
+    index = make_index(tmp_path)
+    fill(index, ["a", "b", "c", "d", "e"])
+    assert index.find_seq("m2", 10) == 2
+    assert index.find_seq("m5", 10) == 5
+    assert index.find_seq("m1", 2) is None  # Di luar batas scan
+    assert [seq for seq, _ in index.documents_range(2, 5)] == [2, 3, 4, 5]
+    assert index.documents_range(4, 4)[0][1][3] == "d"
+
+
+def test_destroy_removes_index(tmp_path):
+    directory = tmp_path / "room"
+    index = make_index(directory)
+    fill(index, ["hapus aku", "hapus juga", "masih tail hapus"])
+    index.destroy()
+    assert not directory.exists()
+    assert index.search("hapus", 10) == []
+    assert make_index(directory).search("hapus", 10) == []
+
+
+def test_incarnation_gets_own_directory(tmp_path):
+    old = index_directory(str(tmp_path), "gaming", "aaa")
+    new = index_directory(str(tmp_path), "gaming", "bbb")
+    assert old != new
+    assert index_directory(str(tmp_path), "gaming") == os.path.join(str(tmp_path), "gaming".encode().hex())
+
+    # Menghapus index room lama tidak menyentuh index room baru bernama sama
+    cache = TermCache(1000)
+    old_index, new_index = make_index(old, cache=cache), make_index(new, cache=cache)
+    fill(old_index, ["lama", "lama"])
+    fill(new_index, ["baru", "baru"])
+    old_index.destroy()
+    assert len(new_index.search("baru", 10)) == 2
+
+
+def test_term_cache_evicts_least_recently_used(tmp_path):
+    cache = TermCache(3)
+    first, second = make_index(tmp_path / "a", cache=cache), make_index(tmp_path / "b", cache=cache)
+    fill(first, ["satu dua", "tiga"])
+    fill(second, ["empat lima", "enam"])
+    first.search("satu", 1)
+    second.search("empat", 1)
+    assert list(cache.entries) == [second.segments[0].base + ".terms"]
+    assert cache.total == 3
@@ -0,0 +1,44 @@
+import socket
+import sys
+
+import pytest
+
+from compression import LineCodec
+from sessions import Session, SessionTable
+
+
+@pytest.fixture
+def sockets():
+    opened = []
+
+    def new_socket():
+        sock, peer = socket.socketpair()
+        opened.extend((sock, peer))
+        return sock
+
+    yield new_socket
+    for sock in opened:
+        sock.close()
+
+
+def test_session_fits_in_128_bytes(sockets):
+    session = Session(1, sockets(), ("127.0.0.1", 50000), "alice", LineCodec())
+    assert sys.getsizeof(session) <= 128
+    assert not hasattr(session, "__dict__")
+
+
+def test_add_and_remove_keep_lookup_and_snapshot_in_sync(sockets):
+    table = SessionTable()
+    socks = [sockets() for _ in range(3)]
+    alice, bob, carol = (table.add(sock, None, name, LineCodec()) for sock, name in
+                         zip(socks, ("alice", "bob", "carol")))
+    assert table.get(socks[1]) is bob
+    assert list(table) == [alice, bob, carol] and len(table) == 3
+
+    before = table.snapshot
+    assert table.remove(socks[1]) is bob
+    assert table.remove(socks[1]) is None  # Sudah dihapus (mis. oleh reaper)
+    assert table.get(socks[1]) is None
+    assert list(table) == [alice, carol]
+    # Snapshot lama yang sedang diiterasi broadcast tidak ikut berubah
+    assert before == (alice, bob, carol)